@@ -0,0 +1,97 @@
+# benchmarks/bench_aggregation.py
+#
+# Compares the original dict-loop aggregation with the NumPy-backed Aggregator.average_models.
+# Usage (from the project root):
+#   python benchmarks/bench_aggregation.py --features 10000 --models 500
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared_libs.aggregator import Aggregator
+
+
+def loop_average(local_model_params_list):
+    """Reference implementation: the nested-loop averaging Aggregator used before vectorization."""
+    aggregated_coef = {}
+    coef_counts = {}
+    aggregated_intercept = 0.0
+
+    for model_params in local_model_params_list:
+        for key, value in model_params['coef'].items():
+            if key not in aggregated_coef:
+                aggregated_coef[key] = 0.0
+                coef_counts[key] = 0
+            aggregated_coef[key] += value
+            coef_counts[key] += 1
+        aggregated_intercept += model_params['intercept']
+
+    for key in aggregated_coef:
+        aggregated_coef[key] /= coef_counts[key]
+    aggregated_intercept /= len(local_model_params_list)
+    return {'coef': aggregated_coef, 'intercept': aggregated_intercept}
+
+
+def make_models(n_models, n_features, drop_fraction, seed=42):
+    """Builds synthetic local models; each model drops a random `drop_fraction` of the features."""
+    rng = np.random.default_rng(seed)
+    names = [f"feature_{i}" for i in range(n_features)]
+    models = []
+    for _ in range(n_models):
+        values = rng.normal(size=n_features).tolist()
+        if drop_fraction > 0:
+            keep = rng.random(n_features) >= drop_fraction
+            coef = {name: value for name, value, k in zip(names, values, keep) if k}
+        else:
+            coef = dict(zip(names, values))
+        models.append({'coef': coef, 'intercept': float(rng.normal())})
+    return models
+
+
+def best_of(fn, repeats):
+    timings = []
+    result = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark model aggregation.')
+    parser.add_argument('--features', type=int, default=10000)
+    parser.add_argument('--models', type=int, default=500)
+    parser.add_argument('--drop-fraction', type=float, default=0.0,
+                        help='fraction of features each model omits (exercises the masked path)')
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    models = make_models(args.models, args.features, args.drop_fraction)
+    aggregator = Aggregator()
+
+    loop_time, expected = best_of(lambda: loop_average(models), args.repeats)
+    numpy_time, actual = best_of(lambda: aggregator.average_models(models), args.repeats)
+
+    keys_match = list(expected['coef'].keys()) == list(actual['coef'].keys())
+    values_match = np.allclose(list(expected['coef'].values()), list(actual['coef'].values()))
+    intercept_match = np.isclose(expected['intercept'], actual['intercept'])
+
+    print(f"models={args.models} features={args.features} drop_fraction={args.drop_fraction}")
+    print(f"  dict loop : {loop_time * 1000:9.1f} ms")
+    print(f"  numpy     : {numpy_time * 1000:9.1f} ms")
+    print(f"  speedup   : {loop_time / numpy_time:9.1f}x")
+    print(f"  results match: {keys_match and values_match and intercept_match}")
+
+    sample_counts = np.random.default_rng(0).integers(100, 10000, size=args.models)
+    weighted_time, _ = best_of(lambda: aggregator.average_models(models, sample_counts=sample_counts), args.repeats)
+    print(f"  numpy (sample-weighted FedAvg): {weighted_time * 1000:9.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
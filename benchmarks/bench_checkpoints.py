@@ -0,0 +1,80 @@
+# benchmarks/bench_checkpoints.py
+#
+# Measures the versioned CheckpointStore: bytes per round of full and XOR-delta checkpoints against
+# the former one-JSON-file-per-round layout, and how long a restarted Coordinator needs to load the
+# newest round (including a damaged newest checkpoint, which falls back to the previous round).
+# Consecutive models drift by --drift (relative), as global models do late in training.
+# Usage (from the project root):
+#   python benchmarks/bench_checkpoints.py --features 10000 --rounds 50
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared_libs.checkpoint_store import CheckpointStore
+from shared_libs.model_codec import model_hash
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark checkpoint sizes and resume time.')
+    parser.add_argument('--features', type=int, default=10000)
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--full-every', type=int, default=10)
+    parser.add_argument('--drift', type=float, default=1e-3, help='relative change of coefficients per round')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    names = [f"credit_feature_{i}" for i in range(args.features)]
+    coef = rng.normal(size=args.features)
+    directory = tempfile.mkdtemp(prefix="checkpoint-bench-")
+    store = CheckpointStore(directory, full_every=args.full_every)
+
+    json_bytes, write_time, models = 0, 0.0, {}
+    for round_num in range(1, args.rounds + 1):
+        # Late-training drift: most coefficients move a little, some do not move at all
+        coef = coef * (1 + args.drift * rng.normal(size=args.features) * (rng.random(args.features) < 0.5))
+        model = {'coef': dict(zip(names, coef.tolist())), 'intercept': float(round_num)}
+        models[round_num] = model
+        json_bytes += len(json.dumps(model))
+        started = time.perf_counter()
+        store.write(round_num, model, metrics={'test_mse': 1.0 / round_num})
+        write_time += time.perf_counter() - started
+
+    entries = [store.entry(r) for r in store.rounds()]
+    full = [e['size'] for e in entries if e['kind'] == 'full']
+    delta = [e['size'] for e in entries if e['kind'] == 'xor_delta']
+    print(f"\nfeatures={args.features} rounds={args.rounds} full_every={args.full_every} drift={args.drift}")
+    print(f"  JSON per round         : {json_bytes / args.rounds:12,.0f} bytes")
+    print(f"  full checkpoint        : {np.mean(full):12,.0f} bytes")
+    if delta:
+        print(f"  XOR delta checkpoint   : {np.mean(delta):12,.0f} bytes")
+    print(f"  store total            : {sum(full) + sum(delta):12,.0f} bytes "
+          f"({json_bytes / (sum(full) + sum(delta)):.1f}x smaller than JSON)")
+    print(f"  write                  : {write_time / args.rounds * 1000:12.1f} ms/round")
+
+    # A fresh store instance is what a restarted Coordinator sees
+    started = time.perf_counter()
+    round_num, model = CheckpointStore(directory).load_latest()
+    resume_time = time.perf_counter() - started
+    assert round_num == args.rounds and model_hash(model) == model_hash(models[round_num])
+    print(f"  resume (round {round_num:>4})    : {resume_time * 1000:12.1f} ms "
+          f"(chain of {store.entry(round_num)['chain_length'] + 1} files)")
+
+    with open(os.path.join(directory, store.entry(args.rounds)['file']), 'r+b') as f:
+        f.truncate(16)  # Damage the newest checkpoint
+    started = time.perf_counter()
+    round_num, model = CheckpointStore(directory).load_latest()
+    fallback_time = time.perf_counter() - started
+    assert round_num == args.rounds - 1 and model_hash(model) == model_hash(models[round_num])
+    print(f"  resume, newest damaged : {fallback_time * 1000:12.1f} ms (fell back to round {round_num})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+# benchmarks/bench_ingest.py
+#
+# Load test of the Coordinator's ingestion path: --nodes nodes register at once, then all of them
+# submit their update for the same round at once (binary model messages over real HTTP). Runs
+# against the Flask server and the asyncio IngestServer (COORDINATOR_SERVER=asyncio) and reports
+# registration/ack latencies, 503 + Retry-After answers and whether every update was aggregated.
+# The load generator runs in a separate process so it does not share the server's GIL.
+# Usage (from the project root):
+#   python benchmarks/bench_ingest.py --nodes 1000 --features 50
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class AcceptingSession:
+    """Broadcast session stub: every node accepts the global model."""
+    def post(self, url, data=None, headers=None, timeout=None):
+        response = requests.models.Response()
+        response.status_code = 200
+        return response
+
+    def close(self):
+        pass
+
+
+async def _fire(base_url, bodies, content_type):
+    """Posts every body at once; retries 503 answers after their Retry-After. Returns (latencies, statuses, deferred)."""
+    import aiohttp
+    latencies, statuses, deferred = [], [], 0
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=120)) as session:
+        async def post(body):
+            nonlocal deferred
+            started = time.perf_counter()
+            while True:
+                async with session.post(base_url, data=body, headers={'Content-Type': content_type}) as response:
+                    await response.read()
+                    if response.status == 503 and 'Retry-After' in response.headers:
+                        deferred += 1
+                        await asyncio.sleep(float(response.headers['Retry-After']))
+                        continue
+                    latencies.append(time.perf_counter() - started)
+                    statuses.append(response.status)
+                    return
+        await asyncio.gather(*(post(body) for body in bodies))
+    return latencies, statuses, deferred
+
+
+def load_generator(port, n_nodes, n_features, commands, results):
+    """Child process: registers the nodes, then submits one update per node when told to."""
+    import json
+    from shared_libs.model_codec import ModelCodec, MODEL_CONTENT_TYPE
+    base = f"http://127.0.0.1:{port}"
+    registrations = [json.dumps({'node_id': f"node-{i}", 'endpoint_url': f"http://node-{i}:5000",
+                                 'wire_formats': ['binary', 'json']}).encode() for i in range(n_nodes)]
+    results.put(asyncio.run(_fire(f"{base}/register", registrations, 'application/json')))
+
+    round_num = commands.get()
+    codec = ModelCodec()
+    rng = np.random.default_rng(1)
+    features = [f"f{j}" for j in range(n_features)]
+    updates = [codec.encode(features, rng.normal(size=n_features), 0.0,
+                            {'node_id': f"node-{i}", 'round_num': round_num, 'num_samples': 100})
+               for i in range(n_nodes)]
+    results.put(asyncio.run(_fire(f"{base}/submit_model_update", updates, MODEL_CONTENT_TYPE)))
+
+
+def serve(server_kind, coordinator_module, port, max_pending):
+    """Starts the Coordinator's HTTP front end in a background thread."""
+    if server_kind == 'asyncio':
+        from aiohttp import web
+        from coordinator.ingest_server import IngestServer
+        server = IngestServer(coordinator_module.Coordinator.instance, coordinator_module.app, max_pending=max_pending)
+        loop = asyncio.new_event_loop()
+        runner = web.AppRunner(server.make_app())
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, '127.0.0.1', port, backlog=4096).start())
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+    else:
+        from werkzeug.serving import make_server
+        server = make_server('127.0.0.1', port, coordinator_module.app, threaded=True)
+        server.socket.listen(4096)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+def percentile_ms(values, q):
+    return 1000 * float(np.percentile(values, q)) if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test of update ingestion (Flask vs asyncio front end).')
+    parser.add_argument('--nodes', type=int, default=1000)
+    parser.add_argument('--features', type=int, default=50)
+    parser.add_argument('--server', choices=['flask', 'asyncio'], default='asyncio')
+    parser.add_argument('--port', type=int, default=5800)
+    parser.add_argument('--max-pending', type=int, default=2048)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="ingest-bench-")
+    os.environ.update({
+        'UPLOAD_CHECKPOINTS_TO_S3': 'false',
+        'MODEL_SAVE_DIR': os.path.join(work_dir, 'models'),
+        'RESUME_FROM_CHECKPOINT': 'false',
+        'LOCAL_LEDGER_PATH': ':memory:',
+        'INCREMENTAL_AGGREGATION': 'true',
+        'NODE_LEASE_SECONDS': '3600',
+    })
+    from coordinator import coordinator as coordinator_module
+    coordinator = coordinator_module.Coordinator("bench-coordinator", broadcast_session_factory=lambda url: AcceptingSession())
+    coordinator_module.Coordinator.instance = coordinator
+    serve(args.server, coordinator_module, args.port, args.max_pending)
+
+    context = multiprocessing.get_context('spawn')
+    commands, results = context.Queue(), context.Queue()
+    client = context.Process(target=load_generator, args=(args.port, args.nodes, args.features, commands, results))
+    client.start()
+
+    latencies, statuses, deferred = results.get()
+    registered = len(coordinator.central_registry.get_registered_nodes())
+    print(f"\nserver={args.server} nodes={args.nodes} features={args.features}")
+    print(f"  /register burst        : {registered}/{args.nodes} registered, ack p50/p99="
+          f"{percentile_ms(latencies, 50):6.1f}/{percentile_ms(latencies, 99):6.1f} ms, {deferred} deferred (503)")
+
+    coordinator.current_round += 1
+    coordinator.distribute_global_model()
+    commands.put(coordinator.current_round)
+    started = time.perf_counter()
+    latencies, statuses, deferred = results.get()
+    burst = time.perf_counter() - started
+    client.join()
+    accepted = sum(status == 200 for status in statuses)
+    aggregated = coordinator._aggregate_incremental()
+    print(f"  /submit_model_update   : {accepted}/{args.nodes} accepted in {burst:.2f}s, ack p50/p99="
+          f"{percentile_ms(latencies, 50):6.1f}/{percentile_ms(latencies, 99):6.1f} ms, {deferred} deferred (503), "
+          f"aggregated={len(coordinator._round_slots)} updates, model={'ok' if aggregated else 'missing'}")
+    if args.server == 'asyncio':
+        from coordinator.ingest_server import INGEST_ACK_SECONDS
+        count, total = INGEST_ACK_SECONDS.snapshot(route='submit_model_update')
+        print(f"  server-side ack mean   : {1000 * total / max(count, 1):6.1f} ms (read + decode + aggregate)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# benchmarks/bench_ledger.py
+#
+# Measures ledger throughput on the SQLite stand-in ledger: inline RecordHash per round versus the
+# batching LedgerWriter. The stand-in sleeps --commit-latency seconds per transaction to emulate a
+# Fabric endorsement + commit round trip.
+# Usage (from the project root):
+#   python benchmarks/bench_ledger.py --records 200 --commit-latency 0.05
+
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared_libs.blockchain_sdk import BlockchainClientSDK, LedgerWriter
+
+
+def make_hash(round_num):
+    return hashlib.sha256(f"model-{round_num}".encode()).hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ledger writes.')
+    parser.add_argument('--records', type=int, default=200)
+    parser.add_argument('--commit-latency', type=float, default=0.05)
+    parser.add_argument('--max-batch-size', type=int, default=32)
+    args = parser.parse_args()
+
+    config = {'local_ledger_path': ':memory:', 'local_ledger_commit_latency': args.commit_latency}
+
+    inline_client = BlockchainClientSDK(client_id="bench-inline", config=config)
+    started = time.perf_counter()
+    for round_num in range(1, args.records + 1):
+        inline_client.record_aggregation_hash(round_num, make_hash(round_num), "bench")
+    inline_time = time.perf_counter() - started
+
+    batched_client = BlockchainClientSDK(client_id="bench-batched", config=config)
+    writer = LedgerWriter(batched_client, max_batch_size=args.max_batch_size)
+    started = time.perf_counter()
+    submit_times = []
+    for round_num in range(1, args.records + 1):
+        submit_started = time.perf_counter()
+        writer.submit(round_num, make_hash(round_num), "bench")
+        submit_times.append(time.perf_counter() - submit_started)
+    writer.flush()
+    batched_time = time.perf_counter() - started
+    stats = writer.stats()
+    writer.close()
+
+    print(f"\nrecords={args.records} commit_latency={args.commit_latency}s")
+    print(f"  inline RecordHash : {inline_time:8.2f}s  {args.records / inline_time:10.1f} records/s  "
+          f"{inline_client.ledger.transaction_count()} transactions")
+    print(f"  LedgerWriter      : {batched_time:8.2f}s  {args.records / batched_time:10.1f} records/s  "
+          f"{batched_client.ledger.transaction_count()} transactions")
+    print(f"  round thread blocked per record: inline {inline_time / args.records * 1000:.2f} ms, "
+          f"batched {max(submit_times) * 1000:.3f} ms (max)")
+    print(f"  commit latency p50={stats['commit_latency_p50_seconds']:.3f}s p99={stats['commit_latency_p99_seconds']:.3f}s")
+
+
+if __name__ == '__main__':
+    main()
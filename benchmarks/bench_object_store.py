@@ -0,0 +1,87 @@
+# benchmarks/bench_object_store.py
+#
+# Measures object downloads through the LocalObjectStore stand-in over the data/ Parquet files:
+# one GET of the whole object (the former get_object().read() path) against parallel ranged GETs,
+# to a file and into a buffer. The stand-in emulates S3 with --latency seconds per request and
+# --bandwidth MB/s per connection. A last phase injects failures into some ranges to check that
+# only those ranges are retried and the result is intact.
+# Usage (from the project root):
+#   python benchmarks/bench_object_store.py --key flag1_node0_risk.parquet --chunk-kb 128 --workers 8
+
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared_libs.object_store import LocalObjectStore, CHUNK_RETRIES_TOTAL
+
+
+class FlakyObjectStore(LocalObjectStore):
+    """Fails the first attempt of every `fail_every`-th range, like a dropped S3 connection."""
+    def __init__(self, root, fail_every=3, **kwargs):
+        super().__init__(root, **kwargs)
+        self.fail_every = fail_every
+        self._failed = set()
+
+    def _read_range(self, key, start, out, etag):
+        index = start // self.chunk_size
+        if index % self.fail_every == 0 and index not in self._failed:
+            self._failed.add(index)
+            raise ConnectionResetError("injected failure")
+        return super()._read_range(key, start, out, etag)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark parallel ranged object downloads.')
+    parser.add_argument('--root', default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data'))
+    parser.add_argument('--key', default='flag1_node0_risk.parquet')
+    parser.add_argument('--chunk-kb', type=int, default=128)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.02, help='seconds per request')
+    parser.add_argument('--bandwidth', type=float, default=10.0, help='MB/s per connection')
+    args = parser.parse_args()
+
+    emulation = dict(request_latency=args.latency, stream_bandwidth=args.bandwidth * 1024 * 1024)
+    with open(os.path.join(args.root, args.key), 'rb') as f:
+        expected = hashlib.sha256(f.read()).hexdigest()
+    size = os.path.getsize(os.path.join(args.root, args.key))
+    work_dir = tempfile.mkdtemp(prefix="object-store-bench-")
+    print(f"\nobject={args.key} ({size / 1024 / 1024:.2f} MiB) latency={args.latency}s bandwidth={args.bandwidth} MB/s/connection")
+
+    single = LocalObjectStore(args.root, chunk_size=max(size, 1), max_workers=1, **emulation)
+    parallel = LocalObjectStore(args.root, chunk_size=args.chunk_kb * 1024, max_workers=args.workers, **emulation)
+    for name, store in (("single GET", single), (f"{args.workers} x {args.chunk_kb} KiB ranges", parallel)):
+        path = os.path.join(work_dir, "object.parquet")
+        started = time.perf_counter()
+        store.download_to_file(args.key, path)
+        to_file = time.perf_counter() - started
+        with open(path, 'rb') as f:
+            assert hashlib.sha256(f.read()).hexdigest() == expected, "file download differs from the source"
+
+        started = time.perf_counter()
+        data, _ = store.read_bytes(args.key)
+        rows = pq.read_table(pa.py_buffer(data)).num_rows  # Arrow reads the buffer in place
+        to_buffer = time.perf_counter() - started
+        assert hashlib.sha256(data).hexdigest() == expected, "buffer download differs from the source"
+        print(f"  {name:<24}: to file {size / to_file / 1024 / 1024:7.1f} MiB/s   "
+              f"to buffer + parse {to_buffer:6.3f}s ({rows} rows)")
+        store.close()
+
+    flaky = FlakyObjectStore(args.root, chunk_size=args.chunk_kb * 1024, max_workers=args.workers, retry_backoff=0.01)
+    retries_before = CHUNK_RETRIES_TOTAL.value(store="local")
+    data, _ = flaky.read_bytes(args.key)
+    assert hashlib.sha256(data).hexdigest() == expected, "download with retried ranges differs from the source"
+    print(f"  injected failures       : {len(flaky._failed)} ranges failed once, "
+          f"{CHUNK_RETRIES_TOTAL.value(store='local') - retries_before:.0f} range retries, result intact")
+    flaky.close()
+
+
+if __name__ == '__main__':
+    main()
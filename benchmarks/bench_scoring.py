@@ -0,0 +1,134 @@
+# benchmarks/bench_scoring.py
+#
+# Measures scoring throughput of the batch credit-scoring service on one core: the compiled
+# dot-product kernel alone, and full /score requests (JSON rows, columnar JSON, Arrow stream)
+# through the Flask app. A last phase writes new checkpoints while a client keeps scoring, to check
+# that hot swaps drop no requests and never mix two models within a response.
+# Usage (from the project root):
+#   python benchmarks/bench_scoring.py --features 200 --rows 10000
+
+import os
+
+# Per-core figures: keep NumPy's BLAS single-threaded (must be set before NumPy is imported)
+for _var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ.setdefault(_var, '1')
+
+import argparse
+import json
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pyarrow as pa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared_libs.checkpoint_store import CheckpointStore
+from shared_libs.model_scorer import CompiledModel
+from scoring import scoring_app
+from scoring.scoring_app import ScoringService, ARROW_CONTENT_TYPE
+
+
+def best_of(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def arrow_body(X, columns):
+    table = pa.table({name: X[:, i] for i, name in enumerate(columns)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the batch scoring service.')
+    parser.add_argument('--features', type=int, default=200)
+    parser.add_argument('--rows', type=int, default=10000, help='rows per batch request')
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--swap-seconds', type=float, default=2.0, help='duration of the hot-swap phase')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    columns = [f"credit_feature_{i}" for i in range(args.features)]
+    model = {'coef': dict(zip(columns, rng.normal(size=args.features).tolist())), 'intercept': 0.5}
+    X = rng.normal(size=(args.rows, args.features))
+
+    model_dir = tempfile.mkdtemp(prefix="scoring-bench-")
+    checkpoint_store = CheckpointStore(model_dir)  # Written like the Coordinator's CheckpointPersister does
+    checkpoint_store.write(1, model)
+    ScoringService.instance = ScoringService(model_dir, reload_interval=0.05)
+    client = scoring_app.app.test_client()
+
+    compiled = CompiledModel(model, version=1)
+    reference = X @ compiled.coef + compiled.intercept
+    shuffled = list(reversed(columns))  # Request column order differs from the model's
+    X_shuffled = np.ascontiguousarray(X[:, ::-1])
+    X32 = X_shuffled.astype(np.float32)
+
+    print(f"\nfeatures={args.features} rows/batch={args.rows} (single BLAS thread)")
+    kernel = best_of(lambda: compiled.score_matrix(X_shuffled, shuffled), args.repeats)
+    kernel32 = best_of(lambda: compiled.score_matrix(X32, shuffled), args.repeats)
+    print(f"  kernel float64         : {args.rows / kernel:14,.0f} rows/s")
+    print(f"  kernel float32         : {args.rows / kernel32:14,.0f} rows/s")
+
+    arrow = arrow_body(X_shuffled, shuffled)
+    columnar = json.dumps({'columns': shuffled, 'data': X_shuffled.tolist()})
+    row_count = min(args.rows, 2000)
+    rows = json.dumps({'rows': [dict(zip(shuffled, row)) for row in X_shuffled[:row_count].tolist()]})
+
+    response = client.post('/score', data=arrow, headers={'Content-Type': ARROW_CONTENT_TYPE})
+    scores = pa.ipc.open_stream(response.data).read_all().column('score').to_numpy()
+    assert np.allclose(scores, reference), "Arrow scores differ from the reference"
+    assert np.allclose(client.post('/score', data=rows, content_type='application/json').get_json()['scores'],
+                       reference[:row_count]), "JSON row scores differ from the reference"
+
+    for name, body, content_type, n in (
+            ("/score Arrow stream", arrow, ARROW_CONTENT_TYPE, args.rows),
+            ("/score JSON columnar", columnar, 'application/json', args.rows),
+            ("/score JSON rows", rows, 'application/json', row_count)):
+        elapsed = best_of(lambda: client.post('/score', data=body, headers={'Content-Type': content_type}), args.repeats)
+        print(f"  {name:<23}: {n / elapsed:14,.0f} rows/s  ({len(body) / n:.0f} request bytes/row)")
+
+    # Hot swap: publish a new checkpoint every 50 ms while one client keeps scoring single rows
+    failures, rounds_seen, stop = [], [], threading.Event()
+    single = json.dumps({'row': dict(zip(columns, X[0].tolist()))})
+
+    def score_continuously():
+        while not stop.is_set():
+            response = client.post('/score', data=single, content_type='application/json')
+            if response.status_code != 200:
+                failures.append(response.status_code)
+                continue
+            body = response.get_json()
+            # Round r serves the model scaled by r, so a score mixing two models would not match
+            if not np.isclose(body['scores'][0], reference[0] * body['model_round']):
+                failures.append('mixed')
+            rounds_seen.append(body['model_round'])
+
+    scorer = threading.Thread(target=score_continuously)
+    scorer.start()
+    round_num, deadline = 1, time.monotonic() + args.swap_seconds
+    while time.monotonic() < deadline:
+        round_num += 1
+        scaled = {'coef': {f: v * round_num for f, v in model['coef'].items()}, 'intercept': model['intercept'] * round_num}
+        checkpoint_store.write(round_num, scaled)
+        time.sleep(0.05)
+    time.sleep(0.2)
+    stop.set()
+    scorer.join()
+    ScoringService.instance.model_store.close()
+    print(f"  hot swap: {round_num - 1} checkpoints published, {len(rounds_seen)} requests, "
+          f"{len(set(rounds_seen))} model rounds served, {len(failures)} failed or inconsistent, "
+          f"rounds monotonic={rounds_seen == sorted(rounds_seen)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# benchmarks/bench_training.py
+#
+# Measures per-round local training wall time of the single-process LocalTrainer against the
+# ParallelTrainer (data shards in a process pool over a shared memory-mapped matrix) for several
+# worker counts, and the test MSE of the resulting models.
+# Usage (from the project root):
+#   python benchmarks/bench_training.py --rows 1000000 --features 100 --workers 2,4,8,16
+#   python benchmarks/bench_training.py --data data/flag1_node0_risk.parquet --workers 4,16
+
+import os
+
+# One BLAS thread per process, so the worker count is the core count
+for _var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+    os.environ.setdefault(_var, '1')
+
+import argparse
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared_libs.local_trainer import LocalTrainer
+from shared_libs.parallel_trainer import ParallelTrainer
+
+
+def load_matrix(args, work_dir):
+    """Returns (X, y) as read-only memory maps, like the node's .npy data cache."""
+    if args.data:
+        df = pd.read_parquet(args.data)
+        X = df.drop(columns=[args.target_column]).to_numpy(dtype=np.float32)
+        y = df[args.target_column].to_numpy(dtype=np.float64)
+    else:
+        rng = np.random.default_rng(42)
+        X = rng.normal(size=(args.rows, args.features)).astype(np.float32)
+        y = X @ rng.normal(size=args.features) + rng.normal(scale=0.1, size=args.rows)
+    np.save(os.path.join(work_dir, "X.npy"), X)
+    np.save(os.path.join(work_dir, "y.npy"), y)
+    return (np.load(os.path.join(work_dir, "X.npy"), mmap_mode='r'),
+            np.load(os.path.join(work_dir, "y.npy"), mmap_mode='r'))
+
+
+def run_rounds(trainer, X, y, rounds):
+    """Trains `rounds` rounds (each starting from the last), returns (best round seconds, coef, intercept)."""
+    coef, intercept, timings = np.zeros(X.shape[1]), 0.0, []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        coef, intercept = trainer.train(X, y, coef, intercept)
+        timings.append(time.perf_counter() - started)
+    return min(timings), coef, intercept
+
+
+def mse(X, y, coef, intercept):
+    return float(np.nanmean((np.asarray(X, dtype=np.float64) @ coef + intercept - y) ** 2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark single-process vs sharded parallel local training.')
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--features', type=int, default=100)
+    parser.add_argument('--data', help='Parquet dataset (e.g. combined_risk.parquet) instead of synthetic data')
+    parser.add_argument('--target-column', default='Target')
+    parser.add_argument('--workers', default='2,4', help='comma-separated worker counts')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--learning-rate', type=float, default=0.001)
+    parser.add_argument('--batch-size', type=int, default=4096)
+    args = parser.parse_args()
+
+    X, y = load_matrix(args, tempfile.mkdtemp(prefix="training-bench-"))
+    print(f"\nrows={len(y)} features={X.shape[1]} cores={os.cpu_count()}")
+
+    single, coef, intercept = run_rounds(
+        LocalTrainer(learning_rate=args.learning_rate, batch_size=args.batch_size), X, y, args.rounds)
+    print(f"  LocalTrainer           : {single:8.3f} s/round  mse={mse(X, y, coef, intercept):.5g}")
+
+    for workers in [int(w) for w in args.workers.split(',')]:
+        trainer = ParallelTrainer(num_workers=workers, learning_rate=args.learning_rate, batch_size=args.batch_size)
+        try:
+            trainer.train(X, y, np.zeros(X.shape[1]), 0.0)  # Starts the pool and maps the data
+            seconds, coef, intercept = run_rounds(trainer, X, y, args.rounds)
+        finally:
+            trainer.close()
+        print(f"  ParallelTrainer x{workers:<4} : {seconds:8.3f} s/round  speedup={single / seconds:5.2f}x  "
+              f"mse={mse(X, y, coef, intercept):.5g}")
+
+
+if __name__ == '__main__':
+    main()
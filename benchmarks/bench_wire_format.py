@@ -0,0 +1,66 @@
+# benchmarks/bench_wire_format.py
+#
+# Compares payload size and encode/decode time of the JSON model messages with the binary ModelCodec.
+# Usage (from the project root):
+#   python benchmarks/bench_wire_format.py --features 10000
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared_libs.model_codec import ModelCodec, zstandard
+
+
+def best_of(fn, repeats):
+    timings = []
+    result = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark model wire formats.')
+    parser.add_argument('--features', type=int, default=10000)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    model = {
+        'coef': {f"credit_feature_{i}": float(v) for i, v in enumerate(rng.normal(size=args.features))},
+        'intercept': 0.5
+    }
+    metadata = {'node_id': 'risk', 'round_num': 3, 'num_samples': 50000}
+
+    json_encode_time, json_body = best_of(
+        lambda: json.dumps(dict(metadata, local_model=model)).encode('utf-8'), args.repeats)
+    json_decode_time, _ = best_of(lambda: json.loads(json_body), args.repeats)
+    print(f"features={args.features}")
+    print(f"  {'format':<34}{'bytes':>12}{'encode ms':>12}{'decode ms':>12}")
+    print(f"  {'json':<34}{len(json_body):>12}{json_encode_time * 1000:>12.2f}{json_decode_time * 1000:>12.2f}")
+
+    variants = [('float64', None), ('float32', None), ('float32', 'gzip')]
+    if zstandard is not None:
+        variants.append(('float32', 'zstd'))
+    for dtype, compression in variants:
+        for include_schema in (True, False):
+            sender = ModelCodec(dtype=dtype, compression=compression)
+            receiver = ModelCodec(dtype=dtype, compression=compression)
+            receiver.register_schema(model['coef'].keys())
+            encode_time, body = best_of(
+                lambda: sender.encode_model(model, metadata, include_schema=include_schema), args.repeats)
+            decode_time, _ = best_of(lambda: receiver.decode(body), args.repeats)
+            label = f"binary {dtype} {compression or 'raw'} {'+names' if include_schema else 'hash-only'}"
+            print(f"  {label:<34}{len(body):>12}{encode_time * 1000:>12.2f}{decode_time * 1000:>12.2f}")
+
+
+if __name__ == '__main__':
+    main()
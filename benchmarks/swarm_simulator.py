@@ -0,0 +1,491 @@
+# benchmarks/swarm_simulator.py
+#
+# In-process swarm simulator: runs the real Coordinator (registry, broadcaster, scheduler, Aggregator,
+# ledger writer, checkpoint persister) and N SwarmNode instances in one process. HTTP between them is
+# replaced by loopback sessions that call the Coordinator's Flask routes through the test client and
+# the nodes' accept_model_update() directly, so encoding, decoding, training and aggregation all run
+# the production code paths. S3 is replaced by local files and the blockchain by the SQLite ledger.
+#
+# Reports rounds/sec, round duration p50/p99, update submission latency p50/p99, aggregation time and
+# peak memory for every (nodes, features) combination.
+# Usage (from the project root):
+#   python benchmarks/swarm_simulator.py --nodes 2,10,100 --features 10,1000 --rounds 5
+#   python benchmarks/swarm_simulator.py --nodes 1000 --features 10000 --rows 32 --incremental --json out.json
+#   python benchmarks/swarm_simulator.py --nodes 200 --features 1000 --relays 8 --incremental
+#   python benchmarks/swarm_simulator.py --nodes 20 --features 1000 --compute-delay-max 0.5 --rounds 5 \
+#       --federation-mode async --async-buffer-size 5    # 5 rounds x 20 updates = 20 versions x 5 updates
+#   python benchmarks/swarm_simulator.py --data data/flag1_node0_risk.parquet --test-data data/test.parquet \
+#       --target-column target --nodes 2,50
+#   python benchmarks/swarm_simulator.py --nodes 10 --features 100 --rounds 50 --stop-when-converged \
+#       --target-loss 0.05 --adaptive    # rounds and training samples needed to reach the target MSE
+#   python benchmarks/swarm_simulator.py --nodes 20 --features 1000 --rounds 3 --profile-rounds 1 \
+#       --profile-dir /tmp/profiles      # cProfile + tracemalloc files of the first round per phase
+#   python benchmarks/swarm_simulator.py --nodes 10 --features 100 --rounds 20 \
+#       --jobs '[{"job_id": "lr-high", "learning_rate": 0.004}, {"job_id": "half", "features": ["feature_0", "feature_1"]}]'
+#                                        # training jobs next to the default one, over the same nodes and data
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shared_libs.data_cache import CachedDataset, LocalDataCache
+from shared_libs.metrics import METRICS
+from shared_libs.profiler import wait_for_writes
+from swarm_node import swarm_node_app
+from coordinator import coordinator as coordinator_module
+from relay.relay_app import SubAggregator
+from swarm_node.swarm_node_app import SwarmNode
+
+
+def _make_response(url, status_code, body, content_type="application/json"):
+    """Builds a real requests.Response so callers can use .ok, .json() and raise_for_status()."""
+    response = requests.models.Response()
+    response.url = url
+    response.status_code = status_code
+    response._content = body
+    response.headers["Content-Type"] = content_type
+    return response
+
+
+class CoordinatorLoopback:
+    """Session-like object that sends node requests to the Coordinator's Flask routes in-process."""
+    def __init__(self, flask_app):
+        self._client = flask_app.test_client(use_cookies=False)
+        self._lock = threading.Lock()
+        self.round_started_at = time.monotonic()
+        self.submit_latencies = []  # Seconds spent by the Coordinator handling each /submit_model_update
+        self.arrival_times = []  # Seconds after the round start at which each update was accepted
+        self.upload_messages = 0  # Update and partial-aggregate requests handled by the Coordinator
+
+    def post(self, url, json=None, data=None, headers=None, timeout=None):
+        path = urlsplit(url).path
+        started = time.monotonic()
+        result = self._client.post(path, json=json, data=data, headers=headers)
+        finished = time.monotonic()
+        if path in ("/submit_model_update", "/submit_partial_aggregate"):
+            with self._lock:
+                self.upload_messages += 1
+        if path == "/submit_model_update" and result.status_code == 200:
+            self.record_submit(started, finished)
+        return _make_response(url, result.status_code, result.get_data(), result.mimetype)
+
+    def get(self, url, params=None, timeout=None):
+        result = self._client.get(urlsplit(url).path, query_string=params)
+        return _make_response(url, result.status_code, result.get_data(), result.mimetype)
+
+    def record_submit(self, started, finished):
+        with self._lock:
+            self.submit_latencies.append(finished - started)
+            self.arrival_times.append(finished - self.round_started_at)
+
+    def start_round(self):
+        with self._lock:
+            self.round_started_at = time.monotonic()
+
+    def close(self):
+        pass
+
+
+class NodeLoopback:
+    """Session-like object the Coordinator's ModelBroadcaster uses to deliver models to one simulated node."""
+    def __init__(self, node, on_model):
+        self.node = node
+        self.on_model = on_model  # Called after the node accepted a global model
+
+    def post(self, url, data=None, headers=None, timeout=None):
+        payload, status_code = self.node.accept_model_update((headers or {}).get("Content-Type"), data)
+        if status_code == 200:
+            self.on_model(self.node)
+        return _make_response(url, status_code, json.dumps(payload).encode("utf-8"))
+
+    def close(self):
+        pass
+
+
+class NodeSession:
+    """Session-like object for one node: submissions to a relay go to that in-process SubAggregator, the rest to the Coordinator."""
+    def __init__(self, coordinator_session, relays_by_url):
+        self.coordinator_session = coordinator_session
+        self.relays_by_url = relays_by_url
+
+    def post(self, url, data=None, headers=None, timeout=None, **kwargs):
+        parts = urlsplit(url)
+        relay = self.relays_by_url.get(f"{parts.scheme}://{parts.netloc}")
+        if relay is None:
+            return self.coordinator_session.post(url, data=data, headers=headers, timeout=timeout, **kwargs)
+        started = time.monotonic()
+        payload, status_code = relay.accept_node_update((headers or {}).get("Content-Type"), data)
+        if status_code == 200:
+            self.coordinator_session.record_submit(started, time.monotonic())
+        return _make_response(url, status_code, json.dumps(payload).encode("utf-8"))
+
+    def get(self, url, **kwargs):
+        return self.coordinator_session.get(url, **kwargs)
+
+    def close(self):
+        pass
+
+
+class SimulatedNode(SwarmNode):
+    """SwarmNode whose local data is handed in instead of being loaded from S3."""
+    def __init__(self, node_id, coordinator_endpoint, dataset, compute_delay=0.0):
+        self._dataset = dataset
+        self.compute_delay = compute_delay  # Extra seconds per training run, to simulate slower hardware
+        super().__init__(node_id, coordinator_endpoint)
+        self.endpoint_url = f"sim://{node_id}"
+
+    def _train_local_model(self, model_params=None, round_num=None, job_id=swarm_node_app.DEFAULT_JOB):
+        if self.compute_delay:
+            time.sleep(self.compute_delay)
+        return super()._train_local_model(model_params, round_num, job_id)
+
+    def _load_local_data(self):
+        self.X = self._dataset.X
+        self.y = self._dataset.y
+        self.feature_set = list(self._dataset.feature_names)
+        self.num_samples = len(self.y)
+
+    def run_round(self):
+        """One pass of run_node_lifecycle: train and submit the received model(s), one job at a time."""
+        self._new_model_event.clear()
+        self.run_scheduled_rounds()
+
+
+def synthetic_datasets(n_nodes, n_features, rows_per_node, seed=42):
+    """
+    Per-node datasets of a shared synthetic linear problem. Nodes are views into one pool of
+    at most 16 distinct shards, so 1000 nodes x 10k features does not need 1000 copies of the data.
+    """
+    rng = np.random.default_rng(seed)
+    feature_names = [f"feature_{i}" for i in range(n_features)]
+    true_coef = rng.normal(size=n_features).astype(np.float32)
+    n_shards = min(n_nodes, 16)
+    X = rng.normal(size=(n_shards * rows_per_node, n_features)).astype(np.float32)
+    y = X.astype(np.float64) @ true_coef + rng.normal(scale=0.1, size=len(X))
+    shards = [CachedDataset(feature_names, X[i * rows_per_node:(i + 1) * rows_per_node],
+                            y[i * rows_per_node:(i + 1) * rows_per_node]) for i in range(n_shards)]
+    test_X = rng.normal(size=(max(rows_per_node, 256), n_features)).astype(np.float32)
+    test_df = pd.DataFrame(test_X, columns=feature_names)
+    test_df['Target'] = test_X.astype(np.float64) @ true_coef
+    return [shards[i % n_shards] for i in range(n_nodes)], test_df
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def run_simulation(n_nodes, n_features, args, work_dir):
+    """
+    Runs `args.rounds` rounds with `n_nodes` simulated nodes (fewer with --stop-when-converged)
+    and returns the measurements.
+    """
+    if args.data:
+        cache = LocalDataCache(os.path.join(work_dir, "cache"))
+        path, version = cache.fetch(None, local_path=args.data)
+        dataset = cache.load_feature_matrix(path, version, args.target_column)
+        datasets = [dataset] * n_nodes
+        n_features = len(dataset.feature_names)
+        os.environ['TEST_DATA_PATH'] = args.test_data or args.data
+        os.environ['TARGET_COLUMN'] = args.target_column
+    else:
+        datasets, test_df = synthetic_datasets(n_nodes, n_features, args.rows)
+        test_path = os.path.join(work_dir, f"test_{n_features}.parquet")
+        if not os.path.exists(test_path):
+            test_df.to_parquet(test_path)
+        os.environ['TEST_DATA_PATH'] = test_path
+        os.environ['TARGET_COLUMN'] = 'Target'
+
+    # Constant-step SGD diverges once eta * ||x||^2 > 2; scale the default step with the feature width
+    os.environ['LEARNING_RATE'] = str(args.learning_rate or 0.5 / n_features)
+
+    nodes_by_url = {}
+    relays_by_url = {}
+    node_pool = ThreadPoolExecutor(max_workers=args.node_workers, thread_name_prefix="sim-node")
+
+    def on_model(node):
+        node_pool.submit(node.run_round)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    def broadcast_session(url):
+        if url in relays_by_url:
+            return NodeLoopback(relays_by_url[url], lambda relay: None)
+        return NodeLoopback(nodes_by_url[url], on_model)
+
+    coordinator = coordinator_module.Coordinator("sim-coordinator", broadcast_session_factory=broadcast_session)
+    coordinator_module.Coordinator.instance = coordinator
+    coordinator_session = CoordinatorLoopback(coordinator_module.app)
+
+    # Relays register first so every node is assigned to a group at registration
+    relays = []
+    for i in range(args.relays):
+        relay = SubAggregator(f"sim-relay-{i}", "http://sim-coordinator")
+        relay.endpoint_url = f"sim://sim-relay-{i}"
+        relay.http = coordinator_session
+        relays_by_url[relay.endpoint_url] = relay
+        relays.append(relay)
+        relay._register_with_coordinator()
+
+    for i in range(n_nodes):
+        # Heterogeneous swarm: delays spread quadratically, so most nodes are fast and a few straggle
+        compute_delay = args.compute_delay_max * (i / (n_nodes - 1)) ** 2 if n_nodes > 1 else 0.0
+        node = SimulatedNode(f"sim-node-{i}", "http://sim-coordinator", datasets[i], compute_delay)
+        node.http = NodeSession(coordinator_session, relays_by_url) if relays else coordinator_session
+        nodes_by_url[node.endpoint_url] = node
+        node._register_with_coordinator()
+
+    round_durations, aggregation_times, distribution_times = [], [], []
+    submit_latencies, arrival_times = [], []
+    upload_bytes_after_first = first_round_updates = 0
+    started = time.monotonic()
+    if args.federation_mode == 'async':
+        # No rounds: every node trains continuously; "rounds" are the published model versions
+        stop_event = threading.Event()
+        node_threads = [threading.Thread(target=swarm_node_app.run_async_node_loop, args=(node, stop_event), daemon=True)
+                        for node in nodes_by_url.values()]
+        for thread in node_threads:
+            thread.start()
+        version_started = time.monotonic()
+        for _ in range(args.rounds):
+            coordinator.run_async_training(1)
+            round_durations.append(time.monotonic() - version_started)
+            aggregation_times.append(coordinator.last_round_timings['aggregate'])
+            version_started = time.monotonic()
+        elapsed = time.monotonic() - started
+        stop_event.set()
+        for thread in node_threads:
+            thread.join()
+        submit_latencies, arrival_times = coordinator_session.submit_latencies, coordinator_session.arrival_times
+    else:
+        # Extra training jobs run their rounds in their own threads, concurrently with the default job
+        def run_job(job):
+            for _ in range(args.rounds):
+                if args.stop_when_converged and job.training_controller.should_stop(job.current_round):
+                    break
+                job.run_swarm_learning_round()
+        jobs = [coordinator.add_job(spec['job_id'], {k: v for k, v in spec.items() if k != 'job_id'})
+                for spec in args.jobs]
+        job_threads = [threading.Thread(target=run_job, args=(job,), daemon=True) for job in jobs]
+        for thread in job_threads:
+            thread.start()
+        for round_index in range(args.rounds):
+            if args.stop_when_converged and coordinator.training_controller.should_stop(coordinator.current_round):
+                break
+            coordinator_session.start_round()
+            coordinator.run_swarm_learning_round()
+            timings = coordinator.last_round_timings
+            round_durations.append(timings.get('total', timings['distribute'] + timings['wait']))
+            aggregation_times.append(timings.get('aggregate', 0.0))
+            distribution_times.append(timings['distribute'])
+            with coordinator_session._lock:
+                submit_latencies.extend(coordinator_session.submit_latencies)
+                arrival_times.extend(coordinator_session.arrival_times)
+                coordinator_session.submit_latencies = []
+                coordinator_session.arrival_times = []
+            if round_index == 0:
+                # The first round also carries feature names; steady-state upload size is measured after it
+                upload_bytes_after_first = swarm_node_app.PAYLOAD_BYTES_TOTAL.value(direction='sent')
+                first_round_updates = len(submit_latencies)
+        for thread in job_threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+    rounds_run = len(round_durations)
+    upload_messages = coordinator_session.upload_messages
+    upload_bytes = swarm_node_app.PAYLOAD_BYTES_TOTAL.value(direction='sent') - upload_bytes_after_first
+    steady_updates = len(submit_latencies) - first_round_updates
+
+    node_pool.shutdown(wait=True)
+    coordinator.ledger_writer.close()
+    jobs = {}
+    for job_id, job in coordinator.jobs.items():
+        job.checkpoint_persister.close()
+        if job_id != coordinator.job_id:
+            jobs[job_id] = dict(job.job_status(), final_test_mse=job.aggregator.last_test_mse)
+    coordinator.model_broadcaster.close()
+    for relay in relays:
+        relay.flush()
+    traced_peak = None
+    if args.tracemalloc:
+        traced_peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+
+    return {
+        "nodes": n_nodes,
+        "relays": args.relays,
+        "federation_mode": args.federation_mode,
+        "features": n_features,
+        "rounds": rounds_run,
+        "rounds_per_sec": rounds_run / elapsed if elapsed > 0 else 0.0,
+        "round_p50_seconds": _percentile(round_durations, 50),
+        "round_p99_seconds": _percentile(round_durations, 99),
+        "distribute_p50_seconds": _percentile(distribution_times, 50) if distribution_times else None,
+        "submit_p50_seconds": _percentile(submit_latencies, 50),
+        "submit_p99_seconds": _percentile(submit_latencies, 99),
+        "arrival_p50_seconds": _percentile(arrival_times, 50),
+        "arrival_p99_seconds": _percentile(arrival_times, 99),
+        "aggregate_p50_seconds": _percentile(aggregation_times, 50),
+        "aggregate_max_seconds": max(aggregation_times) if aggregation_times else 0.0,
+        "updates": len(submit_latencies),
+        "updates_per_sec": len(submit_latencies) / elapsed if elapsed > 0 else 0.0,
+        "coordinator_upload_messages_per_round": upload_messages / rounds_run if rounds_run else 0.0,
+        "upload_bytes_per_update": upload_bytes / steady_updates if steady_updates else 0.0,
+        "final_test_mse": coordinator.aggregator.last_test_mse,
+        # Nodes' held-out MSE of the last global model they were sent (the second-to-last round's)
+        "federated_eval_mse": (coordinator.last_federated_evaluation or {}).get('mse'),
+        "stop_reason": coordinator.training_controller.stop_reason,
+        "training_samples": coordinator.training_controller.cumulative_samples,
+        # (round, cumulative training samples) at which the target loss was first reached
+        "to_target": (coordinator.training_controller.compute_to_reach(args.target_loss)
+                      if args.target_loss is not None else None),
+        "jobs": jobs,  # Status of the --jobs training jobs
+        "traced_peak_mib": traced_peak,
+        # ru_maxrss is in KiB on Linux; it is the process peak so far, so it only grows across runs
+        "process_peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def _int_list(text):
+    return [int(v) for v in text.split(',') if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='In-process swarm simulator and round-throughput benchmark.')
+    parser.add_argument('--nodes', type=_int_list, default=[2, 10, 100], help='comma-separated node counts')
+    parser.add_argument('--features', type=_int_list, default=[10, 1000], help='comma-separated feature widths')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=256, help='synthetic training rows per node')
+    parser.add_argument('--data', help='Parquet file used as every node\'s dataset instead of synthetic data')
+    parser.add_argument('--test-data', help='Parquet test set for --data (defaults to --data)')
+    parser.add_argument('--target-column', default='Target')
+    parser.add_argument('--learning-rate', type=float, help='node SGD step (default 0.5 / features)')
+    parser.add_argument('--node-workers', type=int, default=8, help='threads running node training/submission')
+    parser.add_argument('--incremental', action='store_true', help='INCREMENTAL_AGGREGATION=true')
+    parser.add_argument('--wire-dtype', default='float64')
+    parser.add_argument('--update-mode', choices=['full', 'delta'], default='full')
+    parser.add_argument('--delta-quantization', choices=['float16', 'int8'], help='quantization of delta updates')
+    parser.add_argument('--delta-top-k', type=float, help='fraction of delta entries sent per round (top-k)')
+    parser.add_argument('--no-error-feedback', action='store_true', help='drop the compression residual')
+    parser.add_argument('--relays', type=int, default=0, help='in-process relay sub-aggregators (hierarchical aggregation)')
+    parser.add_argument('--relay-flush-interval', type=float, default=0.5, help='RELAY_FLUSH_INTERVAL of the relays')
+    parser.add_argument('--federation-mode', choices=['sync', 'async'], default='sync',
+                        help='async: FedBuff-style buffered updates, --rounds counts published versions')
+    parser.add_argument('--async-buffer-size', type=int, default=10, help='updates per published version (async)')
+    parser.add_argument('--async-staleness-exponent', type=float, default=0.5)
+    parser.add_argument('--compute-delay-max', type=float, default=0.0,
+                        help='extra training seconds of the slowest node (heterogeneous swarm)')
+    parser.add_argument('--evaluation-mode', choices=['central', 'federated', 'both'], default='central',
+                        help='EVALUATION_MODE: test.parquet on the Coordinator, held-out node rows, or both')
+    parser.add_argument('--eval-holdout', type=float, default=0.1, help='EVAL_HOLDOUT_FRACTION of each node')
+    parser.add_argument('--round-timeout', type=float, default=120.0)
+    parser.add_argument('--stop-when-converged', action='store_true',
+                        help='end a run once the TrainingController stops training (sync mode)')
+    parser.add_argument('--target-loss', type=float, help='TARGET_LOSS; also reports the compute needed to reach it')
+    parser.add_argument('--convergence-tolerance', type=float, default=1e-4, help='CONVERGENCE_TOLERANCE')
+    parser.add_argument('--patience', type=int, default=5, help='PATIENCE_ROUNDS (0 disables)')
+    parser.add_argument('--adaptive', action='store_true', help='ADAPTIVE_TRAINING: adapt node learning rate and epochs')
+    parser.add_argument('--jobs', type=json.loads, default=[],
+                        help='JSON list of training jobs ({"job_id": ..., <JOB_SETTINGS>}) run next to the default one (sync)')
+    parser.add_argument('--tracemalloc', action='store_true', help='also trace Python heap peak (slow)')
+    parser.add_argument('--profile-rounds', type=int, default=0,
+                        help='PROFILE_ROUNDS: capture call stacks and allocations of the first N rounds')
+    parser.add_argument('--profile-dir', help='PROFILE_DIR of the captures (default: a temporary directory)')
+    parser.add_argument('--profile-engine', choices=['cprofile', 'pyinstrument'], default='cprofile')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--metrics-out', help='write the accumulated /metrics text (Prometheus format) to this file')
+    parser.add_argument('--verbose', action='store_true', help='show Coordinator/node logs')
+    args = parser.parse_args()
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    work_dir = tempfile.mkdtemp(prefix="swarm-sim-")
+    os.environ.update({
+        'S3_BUCKET_NAME': '',
+        'UPLOAD_CHECKPOINTS_TO_S3': 'false',
+        'MODEL_SAVE_DIR': os.path.join(work_dir, 'models'),
+        'RESUME_FROM_CHECKPOINT': 'false',  # Every configuration trains from round 0
+        'LOCAL_LEDGER_PATH': ':memory:',
+        'INCREMENTAL_AGGREGATION': 'true' if args.incremental else 'false',
+        'WIRE_DTYPE': args.wire_dtype,
+        'UPDATE_MODE': args.update_mode,
+        'DELTA_QUANTIZATION': args.delta_quantization or '',
+        'DELTA_TOP_K_FRACTION': str(args.delta_top_k) if args.delta_top_k else '',
+        'DELTA_ERROR_FEEDBACK': 'false' if args.no_error_feedback else 'true',
+        'ROUND_TIMEOUT': str(args.round_timeout),
+        'RELAY_FLUSH_INTERVAL': str(args.relay_flush_interval),
+        'FEDERATION_MODE': args.federation_mode,
+        'ASYNC_BUFFER_SIZE': str(args.async_buffer_size),
+        'ASYNC_STALENESS_EXPONENT': str(args.async_staleness_exponent),
+        'ASYNC_PULL_WAIT': '1',
+        'BROADCAST_MAX_WORKERS': str(max(args.node_workers, 8)),
+        'TEST_SET_REVALIDATE_SECONDS': '3600',
+        'EVALUATION_MODE': args.evaluation_mode,
+        'EVAL_HOLDOUT_FRACTION': str(args.eval_holdout),
+        'MAX_ROUNDS': str(args.rounds),
+        'TARGET_LOSS': str(args.target_loss) if args.target_loss is not None else '',
+        'CONVERGENCE_TOLERANCE': str(args.convergence_tolerance),
+        'PATIENCE_ROUNDS': str(args.patience),
+        'ADAPTIVE_TRAINING': 'true' if args.adaptive else 'false',
+        'PROFILE_ROUNDS': str(args.profile_rounds),
+        'PROFILE_DIR': args.profile_dir or os.path.join(work_dir, 'profiles'),
+        'PROFILE_ENGINE': args.profile_engine,
+    })
+
+    results = []
+    feature_widths = [None] if args.data else args.features
+    for n_features in feature_widths:
+        for n_nodes in args.nodes:
+            log_target = sys.stdout if args.verbose else open(os.devnull, 'w')
+            with contextlib.redirect_stdout(log_target):
+                result = run_simulation(n_nodes, n_features, args, work_dir)
+            results.append(result)
+            print(f"nodes={result['nodes']:5d} relays={result['relays']:3d} features={result['features']:6d}  "
+                  f"{result['rounds_per_sec']:7.2f} rounds/s  "
+                  f"round p50/p99={result['round_p50_seconds'] * 1000:8.1f}/{result['round_p99_seconds'] * 1000:8.1f} ms  "
+                  f"submit p50/p99={result['submit_p50_seconds'] * 1000:6.2f}/{result['submit_p99_seconds'] * 1000:6.2f} ms  "
+                  f"aggregate p50={result['aggregate_p50_seconds'] * 1000:7.1f} ms  "
+                  f"updates={result['updates']} ({result['updates_per_sec']:.1f}/s)  coordinator msgs/round={result['coordinator_upload_messages_per_round']:.0f}  upload={result['upload_bytes_per_update'] / 1024:.1f} KiB/update  "
+                  f"mse={result['final_test_mse'] if result['final_test_mse'] is not None else float('nan'):.4g}  peak RSS={result['process_peak_rss_mib']:.0f} MiB"
+                  + (f"  federated mse={result['federated_eval_mse']:.4g}" if result['federated_eval_mse'] is not None else "")
+                  + (f"  stopped={result['stop_reason']} after {result['rounds']} rounds" if args.stop_when_converged else "")
+                  + (f"  target reached in round {result['to_target'][0]} ({result['to_target'][1]} samples)"
+                     if result['to_target'] else "")
+                  + (f"  traced peak={result['traced_peak_mib']:.0f} MiB" if result['traced_peak_mib'] else ""),
+                  flush=True)
+            for job_id, job in result['jobs'].items():
+                print(f"  job {job_id}: {job['round']} rounds  mse={job['final_test_mse'] if job['final_test_mse'] is not None else float('nan'):.4g}  "
+                      f"features={job['features']}  learning rate={job['learning_rate']:.4g}"
+                      + (f"  stopped={job['stopped']}" if job['stopped'] else ""), flush=True)
+
+    if args.profile_rounds:
+        wait_for_writes()  # Captures are written in the background
+        print(f"Profiles written to {os.environ['PROFILE_DIR']}")
+
+    if args.metrics_out:
+        with open(args.metrics_out, 'w') as f:
+            f.write(METRICS.render())
+        print(f"Metrics written to {args.metrics_out}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,8 @@
 package main
 
 import (
+	"crypto/sha256"
+	"encoding/hex"
 	"encoding/json"
 	"fmt"
 	"time"
@@ -16,6 +18,21 @@ type ModelHashRecord struct {
 	Timestamp   int64  `json:"timestamp"`    // Unix timestamp
 }
 
+// HashRecordInput is one entry of a RecordHashBatch call (JSON produced by the Python LedgerWriter).
+type HashRecordInput struct {
+	RoundNum     int    `json:"round_num"`
+	ModelHash    string `json:"model_hash"`
+	AggregatedBy string `json:"aggregated_by"`
+}
+
+// BatchRecord stores the Merkle root over the records committed by one RecordHashBatch transaction.
+type BatchRecord struct {
+	TxID       string `json:"txId"`
+	MerkleRoot string `json:"merkleRoot"`
+	Rounds     []int  `json:"rounds"`
+	Timestamp  int64  `json:"timestamp"`
+}
+
 // SmartContract defines the smart contract methods for recording and querying hashes.
 type SmartContract struct {
 	contractapi.Contract
@@ -77,6 +94,107 @@ func (s *SmartContract) RecordHash(ctx contractapi.TransactionContextInterface,
 	return nil
 }
 
+// leafHash hashes one record as "<roundNum>:<modelHash>:<aggregatedBy>" (same as record_leaf_hash in Python).
+func leafHash(record HashRecordInput) []byte {
+	sum := sha256.Sum256([]byte(fmt.Sprintf("%d:%s:%s", record.RoundNum, record.ModelHash, record.AggregatedBy)))
+	return sum[:]
+}
+
+// computeMerkleRoot returns the hex Merkle root of the records; odd levels duplicate their last node.
+func computeMerkleRoot(records []HashRecordInput) string {
+	level := make([][]byte, len(records))
+	for i, record := range records {
+		level[i] = leafHash(record)
+	}
+	for len(level) > 1 {
+		if len(level)%2 == 1 {
+			level = append(level, level[len(level)-1])
+		}
+		next := make([][]byte, 0, len(level)/2)
+		for i := 0; i < len(level); i += 2 {
+			pair := append(append([]byte{}, level[i]...), level[i+1]...)
+			sum := sha256.Sum256(pair)
+			next = append(next, sum[:])
+		}
+		level = next
+	}
+	return hex.EncodeToString(level[0])
+}
+
+// RecordHashBatch records several model aggregation hashes in one transaction.
+// recordsJSON is a JSON array of HashRecordInput. If merkleRoot is not empty it must equal the root
+// computed over the records. Each record is stored under "HASH_<RoundNum>" exactly as RecordHash does,
+// and the batch itself under "BATCH_<TxID>". Returns the Merkle root.
+func (s *SmartContract) RecordHashBatch(ctx contractapi.TransactionContextInterface, recordsJSON string, merkleRoot string) (string, error) {
+	var records []HashRecordInput
+	if err := json.Unmarshal([]byte(recordsJSON), &records); err != nil {
+		return "", fmt.Errorf("Failed to unmarshal batch records: %v", err)
+	}
+	if len(records) == 0 {
+		return "", fmt.Errorf("Batch must contain at least one record")
+	}
+
+	root := computeMerkleRoot(records)
+	if merkleRoot != "" && merkleRoot != root {
+		return "", fmt.Errorf("Merkle root mismatch: expected %s, computed %s", merkleRoot, root)
+	}
+
+	seen := make(map[int]bool, len(records))
+	rounds := make([]int, 0, len(records))
+	for _, record := range records {
+		if record.RoundNum <= 0 {
+			return "", fmt.Errorf("Round number must be a positive integer")
+		}
+		if record.ModelHash == "" {
+			return "", fmt.Errorf("Model hash cannot be empty")
+		}
+		if record.AggregatedBy == "" {
+			return "", fmt.Errorf("Aggregator ID cannot be empty")
+		}
+		if seen[record.RoundNum] {
+			return "", fmt.Errorf("Round %d appears more than once in the batch", record.RoundNum)
+		}
+		seen[record.RoundNum] = true
+
+		existingRecordJSON, err := ctx.GetStub().GetState(fmt.Sprintf("HASH_%d", record.RoundNum))
+		if err != nil {
+			return "", fmt.Errorf("Failed to read from world state: %v", err)
+		}
+		if existingRecordJSON != nil {
+			return "", fmt.Errorf("Hash for round %d already exists on the ledger. Cannot overwrite.", record.RoundNum)
+		}
+		rounds = append(rounds, record.RoundNum)
+	}
+
+	timestamp := time.Now().Unix()
+	for _, record := range records {
+		recordJSON, err := json.Marshal(ModelHashRecord{
+			RoundNum:     record.RoundNum,
+			ModelHash:    record.ModelHash,
+			AggregatedBy: record.AggregatedBy,
+			Timestamp:    timestamp,
+		})
+		if err != nil {
+			return "", fmt.Errorf("Failed to marshal record to JSON: %v", err)
+		}
+		if err := ctx.GetStub().PutState(fmt.Sprintf("HASH_%d", record.RoundNum), recordJSON); err != nil {
+			return "", fmt.Errorf("Failed to put record to world state: %v", err)
+		}
+	}
+
+	txID := ctx.GetStub().GetTxID()
+	batchJSON, err := json.Marshal(BatchRecord{TxID: txID, MerkleRoot: root, Rounds: rounds, Timestamp: timestamp})
+	if err != nil {
+		return "", fmt.Errorf("Failed to marshal batch record to JSON: %v", err)
+	}
+	if err := ctx.GetStub().PutState(fmt.Sprintf("BATCH_%s", txID), batchJSON); err != nil {
+		return "", fmt.Errorf("Failed to put batch record to world state: %v", err)
+	}
+
+	fmt.Printf("Chaincode: Recorded %d hashes in one batch (Merkle root: %s)\n", len(records), root)
+	return root, nil
+}
+
 // QueryHash retrieves a model aggregation hash record by its round number.
 func (s *SmartContract) QueryHash(ctx contractapi.TransactionContextInterface, roundNum int) (*ModelHashRecord, error) {
 	if roundNum <= 0 {
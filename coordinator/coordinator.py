@@ -5,41 +5,321 @@ import json
 import threading
 import random
 import hashlib
+import logging
+import re
 import boto3  # Thêm boto3 để tương tác với S3
-from flask import Flask, request, jsonify
+import numpy as np
+from flask import Flask, Response, request, jsonify
 
 from shared_libs.central_registry import CentralRegistry
-from shared_libs.aggregator import Aggregator
-from shared_libs.blockchain_sdk import BlockchainClientSDK 
+from shared_libs.aggregator import Aggregator, RunningAggregate
+from shared_libs.async_buffer import AsyncUpdateBuffer
+from shared_libs.blockchain_sdk import BlockchainClientSDK, LedgerWriter
+from shared_libs.model_broadcaster import ModelBroadcaster
+from shared_libs.checkpoint_persister import CheckpointPersister
+from shared_libs.federated_eval import EvaluationAggregate
+from shared_libs.round_scheduler import RoundScheduler
+from shared_libs.round_slots import RoundSlots
+from shared_libs.training_controller import TrainingController, model_delta_norm
+from shared_libs.metrics import METRICS, METRICS_CONTENT_TYPE
+from shared_libs.profiler import profiler_from_env
+from shared_libs.model_codec import (ModelCodec, ModelPayload, UnknownSchemaError, model_hash, apply_delta,
+                                     base_vector, decode_partial_aggregate, MODEL_CONTENT_TYPE, JSON_CONTENT_TYPE,
+                                     PARTIAL_AGGREGATE_CONTENT_TYPE, SUPPORTED_WIRE_FORMATS, validate_model)
 
 app = Flask(__name__)
+logger = logging.getLogger(__name__)
+
+MAX_PULL_WAIT = 60.0  # Upper bound (seconds) of a /global_model long poll
+
+# Coordinator metrics, served in Prometheus text format on /metrics
+PHASE_SECONDS = METRICS.histogram(
+    'swarm_coordinator_phase_seconds', 'Time spent per round phase', ['phase'])
+UPDATES_TOTAL = METRICS.counter(
+    'swarm_coordinator_updates_total', 'Local model updates by outcome', ['result'])
+PAYLOAD_BYTES_TOTAL = METRICS.counter(
+    'swarm_coordinator_payload_bytes_total', 'Model payload bytes sent to or received from nodes', ['direction'])
+UPDATE_KINDS_TOTAL = METRICS.counter(
+    'swarm_coordinator_update_kinds_total', 'Accepted local updates by encoding (full model or delta)', ['kind'])
+DELIVERIES_TOTAL = METRICS.counter(
+    'swarm_coordinator_deliveries_total', 'Global model deliveries by outcome', ['result'])
+CURRENT_ROUND = METRICS.gauge('swarm_coordinator_round', 'Current swarm learning round')
+ACTIVE_NODES = METRICS.gauge('swarm_coordinator_active_nodes', 'Nodes with a live lease at the start of the round')
+UPDATE_STALENESS = METRICS.histogram(
+    'swarm_coordinator_update_staleness', 'Versions published between an async update\'s base model and its arrival',
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21))
+FEDERATED_EVAL_MSE = METRICS.gauge(
+    'swarm_coordinator_federated_eval_mse', 'Sample-weighted held-out MSE of the previous global model reported by nodes')
+FEDERATED_EVAL_SAMPLES = METRICS.gauge(
+    'swarm_coordinator_federated_eval_samples', 'Held-out samples behind the latest federated evaluation')
+RELATIVE_DELTA = METRICS.gauge(
+    'swarm_coordinator_relative_model_delta', 'Norm of the latest global model change relative to the previous model')
+LEARNING_RATE = METRICS.gauge(
+    'swarm_coordinator_node_learning_rate', 'Learning rate sent to the nodes with the next global model')
+JOB_ROUND = METRICS.gauge('swarm_coordinator_job_round', 'Current round of each training job', ['job'])
+
+DEFAULT_JOB = 'default'  # The job of the swarm-wide configuration; messages without a job_id belong to it
+# Settings a training job can override (TRAINING_JOBS or POST /jobs); the others apply to all jobs
+JOB_SETTINGS = ('features', 'learning_rate', 'local_epochs', 'max_rounds', 'min_rounds', 'target_loss',
+                'patience', 'adaptive')
+_JOB_ID_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$')  # Also used as a directory name
+
+
+def _job_setting(settings, name, env_name, default, cast):
+    """A job's override of a setting, else the environment variable, else `default`."""
+    value = settings.get(name)
+    if value is None:
+        value = os.environ.get(env_name)
+    if value is None or value == '':
+        return default
+    if cast is bool and isinstance(value, str):
+        return value.lower() == 'true'
+    return cast(value)
+
 
 class Coordinator:
-    def __init__(self, coordinator_id):
+    def __init__(self, coordinator_id, broadcast_session_factory=None, job_id=DEFAULT_JOB, job_settings=None,
+                 parent=None):
+        """
+        `broadcast_session_factory` replaces the HTTP sessions used to reach nodes (see ModelBroadcaster).
+        Further training jobs are created by add_job() as Coordinators with a `parent`: they share its
+        node registry, codec, broadcaster and ledger writer, and keep their own global model, round
+        counter, round slots, TrainingController, checkpoints and profiler. `job_settings` overrides the
+        JOB_SETTINGS of the job (e.g. a feature subset or learning rate for a hyperparameter sweep).
+        """
         self.coordinator_id = coordinator_id
-        self.central_registry = CentralRegistry()
-        self.aggregator = Aggregator()
+        self.job_id = job_id
+        self.job_settings = dict(job_settings or {})
+        self.parent = parent
+        self.jobs = parent.jobs if parent is not None else {job_id: self}  # job_id -> Coordinator, shared
+        if parent is not None:
+            self.central_registry = parent.central_registry
+        else:
+            self.central_registry = CentralRegistry(
+                lease_seconds=float(os.environ.get('NODE_LEASE_SECONDS', 30)),
+                max_consecutive_failures=int(os.environ.get('NODE_MAX_CONSECUTIVE_FAILURES', 3)),
+            )
+        self.aggregator = Aggregator(test_set_cache=parent.aggregator.test_set_cache if parent is not None else None)
         
         self.current_round = 0
         self.current_global_model = self._initialize_global_model()
 
-        # Attributes for managing update collection per round
-        self._received_updates_this_round = {}
+        # 'uniform' averages node models equally, 'samples' weights them by sample count (FedAvg)
+        self.aggregation_weighting = os.environ.get('AGGREGATION_WEIGHTING', 'uniform')
+        # Incremental mode folds each update into running sums on arrival instead of storing it
+        self.incremental_aggregation = os.environ.get('INCREMENTAL_AGGREGATION', 'false').lower() == 'true'
+
+        # Attributes for managing update collection per round. Updates are stored in the round's
+        # RoundSlots (striped, no Coordinator-wide lock); a new object is swapped in every round.
+        self.slot_stripes = int(os.environ.get('ROUND_SLOT_STRIPES', 16))
+        self._round_slots = self._new_round_slots(self.current_global_model)
         self._updates_expected_count = 0
         self._round_completion_event = threading.Event()
-        self._update_lock = threading.Lock()  # To protect _received_updates_this_round
+        self._update_lock = threading.Lock()  # Round transitions, node endpoints and the async-mode state
+        self._update_condition = threading.Condition(self._update_lock)  # Notified on every accepted update
+        self._round_started_at = time.monotonic()
+
+        # 'sync' runs barrier rounds; 'async' (FedBuff-style) lets nodes pull the latest model version and
+        # train continuously, and publishes a new version every ASYNC_BUFFER_SIZE staleness-weighted updates
+        self.federation_mode = os.environ.get('FEDERATION_MODE', 'sync')
+        self.async_buffer = AsyncUpdateBuffer(
+            buffer_size=int(os.environ.get('ASYNC_BUFFER_SIZE', 10)),
+            staleness_exponent=float(os.environ.get('ASYNC_STALENESS_EXPONENT', 0.5)),
+            max_staleness=int(os.environ.get('ASYNC_MAX_STALENESS', 10)),
+            sample_weighted=self.aggregation_weighting == 'samples',
+        )
+        self.async_server_learning_rate = float(os.environ.get('ASYNC_SERVER_LEARNING_RATE', 1.0))
+
+        # EVALUATION_MODE=federated|both: nodes score each round's global model on held-out local rows
+        # while they train and report loss sums with their update; they are combined per round here
+        self.evaluation_mode = self.aggregator.evaluation_mode
+        if self.evaluation_mode != 'central' and self.federation_mode == 'async':
+            # Reports would belong to many model versions at once; async mode keeps central evaluation
+            logger.warning("Coordinator: Federated evaluation needs sync rounds. Using central evaluation.")
+            self.evaluation_mode = self.aggregator.evaluation_mode = 'central'
+            self.aggregator.central_evaluation = True
+            self.aggregator.test_set_cache.prefetch()
+        self.last_federated_evaluation = None  # Combined node metrics of the latest evaluated global model
+        # In async mode current_round is the model version; recent versions are kept to compute deltas of stale updates
+        self._model_versions = {self.current_round: self.current_global_model}
+        self._version_delta_bases = {}  # version -> {schema hash -> base vector}
+        self._version_submitters = {}  # version -> nodes that submitted an update trained on it (duplicate check)
+
+        # Quorum / straggler policy deciding when a round stops waiting for updates
+        quorum_count = os.environ.get('QUORUM_COUNT')
+        quorum_sample_fraction = os.environ.get('QUORUM_SAMPLE_FRACTION')
+        self.round_scheduler = RoundScheduler(
+            quorum_count=int(quorum_count) if quorum_count else None,
+            quorum_fraction=float(os.environ.get('QUORUM_FRACTION', 1.0)),
+            quorum_sample_fraction=float(quorum_sample_fraction) if quorum_sample_fraction else None,
+            straggler_percentile=float(os.environ.get('STRAGGLER_PERCENTILE', 90)),
+            straggler_slack=float(os.environ.get('STRAGGLER_SLACK', 1.5)),
+        )
+        self.round_timeout = float(os.environ.get('ROUND_TIMEOUT', 60))  # Hard upper bound of the wait
+        # Async mode publishes a partly filled buffer after this long, so too few active nodes cannot stall it
+        self.async_buffer_timeout = float(os.environ.get('ASYNC_BUFFER_TIMEOUT', self.round_timeout))
+        self._completed_round_durations = []  # Seconds per completed round, for the rounds/hour figure
+        self.last_round_timings = {}  # Seconds spent per step of the latest round (distribute, wait, aggregate, total)
+
+        if parent is not None:
+            self._share_infrastructure(parent)
+        else:
+            self._create_infrastructure(broadcast_session_factory)
+        self.last_delivery_report = {}  # node_id -> delivery report of the latest broadcast
+        # On-demand cProfile/tracemalloc capture of the next N rounds (PROFILE_ROUNDS or POST /admin/profile)
+        self.profiler = profiler_from_env(
+            coordinator_id if job_id == DEFAULT_JOB else os.path.join(coordinator_id, 'jobs', job_id))
 
+        # Decides after every round whether to stop (convergence, target loss, patience or MAX_ROUNDS) and,
+        # with ADAPTIVE_TRAINING, the learning rate and local epochs sent to the nodes with the next model
+        model_save_dir = os.environ.get('MODEL_SAVE_DIR', '/app/models')  # Mounted via Docker volume
+        s3_prefix = "models"
+        if job_id != DEFAULT_JOB:
+            model_save_dir = os.path.join(model_save_dir, 'jobs', job_id)
+            s3_prefix = f"models/jobs/{job_id}"
+        resume = os.environ.get('RESUME_FROM_CHECKPOINT', 'true').lower() == 'true'
+        settings = self.job_settings
+        self.training_controller = TrainingController(
+            history_dir=model_save_dir,
+            resume=resume,
+            max_rounds=_job_setting(settings, 'max_rounds', 'MAX_ROUNDS', 5, int),
+            min_rounds=_job_setting(settings, 'min_rounds', 'MIN_ROUNDS', 2, int),
+            delta_tolerance=float(os.environ.get('CONVERGENCE_TOLERANCE', 1e-4)),
+            target_loss=_job_setting(settings, 'target_loss', 'TARGET_LOSS', None, float),
+            patience=_job_setting(settings, 'patience', 'PATIENCE_ROUNDS', 5, int),
+            min_improvement=float(os.environ.get('MIN_LOSS_IMPROVEMENT', 1e-3)),
+            adaptive=_job_setting(settings, 'adaptive', 'ADAPTIVE_TRAINING', False, bool),
+            learning_rate=_job_setting(settings, 'learning_rate', 'LEARNING_RATE', 0.01, float),
+            local_epochs=_job_setting(settings, 'local_epochs', 'LOCAL_EPOCHS', 1, int),
+            lr_decay=float(os.environ.get('LR_DECAY', 0.5)),
+            max_epochs=int(os.environ.get('MAX_LOCAL_EPOCHS', 10)),
+        )
+
+        # Round checkpoints are written atomically and uploaded to S3 by a background worker
+        upload_checkpoints = os.environ.get('UPLOAD_CHECKPOINTS_TO_S3', 'true').lower() == 'true'
+        self.checkpoint_persister = CheckpointPersister(
+            model_save_dir=model_save_dir,
+            s3_bucket_name=os.environ.get('S3_BUCKET_NAME', 'durian-bucket-titan') if upload_checkpoints else None,
+            s3_prefix=s3_prefix,
+            max_pending=int(os.environ.get('CHECKPOINT_MAX_PENDING', 4)),
+            full_every=int(os.environ.get('CHECKPOINT_FULL_EVERY', 10)),
+        )
+
+        # A restarted Coordinator continues from its newest valid checkpoint instead of round 0
+        if resume:
+            self._resume_from_checkpoint()
+            # Decisions of rounds newer than the checkpoint are redone
+            self.training_controller.rewind(self.current_round)
+
+        logger.info(f"Coordinator '{self.coordinator_id}' initialized" +
+                    (f" for job '{job_id}'." if job_id != DEFAULT_JOB else "."))
+
+    def _create_infrastructure(self, broadcast_session_factory):
+        """Node-facing components that all training jobs of this Coordinator share."""
         # Dictionary to store node endpoints for direct communication
         self.node_endpoints = {}
 
-        # Initialize the BlockchainClientSDK
-        self.blockchain_client = BlockchainClientSDK(client_id=coordinator_id)
+        # Binary model encoding, used for nodes that advertised it at registration (JSON otherwise)
+        self.model_codec = ModelCodec(
+            dtype=os.environ.get('WIRE_DTYPE', 'float64'),
+            compression=os.environ.get('WIRE_COMPRESSION') or None,
+        )
+        self.node_wire_formats = {}  # node_id -> wire formats the node accepts
+        self._node_schemas = {}  # node_id -> feature schema hashes the node is known to have
+
+        # Initialize the BlockchainClientSDK (LOCAL_LEDGER_PATH switches to the SQLite stand-in ledger)
+        blockchain_config = {}
+        if os.environ.get('LOCAL_LEDGER_PATH'):
+            blockchain_config = {
+                'local_ledger_path': os.environ['LOCAL_LEDGER_PATH'],
+                'local_ledger_commit_latency': float(os.environ.get('LOCAL_LEDGER_COMMIT_LATENCY', 0)),
+            }
+        self.blockchain_client = BlockchainClientSDK(client_id=self.coordinator_id, config=blockchain_config)
+        # Aggregation hashes are committed in the background, several rounds per transaction if they pile up
+        self.ledger_writer = LedgerWriter(
+            self.blockchain_client,
+            max_batch_size=int(os.environ.get('LEDGER_MAX_BATCH_SIZE', 32)),
+            linger=float(os.environ.get('LEDGER_LINGER_SECONDS', 0)),
+        )
+
+        # Concurrent fan-out of the global model with pooled keep-alive sessions per node
+        self.model_broadcaster = ModelBroadcaster(
+            max_workers=int(os.environ.get('BROADCAST_MAX_WORKERS', 32)),
+            request_timeout=float(os.environ.get('BROADCAST_REQUEST_TIMEOUT', 5)),
+            node_deadline=float(os.environ.get('BROADCAST_NODE_DEADLINE', 15)),
+            max_retries=int(os.environ.get('BROADCAST_MAX_RETRIES', 2)),
+            session_factory=broadcast_session_factory,
+        )
+
+    def _share_infrastructure(self, parent):
+        self.node_endpoints = parent.node_endpoints
+        self.model_codec = parent.model_codec
+        self.node_wire_formats = parent.node_wire_formats
+        self._node_schemas = parent._node_schemas
+        self.blockchain_client = parent.blockchain_client
+        self.ledger_writer = parent.ledger_writer
+        self.model_broadcaster = parent.model_broadcaster
 
-        print(f"Coordinator '{self.coordinator_id}' initialized.")
+    def add_job(self, job_id, settings=None):
+        """
+        Creates a training job over the same registered nodes, with its own model and rounds (see
+        __init__), and returns its Coordinator; run it with start_training_rounds(job). Raises
+        ValueError for an invalid or existing job_id, unknown settings, or in async federation mode.
+        """
+        if self.parent is not None:
+            return self.parent.add_job(job_id, settings)
+        settings = dict(settings or {})
+        if self.federation_mode == 'async':
+            raise ValueError("Training jobs need sync rounds (FEDERATION_MODE=sync).")
+        if not isinstance(job_id, str) or not _JOB_ID_PATTERN.match(job_id):
+            raise ValueError(f"Invalid job_id {job_id!r}: use up to 64 letters, digits, '_', '.' or '-'.")
+        unknown = sorted(set(settings) - set(JOB_SETTINGS))
+        if unknown:
+            raise ValueError(f"Unknown job settings {unknown}. Supported: {list(JOB_SETTINGS)}")
+        features = settings.get('features')
+        if features is not None and (not isinstance(features, list) or not features
+                                     or not all(isinstance(f, str) for f in features)):
+            raise ValueError("'features' must be a non-empty list of feature names.")
+        if job_id in self.jobs:
+            raise ValueError(f"Job '{job_id}' already exists.")
+        job = Coordinator(self.coordinator_id, job_id=job_id, job_settings=settings, parent=self)
+        with self._update_lock:
+            if job_id in self.jobs:
+                raise ValueError(f"Job '{job_id}' already exists.")
+            self.jobs[job_id] = job
+        return job
+
+    def job_status(self) -> dict:
+        controller = self.training_controller
+        return {
+            'job_id': self.job_id,
+            'round': self.current_round,
+            'max_rounds': controller.max_rounds,
+            'stopped': controller.stop_reason,
+            'learning_rate': controller.learning_rate,
+            'local_epochs': controller.local_epochs,
+            'best_loss': controller.best_loss,
+            'training_samples': controller.cumulative_samples,
+            'features': len(self.current_global_model['coef']),
+            'settings': self.job_settings,
+        }
+
+    def _set_gauge(self, gauge, value):
+        """The unlabelled round gauges describe the default job; the other jobs only report JOB_ROUND."""
+        if self.job_id == DEFAULT_JOB:
+            gauge.set(value)
+
+    def _new_round_slots(self, base_model):
+        return RoundSlots(self.current_round, base_model, weighted=self.aggregation_weighting == 'samples',
+                          incremental=self.incremental_aggregation, stripes=self.slot_stripes)
 
     def _initialize_global_model(self):
         """Tạo mô hình toàn cục mới nếu không có mô hình hiện có từ S3."""
-        print("Coordinator: No existing global model found. Creating a new one.")
+        logger.info("Coordinator: Creating a new global model (replaced below if a checkpoint is resumed).")
+        features = self.job_settings.get('features')
+        if features:
+            # A job on a feature subset: nodes train and send only these coefficients
+            return {'coef': {f: 0 for f in features}, 'intercept': 0}
         # Tạo mô hình toàn cục mới với các tham số khởi tạo mặc định
         # Cập nhật theo các feature của bạn
         return {
@@ -47,127 +327,676 @@ class Coordinator:
             'intercept': 0
         }
 
-    def register_node(self, node_id, endpoint_url):
-        print(f"Coordinator: Received registration request for Node {node_id} at {endpoint_url}")
+    def _resume_from_checkpoint(self):
+        """
+        Loads the newest checkpoint whose SHA-256 matches the manifest (from S3 if the local store is
+        empty) as the current global model and round. Returns True if a checkpoint was found.
+        """
+        started = time.monotonic()
+        self.checkpoint_persister.restore_from_s3()
+        round_num, model = self.checkpoint_persister.store.load_latest()
+        if round_num is None:
+            return False
+        self.current_round = round_num
+        self.current_global_model = model
+        self._round_slots = self._new_round_slots(model)
+        self._model_versions = {round_num: model}
+        self._set_gauge(CURRENT_ROUND, round_num)
+        logger.info(f"Coordinator: Resumed from the checkpoint of round {round_num} "
+                    f"({len(model['coef'])} features) in {time.monotonic() - started:.3f}s.")
+        return True
+
+    def register_node(self, node_id, endpoint_url, wire_formats=None):
+        logger.debug("Coordinator: Received registration request for Node %s at %s", node_id, endpoint_url)
         success = self.central_registry.register_node(node_id, endpoint_url)
         if success:
             with self._update_lock:  # Protect access to node_endpoints
                 if node_id not in self.node_endpoints:
                     self.node_endpoints[node_id] = endpoint_url
-                    print(f"Coordinator: Added Node {node_id} to active endpoints.")
+                    logger.info("Coordinator: Added Node %s to active endpoints.", node_id)
+                self.node_wire_formats[node_id] = list(wire_formats or ['json'])
+                self._node_schemas[node_id] = set()  # A (re)started node may have lost learned schemas
             return True
         return False
+
+    def register_relay(self, relay_id, endpoint_url, wire_formats=None):
+        """Registers a sub-aggregator; nodes registering afterwards are assigned to relay groups."""
+        self.central_registry.register_relay(relay_id, endpoint_url)
+        with self._update_lock:
+            self.node_wire_formats[relay_id] = list(wire_formats or ['json'])
+        return True
+
+    def _distribute_to_relays(self, node_ids):
+        """
+        Sends the round's global model to every relay, with the number of its group members that are
+        about to receive it, so relays are ready before the first node update arrives.
+        """
+        relays = self.central_registry.get_relays()
+        if not relays or self.job_id != DEFAULT_JOB:
+            return  # Nodes submit the updates of other jobs to the Coordinator directly
+        group_sizes = self.central_registry.group_sizes(node_ids)
+        deliveries = {}
+        for relay_id, endpoint_url in relays.items():
+            metadata = {'round_num': self.current_round, 'group_size': group_sizes.get(relay_id, 0)}
+            if 'binary' in self.node_wire_formats.get(relay_id, ()):
+                body = self.model_codec.encode_model(self.current_global_model, metadata)
+                deliveries[relay_id] = (endpoint_url, body, {'Content-Type': MODEL_CONTENT_TYPE}, None)
+            else:
+                body = json.dumps(dict(metadata, global_model=self.current_global_model)).encode('utf-8')
+                deliveries[relay_id] = (endpoint_url, body, {'Content-Type': JSON_CONTENT_TYPE}, None)
+        for report in self.model_broadcaster.broadcast_bodies(deliveries).values():
+            if not report['delivered']:
+                # Its nodes will fail to reach it and fall back to submitting to the Coordinator directly
+                logger.warning("Coordinator: Error sending model to relay %s: %s", report['node_id'], report['error'])
+
+    def _model_metadata(self, round_num):
+        """Metadata sent with a global model: its round, job and (adaptive or job) training plan."""
+        metadata = {'round_num': round_num}
+        # Jobs other than the default always send their plan, since nodes multiplex several of them
+        training_plan = self.training_controller.training_plan(always=self.job_id != DEFAULT_JOB)
+        if training_plan is not None:
+            metadata['training_plan'] = training_plan
+        if self.job_id != DEFAULT_JOB:
+            metadata['job_id'] = self.job_id
+        if self.job_settings.get('features'):
+            metadata['feature_subset'] = True  # Nodes train only the model's features, not all of theirs
+        return metadata
+
+    def _build_deliveries(self, node_urls):
+        """
+        Encodes the global model once per wire format and assigns a body to each node.
+        Nodes that already know the model's feature schema get the message without feature names,
+        with the full message as a fallback in case they answer 409 (unknown schema).
+        """
+        metadata = self._model_metadata(self.current_round)
+        json_body = None
+        binary_full = binary_lean = None
+        schema = None
+        deliveries = {}
+
+        for node_id, endpoint_url in node_urls.items():
+            if 'binary' in self.node_wire_formats.get(node_id, ()):
+                if binary_full is None:
+                    binary_full = self.model_codec.encode_model(self.current_global_model, metadata)
+                    schema = self.model_codec.register_schema(self.current_global_model['coef'].keys())
+                full = (binary_full, {'Content-Type': MODEL_CONTENT_TYPE})
+                if schema in self._node_schemas.get(node_id, ()):
+                    if binary_lean is None:
+                        binary_lean = self.model_codec.encode_model(self.current_global_model, metadata, include_schema=False)
+                    deliveries[node_id] = (endpoint_url, binary_lean, {'Content-Type': MODEL_CONTENT_TYPE}, full)
+                else:
+                    deliveries[node_id] = (endpoint_url, binary_full, full[1], None)
+                    self._node_schemas.setdefault(node_id, set()).add(schema)
+            else:
+                if json_body is None:
+                    json_body = json.dumps(dict(metadata, global_model=self.current_global_model)).encode('utf-8')
+                deliveries[node_id] = (endpoint_url, json_body, {'Content-Type': JSON_CONTENT_TYPE}, None)
+        return deliveries
     
     def distribute_global_model(self):
-        print("[STEP 1: Distributing Global Model]")
+        logger.info("[STEP 1: Distributing Global Model]")
         registered_nodes = self.central_registry.get_registered_nodes()
-        self._updates_expected_count = len(registered_nodes)
-        self._received_updates_this_round = {}  # Reset for new round
-        self._round_completion_event.clear()  # Clear the event for the new round
+        with self._update_lock:  # Reset for new round
+            self._round_started_at = time.monotonic()
+            self.round_scheduler.start_round(registered_nodes.keys())
+            self._updates_expected_count = len(registered_nodes)
+            self._round_slots = self._new_round_slots(self.current_global_model)
+            self._round_completion_event.clear()  # Clear the event for the new round
 
+        self._set_gauge(ACTIVE_NODES, len(registered_nodes))
         if not registered_nodes:
-            print("Coordinator: No nodes to distribute model to.")
+            logger.info("Coordinator: No nodes to distribute model to.")
             return
 
-        for node_id, endpoint_url in registered_nodes.items():
-            try:
-                target_url = f"{endpoint_url}/model_update"
-                headers = {'Content-Type': 'application/json'}
-                payload = {
-                    'round_num': self.current_round,
-                    'global_model': self.current_global_model
-                }
-                requests.post(target_url, json=payload, headers=headers, timeout=5)
-                print(f"Coordinator: Sent global model to node {node_id}")
-            except requests.exceptions.RequestException as e:
-                print(f"Coordinator: Error sending model to node {node_id} at {endpoint_url}: {e}")
-
-    def receive_model_update(self, node_id, round_num, local_model):
+        node_urls = {node_id: info['endpoint'] for node_id, info in registered_nodes.items()}
+        started = time.monotonic()
+        self._distribute_to_relays(node_urls.keys())
+        deliveries = self._build_deliveries(node_urls)
+        self.last_delivery_report = self.model_broadcaster.broadcast_bodies(deliveries)
+        elapsed = time.monotonic() - started
+
+        delivered = [r for r in self.last_delivery_report.values() if r['delivered']]
+        for report in self.last_delivery_report.values():
+            if report['delivered']:
+                DELIVERIES_TOTAL.inc(result='delivered')
+                PAYLOAD_BYTES_TOTAL.inc(len(deliveries[report['node_id']][1]), direction='sent')
+                self.central_registry.record_success(report['node_id'], report['latency'])
+            else:
+                DELIVERIES_TOTAL.inc(result='failed')
+                self.central_registry.record_failure(report['node_id'])
+                logger.warning("Coordinator: Error sending model to node %s at %s after %d attempt(s): %s",
+                               report['node_id'], node_urls[report['node_id']], report['attempts'], report['error'])
+
+        # Nodes that did not get the model cannot answer this round, so do not wait for them
         with self._update_lock:
-            if round_num != self.current_round:
-                print(f"Coordinator: Received out-of-round update from {node_id} (Expected {self.current_round}, Got {round_num}). Ignoring.")
-                return False
+            delivered_ids = [r['node_id'] for r in delivered]
+            self._updates_expected_count = len(delivered_ids)
+            self.round_scheduler.start_round(delivered_ids)
+            if len(self._round_slots) >= self._updates_expected_count:
+                self._round_completion_event.set()
+            self._update_condition.notify_all()
+        if delivered:
+            latencies = sorted(r['latency'] for r in delivered)
+            logger.info(f"Coordinator: Sent global model to {len(delivered)}/{len(node_urls)} nodes in {elapsed:.3f}s "
+                        f"(latency min={latencies[0]:.3f}s, median={latencies[len(latencies) // 2]:.3f}s, max={latencies[-1]:.3f}s)")
 
-            if node_id in self._received_updates_this_round:
-                print(f"Coordinator: Node {node_id} already submitted update for round {round_num}. Ignoring duplicate.")
-                return False
+    def receive_model_update(self, node_id, round_num, local_model, num_samples=None, evaluation=None):
+        """
+        Accepts a local model as a `{'coef', 'intercept'}` dict or a decoded binary ModelPayload, and
+        optionally the node's evaluation statistics of the round's global model (federated evaluation).
+        Safe to call from many request threads at once: only the round's slots are touched.
+        """
+        if self.federation_mode == 'async':
+            return self._receive_async_update(node_id, round_num, local_model, num_samples)
+        slots = self._round_slots  # The round this update is checked and stored against
+        if round_num != slots.round_num or slots.sealed:
+            UPDATES_TOTAL.inc(result='out_of_round')
+            logger.debug("Coordinator: Received out-of-round update from %s (Expected %s, Got %s). Ignoring.",
+                         node_id, slots.round_num, round_num)
+            return False
+        evaluation = self._valid_evaluation(evaluation, node_id)
+
+        if not slots.claim([node_id]):
+            UPDATES_TOTAL.inc(result='duplicate')
+            logger.debug("Coordinator: Node %s already submitted update for round %s. Ignoring duplicate.", node_id, round_num)
+            return False
+
+        try:
+            if isinstance(local_model, ModelPayload):
+                # The node sent this schema, so it can decode global models that use it
+                self._node_schemas.setdefault(node_id, set()).add(local_model.schema)
+                UPDATE_KINDS_TOTAL.inc(kind='delta' if local_model.is_delta else 'full')
+                if local_model.is_delta:
+                    # Base vectors are built once per feature schema per round
+                    local_model = apply_delta(local_model, slots.base_model, slots.delta_bases)
+                stored = slots.fill_model(node_id, local_model.feature_names, local_model.values,
+                                          local_model.intercept, num_samples=num_samples, schema=local_model.schema,
+                                          evaluation=evaluation)
+            else:
+                stored = slots.fill_model(node_id, model=local_model, num_samples=num_samples, evaluation=evaluation)
+        except BaseException:
+            slots.release([node_id])
+            raise
+        if not stored:
+            UPDATES_TOTAL.inc(result='out_of_round')
+            logger.debug("Coordinator: Update from %s arrived after round %s closed. Ignoring.", node_id, round_num)
+            return False
 
-            self._received_updates_this_round[node_id] = local_model
-            print(f"Coordinator: Received update from Node {node_id} for round {round_num}.")
+        self.central_registry.record_success(node_id)
+        self.round_scheduler.record_update(node_id, time.monotonic() - self._round_started_at, num_samples)
+        UPDATES_TOTAL.inc(result='accepted')
+        logger.debug("Coordinator: Received update from Node %s for round %s.", node_id, round_num)
+        self._update_received(slots)
+        return True
 
-            if len(self._received_updates_this_round) >= self._updates_expected_count:
-                print("Coordinator: All expected updates received for this round. Signaling completion.")
-                self._round_completion_event.set()  # Signal that all updates are in
+    def _valid_evaluation(self, evaluation, sender):
+        """Evaluation statistics of an update if federated evaluation is on and they are well-formed, else None."""
+        if evaluation is None or self.evaluation_mode == 'central':
+            return None
+        try:
+            EvaluationAggregate.validate(evaluation)
+        except ValueError as e:
+            logger.warning(f"Coordinator: Ignoring evaluation from {sender}: {e}")
+            return None
+        return evaluation
+
+    def _update_received(self, slots):
+        """Signals round completion once every expected update landed, and wakes the waiting round."""
+        if len(slots) >= self._updates_expected_count:
+            logger.debug("Coordinator: All expected updates received for this round. Signaling completion.")
+            self._round_completion_event.set()  # Signal that all updates are in
+        with self._update_condition:
+            self._update_condition.notify_all()
+
+    def receive_partial_aggregate(self, relay_id, round_num, state, node_samples, evaluation=None):
+        """
+        Accepts a relay's pre-aggregated group update (a RunningAggregate state) covering the nodes in
+        `node_samples` ({node_id: num_samples or None}), plus the group's summed evaluation statistics
+        (EvaluationAggregate state) if any. Counts as one update per contained node.
+        """
+        slots = self._round_slots
+        if round_num != slots.round_num or slots.sealed or self.federation_mode == 'async':
+            UPDATES_TOTAL.inc(len(node_samples), result='out_of_round')
+            logger.debug("Coordinator: Received out-of-round partial aggregate from relay %s (Expected %s, Got %s). Ignoring.",
+                         relay_id, slots.round_num, round_num)
+            return False
+        if not slots.claim(node_samples):
+            # Sums cannot be split again, so a partial overlapping direct submissions is dropped whole
+            UPDATES_TOTAL.inc(len(node_samples), result='duplicate')
+            logger.warning("Coordinator: Partial aggregate from relay %s repeats updates of other submissions. Ignoring it.",
+                           relay_id)
+            return False
+        evaluation = self._valid_evaluation(evaluation, relay_id)
+        samples = sum(n for n in node_samples.values() if isinstance(n, (int, float)))
+        if not slots.fill_partial(list(node_samples), state, evaluation, samples=samples):
+            UPDATES_TOTAL.inc(len(node_samples), result='out_of_round')
+            return False
+
+        latency = time.monotonic() - self._round_started_at
+        for node_id, num_samples in node_samples.items():
+            self.central_registry.record_success(node_id)
+            self.round_scheduler.record_update(node_id, latency, num_samples)
+        UPDATES_TOTAL.inc(len(node_samples), result='accepted')
+        UPDATE_KINDS_TOTAL.inc(len(node_samples), kind='relayed')
+        logger.debug("Coordinator: Received partial aggregate of %d updates from relay %s for round %s.",
+                     len(node_samples), relay_id, round_num)
+        self._update_received(slots)
+        return True
+
+    def _receive_async_update(self, node_id, version, local_model, num_samples=None):
+        """
+        Async mode: buffers the update as a delta from the model version it was trained on (`version`,
+        sent as round_num). Updates of versions more than ASYNC_MAX_STALENESS behind are rejected.
+        """
+        with self._update_lock:
+            staleness = self.current_round - version
+            base_model = self._model_versions.get(version)
+            submitters = self._version_submitters.setdefault(version, set()) if base_model is not None else None
+            if base_model is None or not self.async_buffer.accepts(staleness) or node_id in submitters:
+                result = 'duplicate' if submitters and node_id in submitters else 'stale'
+                UPDATES_TOTAL.inc(result=result)
+                logger.debug("Coordinator: Rejected %s async update from %s (version %s, current %s).",
+                             result, node_id, version, self.current_round)
+                return False
+
+            base_cache = self._version_delta_bases.setdefault(version, {})
+            if isinstance(local_model, ModelPayload):
+                self._node_schemas.setdefault(node_id, set()).add(local_model.schema)
+                UPDATE_KINDS_TOTAL.inc(kind='delta' if local_model.is_delta else 'full')
+                feature_names, schema = local_model.feature_names, local_model.schema
+                if local_model.is_delta:
+                    delta_values, delta_intercept = local_model.values, local_model.intercept
+                else:
+                    delta_values = local_model.values - base_vector(base_model, feature_names, schema, base_cache)
+                    delta_intercept = local_model.intercept - float(base_model['intercept'])
+            else:
+                coef = local_model['coef']
+                feature_names, schema = list(coef.keys()), None
+                base_coef = base_model['coef']
+                delta_values = np.fromiter((value - base_coef.get(f, 0.0) for f, value in coef.items()),
+                                           dtype=np.float64, count=len(coef))
+                delta_intercept = local_model['intercept'] - float(base_model['intercept'])
+            self.async_buffer.add(feature_names, delta_values, delta_intercept, staleness,
+                                  num_samples=num_samples, schema=schema)
+            submitters.add(node_id)
+            self.central_registry.record_success(node_id)
+            UPDATES_TOTAL.inc(result='accepted')
+            UPDATE_STALENESS.observe(staleness)
+            logger.debug("Coordinator: Buffered async update from Node %s (version %s, staleness %s, %d/%d buffered).",
+                         node_id, version, staleness, len(self.async_buffer), self.async_buffer.buffer_size)
+            self._update_condition.notify_all()
             return True
 
+    def _async_publish_due(self):
+        """Caller holds _update_lock. Full buffer (capped at the number of live nodes) or buffer timeout."""
+        buffered = len(self.async_buffer)
+        if buffered == 0:
+            return False
+        required = min(self.async_buffer.buffer_size, max(len(self.central_registry.get_registered_nodes()), 1))
+        return buffered >= required or self.async_buffer.age() >= self.async_buffer_timeout
+
+    def publish_async_version(self):
+        """
+        Async mode: applies the buffered mean delta (scaled by ASYNC_SERVER_LEARNING_RATE) to the
+        current global model and publishes it as the next version. Returns the new model, or None.
+        """
+        with self._update_condition:
+            # Drain and publish atomically, so an update arriving meanwhile is based on the right version
+            if len(self.async_buffer) == 0:
+                return None
+            num_updates = len(self.async_buffer)
+            with PHASE_SECONDS.time(phase='aggregate'):
+                mean_delta, staleness = self.async_buffer.drain()
+                step = self.async_server_learning_rate
+                base_model = self.current_global_model
+                coef = dict(base_model['coef'])
+                for feature, delta in mean_delta['coef'].items():
+                    coef[feature] = coef.get(feature, 0.0) + step * delta
+                new_model = {'coef': coef, 'intercept': float(base_model['intercept']) + step * mean_delta['intercept']}
+
+            self.current_round += 1
+            self.current_global_model = new_model
+            self._model_versions[self.current_round] = new_model
+            oldest_kept = self.current_round - self.async_buffer.max_staleness
+            for version in [v for v in self._model_versions if v < oldest_kept]:
+                del self._model_versions[version]
+                self._version_delta_bases.pop(version, None)
+                self._version_submitters.pop(version, None)
+            self._update_condition.notify_all()  # Wakes nodes long-polling for this version
+        self._set_gauge(CURRENT_ROUND, self.current_round)
+        logger.info(f"Coordinator: Published model version {self.current_round} from {num_updates} buffered updates "
+                    f"(mean staleness {sum(staleness) / len(staleness):.2f}).")
+
+        if self.aggregator.central_evaluation:
+            with PHASE_SECONDS.time(phase='evaluate'):
+                logger.info(self.aggregator.test_accuracy(new_model))
+        self._commit_global_model(new_model)
+        return new_model
+
+    def run_async_training(self, num_versions):
+        """Async mode driver: publishes `num_versions` model versions as the buffer fills, then returns."""
+        target_version = self.current_round + num_versions
+        while self.current_round < target_version:
+            with self._update_condition:
+                while not self._async_publish_due():
+                    remaining = self.async_buffer_timeout - self.async_buffer.age()
+                    self._update_condition.wait(max(remaining, 0.01) if len(self.async_buffer) else self.async_buffer_timeout)
+            started = time.monotonic()
+            self.profiler.start_round(self.current_round + 1)
+            try:
+                with self.profiler.phase('aggregate'):
+                    self.publish_async_version()
+            finally:
+                self.profiler.end_round()
+            duration = time.monotonic() - started
+            self.last_round_timings = {'aggregate': duration}
+            self._completed_round_durations.append(duration)
+
+    def wait_for_version(self, min_version, timeout):
+        """Blocks up to `timeout` seconds until version `min_version` is published. Returns (version, model)."""
+        deadline = time.monotonic() + timeout
+        with self._update_condition:
+            while self.current_round < min_version:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._update_condition.wait(remaining)
+            return self.current_round, self.current_global_model
+
+    def global_model_message(self, node_id, version, model, include_schema=False):
+        """Encodes a model version for a node that pulls it (binary if the node accepts it). Returns (body, content type)."""
+        metadata = self._model_metadata(version)
+        if 'binary' not in self.node_wire_formats.get(node_id, ()):
+            return json.dumps(dict(metadata, global_model=model)).encode('utf-8'), JSON_CONTENT_TYPE
+        schema = self.model_codec.register_schema(model['coef'].keys())
+        known = schema in self._node_schemas.get(node_id, ())
+        body = self.model_codec.encode_model(model, metadata, include_schema=include_schema or not known)
+        self._node_schemas.setdefault(node_id, set()).add(schema)
+        return body, MODEL_CONTENT_TYPE
+
     def wait_for_local_updates(self, timeout=60):
-        print(f"\n[STEP 2: Waiting for Local Updates (Timeout: {timeout} seconds)]")
-        completed = self._round_completion_event.wait(timeout)
-        if not completed and len(self._received_updates_this_round) < self._updates_expected_count:
-            print("Coordinator: Timeout waiting for all local model updates. Proceeding with received updates.")
-        elif completed:
-            print("Coordinator: All expected local model updates received.")
+        """
+        Waits until every expected update arrived, or until a quorum has reported and the adaptive
+        straggler deadline has passed, or until `timeout` seconds after the round started.
+        """
+        logger.info(f"[STEP 2: Waiting for Local Updates (Timeout: {timeout} seconds)]")
+        slots = self._round_slots
+        with self._update_condition:
+            while True:
+                elapsed = time.monotonic() - self._round_started_at
+                if len(slots) >= self._updates_expected_count:
+                    logger.info("Coordinator: All expected local model updates received.")
+                    return
+                if elapsed >= timeout:
+                    logger.info("Coordinator: Timeout waiting for all local model updates. Proceeding with received updates.")
+                    return
+                wait_until = timeout
+                if self.round_scheduler.quorum_met(slots.filled_node_ids()):
+                    wait_until = self.round_scheduler.straggler_deadline(timeout)
+                    if elapsed >= wait_until:
+                        logger.info(f"Coordinator: Quorum reached ({len(slots)}/{self._updates_expected_count} updates). "
+                                    f"Straggler deadline of {wait_until:.2f}s passed. Proceeding without the remaining nodes.")
+                        return
+                self._update_condition.wait(wait_until - elapsed)
+
+    def _aggregate_batch(self):
+        """Aggregates the local models stored during the round. Returns None if there are none."""
+        self._round_slots.seal()  # Updates arriving from now on are late
+        models, sample_counts, partials = self._round_slots.models()
+        if partials:
+            return self._aggregate_with_partials(models, sample_counts, partials)
+        local_models_list = list(models.values())
+        if not local_models_list:
+            logger.info("Coordinator: No models to aggregate. Skipping aggregation.")
+            return None
+
+        weights = None
+        if self.aggregation_weighting == 'samples':
+            if len(sample_counts) == len(models):
+                weights = [sample_counts[node_id] for node_id in models]
+            else:
+                logger.warning("Coordinator: Some updates carry no sample count. Falling back to uniform averaging.")
+
+        return self.aggregator.aggregate_models(local_models_list, sample_counts=weights)
+
+    def _aggregate_with_partials(self, models, sample_counts, partials):
+        """Batch mode with relays: folds the directly received models and the relays' partial aggregates together."""
+        running_aggregate = RunningAggregate(weighted=self.aggregation_weighting == 'samples')
+        for node_id, model in models.items():
+            running_aggregate.add(model, num_samples=sample_counts.get(node_id))
+        for state in partials:
+            running_aggregate.merge_state(state)
+        return self.aggregator.aggregate_running(running_aggregate)
+
+    def _aggregate_incremental(self):
+        """Finalizes the running aggregates fed by receive_model_update. Returns None if they are empty."""
+        self._round_slots.seal()  # Late updates cannot change the aggregate being finalized
+        running_aggregate = self._round_slots.running_aggregate()
+        if running_aggregate.num_models == 0:
+            logger.info("Coordinator: No models to aggregate. Skipping aggregation.")
+            return None
+        return self.aggregator.aggregate_running(running_aggregate)
 
     def run_swarm_learning_round(self):
         self.current_round += 1
-        print(f"\n--- Coordinator: Starting Swarm Learning Round {self.current_round} ---")
+        self._set_gauge(CURRENT_ROUND, self.current_round)
+        JOB_ROUND.set(self.current_round, job=self.job_id)
+        logger.info(f"--- Coordinator: Starting Swarm Learning Round {self.current_round}"
+                    + (f" of job '{self.job_id}'" if self.job_id != DEFAULT_JOB else "") + " ---")
+        self.profiler.start_round(self.current_round)
+        try:
+            return self._run_round_steps()
+        finally:
+            self.profiler.end_round()
 
+    def _run_round_steps(self):
+        """Distribute, wait, aggregate and commit steps of run_swarm_learning_round."""
         registered_nodes = self.central_registry.get_registered_nodes()
         if not registered_nodes:
-            print("Coordinator: No nodes registered. Skipping round.")
+            logger.info("Coordinator: No nodes registered. Skipping round.")
             return
 
-        self.distribute_global_model()
-        self.wait_for_local_updates(timeout=60)  # Wait up to 60 seconds for updates
+        step_started = time.monotonic()
+        with self.profiler.phase('distribute'):
+            self.distribute_global_model()
+        timings = {'distribute': time.monotonic() - step_started}
+        PHASE_SECONDS.observe(timings['distribute'], phase='distribute')
+        step_started = time.monotonic()
+        with self.profiler.phase('wait'):
+            self.wait_for_local_updates(timeout=self.round_timeout)
+        timings['wait'] = time.monotonic() - step_started
+        PHASE_SECONDS.observe(timings['wait'], phase='wait')
+        self.last_round_timings = timings
 
         # --- STEP 3: Aggregation ---
-        print("\n[STEP 3: Aggregating received models]")
-        local_models_list = list(self._received_updates_this_round.values())
-        if not local_models_list:
-            print("Coordinator: No models to aggregate. Skipping aggregation.")
+        logger.info("[STEP 3: Aggregating received models]")
+        step_started = time.monotonic()
+        with self.profiler.phase('aggregate'):  # Includes the central evaluation (test set load and scoring)
+            if self.incremental_aggregation:
+                aggregated_model = self._aggregate_incremental()
+            else:
+                aggregated_model = self._aggregate_batch()
+        timings['aggregate'] = time.monotonic() - step_started
+        self._record_federated_evaluation()
+        if aggregated_model is None:
             return
 
-        aggregated_model = self.aggregator.aggregate_models(local_models_list)
         self.current_global_model = aggregated_model
-        print("Coordinator: Models aggregated successfully.")
+        logger.info("Coordinator: Models aggregated successfully.")
+        self._record_training_decision(aggregated_model)
+        with self.profiler.phase('commit'):
+            self._commit_global_model(aggregated_model)
+
+        round_duration = time.monotonic() - self._round_started_at
+        timings['total'] = round_duration
+        self._completed_round_durations.append(round_duration)
+        logger.info(f"--- Coordinator: Round {self.current_round} Complete in {round_duration:.2f}s "
+                    f"({self.rounds_per_hour():.1f} rounds/hour over the last rounds) ---")
+        return self.current_global_model
+
+    def _record_federated_evaluation(self):
+        """After aggregation: combines the nodes' scores of the model distributed this round (the previous round's)."""
+        if self.evaluation_mode == 'central':
+            return
+        evaluation = self._round_slots.evaluation()
+        if evaluation is None:
+            logger.info("Coordinator: No federated evaluation reports this round.")
+            return
+        evaluation['round'] = self._round_slots.round_num - 1  # Round whose aggregation produced the model
+        self.last_federated_evaluation = evaluation
+        self._set_gauge(FEDERATED_EVAL_MSE, evaluation['mse'])
+        self._set_gauge(FEDERATED_EVAL_SAMPLES, evaluation['samples'])
+        r2 = f"{evaluation['r2']:.4f}" if evaluation['r2'] is not None else "n/a"
+        logger.info(f"Coordinator: Federated evaluation of the round {evaluation['round']} global model on "
+                    f"{evaluation['nodes']} nodes / {evaluation['samples']} held-out samples: "
+                    f"MSE={evaluation['mse']}, MAE={evaluation['mae']}, R2={r2}")
+
+    def _record_training_decision(self, aggregated_model):
+        """Feeds the round's model change, loss and update spread to the TrainingController."""
+        slots = self._round_slots
+        delta_norm, model_norm = model_delta_norm(aggregated_model, slots.base_model)
+        update_count, update_sq_norm_sum, samples = slots.update_stats()
+        if self.aggregator.central_evaluation:
+            loss = self.aggregator.last_test_mse  # Of the model just aggregated
+        else:
+            # Nodes scored the model distributed this round, so the loss lags the model by one round
+            loss = (self.last_federated_evaluation or {}).get('mse')
+            if (self.last_federated_evaluation or {}).get('round') != self.current_round - 1:
+                loss = None
+        decision = self.training_controller.record_round(
+            self.current_round, delta_norm, model_norm, loss=loss, update_count=update_count,
+            update_sq_norm_sum=update_sq_norm_sum, samples=samples)
+        if decision['relative_delta'] is not None:
+            self._set_gauge(RELATIVE_DELTA, decision['relative_delta'])
+        self._set_gauge(LEARNING_RATE, decision['next_learning_rate'])
+        def fmt(value):
+            return f"{value:.4g}" if value is not None else "n/a"
+        job = f"Job '{self.job_id}' round" if self.job_id != DEFAULT_JOB else "Round"
+        logger.info(f"Coordinator: {job} {self.current_round} model change {delta_norm:.4g} "
+                    f"(relative {fmt(decision['relative_delta'])}), loss {fmt(loss)}, "
+                    f"update spread {fmt(decision['update_spread'])}"
+                    + (f". Stopping training: {decision['reason']}." if decision['stop'] else "."))
 
+    def _commit_global_model(self, aggregated_model):
+        """Queues the aggregation hash for the ledger and the checkpoint of the current round/version."""
         # --- STEP 4: Record Aggregation Hash (Now using the BlockchainClientSDK) ---
-        aggregated_model_json = json.dumps(aggregated_model, sort_keys=True).encode('utf-8')
-        aggregation_hash = hashlib.sha256(aggregated_model_json).hexdigest()
-        
-        print(f"\n[STEP 4: Recording Aggregation Hash]")
-        try:
-            self.blockchain_client.record_aggregation_hash(
-                round_num=self.current_round, 
-                model_hash=aggregation_hash,
-                aggregated_by=self.coordinator_id 
-            )
-            print(f"Coordinator: Aggregation hash recorded on blockchain for round {self.current_round}.")
-        except Exception as e:
-            print(f"Coordinator: ERROR recording aggregation hash on blockchain: {e}")
-        
-        # --- Save the model after each round to a volume ---
-        model_save_dir = "/app/models"  # Mounted via Docker volume
-        os.makedirs(model_save_dir, exist_ok=True)
-        model_filename = f"global_model_round_{self.current_round}.json"
-        model_filepath = os.path.join(model_save_dir, model_filename)
+        with PHASE_SECONDS.time(phase='hash'):
+            aggregation_hash = model_hash(aggregated_model)
         
+        logger.info(f"[STEP 4: Recording Aggregation Hash]")
+        if self.job_id != DEFAULT_JOB:
+            # Ledger records are keyed by round number alone, so they track the default job's models
+            logger.info(f"Coordinator: Job '{self.job_id}' round {self.current_round} hash {aggregation_hash} "
+                        f"is checkpointed but not recorded on the ledger.")
+        else:
+            self._submit_aggregation_hash(aggregation_hash)
+
+        # --- Save the model after each round to a volume and S3 (in the background) ---
+        self.checkpoint_persister.submit(self.current_round, self.current_global_model,
+                                         metrics={'test_mse': self.aggregator.last_test_mse})
+        persist_stats = self.checkpoint_persister.stats()
+        logger.info(f"Coordinator: Checkpoint for round {self.current_round} queued "
+                    f"(pending={persist_stats['pending']}, persist lag={persist_stats['persist_lag_seconds']:.3f}s).")
+
+    def _submit_aggregation_hash(self, aggregation_hash):
+        self.ledger_writer.submit(
+            round_num=self.current_round, 
+            model_hash=aggregation_hash,
+            aggregated_by=self.coordinator_id 
+        )
+        ledger_stats = self.ledger_writer.stats()
+        logger.info(f"Coordinator: Aggregation hash for round {self.current_round} queued for the blockchain "
+                    f"(pending={ledger_stats['pending']}, commit latency p50={ledger_stats['commit_latency_p50_seconds']:.3f}s).")
+
+    def rounds_per_hour(self, window=10) -> float:
+        """Throughput over the last `window` completed rounds."""
+        recent = self._completed_round_durations[-window:]
+        if not recent:
+            return 0.0
+        return 3600.0 * len(recent) / sum(recent)
+
+    # --- Request handlers shared by the Flask app and the asyncio ingestion server ---
+    def handle_registration(self, data):
+        """Handles a node's /register request body. Returns (response dict, HTTP status)."""
+        if not isinstance(data, dict):
+            return {"status": "failure", "message": "Expected a JSON object"}, 400
+        node_id = data.get('node_id')
+        endpoint_url = data.get('endpoint_url')
+        wire_formats = data.get('wire_formats')  # Encodings the node accepts for global models
+
+        if not node_id or not endpoint_url:
+            return {"status": "failure", "message": "Missing node_id or endpoint_url"}, 400
+
+        if self.register_node(node_id, endpoint_url, wire_formats=wire_formats):
+            response = {"status": "success", "message": f"Node {node_id} registered.",
+                        "wire_formats": SUPPORTED_WIRE_FORMATS,
+                        "federation_mode": self.federation_mode,
+                        "evaluation_mode": self.evaluation_mode}
+            # Relays pre-aggregate per round, so async-mode nodes always submit to the Coordinator
+            group, submit_endpoint = (None, None)
+            if self.federation_mode != 'async':
+                group, submit_endpoint = self.central_registry.assign_group(node_id)
+            if submit_endpoint:
+                response.update(group=group, submit_endpoint=submit_endpoint)  # Updates go to the group's relay
+            return response, 200
+        return {"status": "failure", "message": f"Node {node_id} already registered or failed."}, 400
+
+    def handle_model_update(self, mimetype, body):
+        """
+        Handles a /submit_model_update request (binary model message or JSON body): decodes it and
+        passes it to receive_model_update. Returns (response dict, HTTP status).
+        """
+        with self.profiler.phase('receive'):
+            return self._handle_model_update(mimetype, body)
+
+    def _handle_model_update(self, mimetype, body):
+        PAYLOAD_BYTES_TOTAL.inc(len(body), direction='received')
+        if mimetype == MODEL_CONTENT_TYPE:
+            try:
+                local_model = self.model_codec.decode(body)
+            except UnknownSchemaError as e:
+                # Tells the node to resend the update including its feature names
+                UPDATES_TOTAL.inc(result='unknown_schema')
+                return {"status": "failure", "message": str(e)}, 409
+            except ValueError as e:
+                UPDATES_TOTAL.inc(result='rejected')
+                return {"status": "failure", "message": f"Invalid model message: {e}"}, 400
+            data = local_model.metadata
+        else:
+            try:
+                data = json.loads(body)
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                UPDATES_TOTAL.inc(result='rejected')
+                return {"status": "failure", "message": "Expected a JSON object"}, 400
+            local_model = data.get('local_model')
+        node_id = data.get('node_id')
+        round_num = data.get('round_num')
+        num_samples = data.get('num_samples')
+
+        if not node_id or round_num is None or not local_model:
+            UPDATES_TOTAL.inc(result='rejected')
+            return {"status": "failure", "message": "Missing node_id, round_num, or local_model"}, 400
         try:
-            with open(model_filepath, 'w') as f:
-                json.dump(self.current_global_model, f)
-            print(f"Coordinator: Global model for round {self.current_round} saved to {model_filepath}")
-            
-            # Lưu mô hình lên S3
-            s3_bucket_name = os.environ.get('S3_BUCKET_NAME', 'durian-bucket-titan')
-            s3_key = f"models/global_model_round_{self.current_round}.json"
-            s3 = boto3.client('s3')
-            s3.upload_file(model_filepath, s3_bucket_name, s3_key)
-            print(f"Coordinator: Global model for round {self.current_round} uploaded to S3://{s3_bucket_name}/{s3_key}")
-        except Exception as e:
-            print(f"Coordinator: ERROR saving model for round {self.current_round}: {e}")
-
-        print(f"--- Coordinator: Round {self.current_round} Complete ---")
-        return self.current_global_model
+            validate_model(local_model)
+        except ValueError as e:
+            UPDATES_TOTAL.inc(result='rejected')
+            return {"status": "failure", "message": f"Invalid local_model: {e}"}, 400
+        if num_samples is not None and (not isinstance(num_samples, int) or isinstance(num_samples, bool)
+                                        or num_samples < 0):
+            # Checked before the update claims its slot: it feeds the round's weights and sample totals
+            UPDATES_TOTAL.inc(result='rejected')
+            return {"status": "failure", "message": "'num_samples' must be a non-negative integer"}, 400
+        job = self.jobs.get(data.get('job_id') or DEFAULT_JOB)
+        if job is None:
+            UPDATES_TOTAL.inc(result='rejected')
+            return {"status": "failure", "message": f"Unknown job {data.get('job_id')!r}"}, 404
+
+        if job.receive_model_update(node_id, round_num, local_model, num_samples=num_samples,
+                                     evaluation=data.get('evaluation')):
+            return {"status": "success", "message": f"Model update from {node_id} received for round {round_num}."}, 200
+        return {"status": "failure", "message": f"Failed to process update from {node_id} for round {round_num}."}, 400
 
 
 # --- Flask Application Setup ---
@@ -176,56 +1005,196 @@ Coordinator.instance = None  # Will be set in if __name__ == '__main__'
 @app.route('/register', methods=['POST'])
 def register():
     """Endpoint for nodes to register with the Coordinator."""
-    data = request.get_json()
-    node_id = data.get('node_id')
+    response, status = Coordinator.instance.handle_registration(request.get_json(silent=True))
+    return jsonify(response), status
+
+@app.route('/register_relay', methods=['POST'])
+def register_relay():
+    """Endpoint for sub-aggregators (relays) to register with the Coordinator."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"status": "failure", "message": "Expected a JSON object"}), 400
+    relay_id = data.get('relay_id')
     endpoint_url = data.get('endpoint_url')
-    
-    if not node_id or not endpoint_url:
-        return jsonify({"status": "failure", "message": "Missing node_id or endpoint_url"}), 400
+    if not relay_id or not endpoint_url:
+        return jsonify({"status": "failure", "message": "Missing relay_id or endpoint_url"}), 400
 
-    if Coordinator.instance.register_node(node_id, endpoint_url):
-        return jsonify({"status": "success", "message": f"Node {node_id} registered."}), 200
-    return jsonify({"status": "failure", "message": f"Node {node_id} already registered or failed."}), 400
+    Coordinator.instance.register_relay(relay_id, endpoint_url, wire_formats=data.get('wire_formats'))
+    return jsonify({"status": "success", "message": f"Relay {relay_id} registered.",
+                    "wire_formats": SUPPORTED_WIRE_FORMATS}), 200
+
+@app.route('/submit_partial_aggregate', methods=['POST'])
+def submit_partial_aggregate():
+    """Endpoint for relays to forward the pre-aggregated updates of their group."""
+    PAYLOAD_BYTES_TOTAL.inc(request.content_length or 0, direction='received')
+    if request.mimetype != PARTIAL_AGGREGATE_CONTENT_TYPE:
+        return jsonify({"status": "failure", "message": f"Expected {PARTIAL_AGGREGATE_CONTENT_TYPE}"}), 415
+    try:
+        state, metadata = decode_partial_aggregate(request.get_data())
+    except ValueError as e:
+        return jsonify({"status": "failure", "message": str(e)}), 400
+    relay_id = metadata.get('relay_id')
+    round_num = metadata.get('round_num')
+    node_samples = metadata.get('node_samples')
+    if not relay_id or round_num is None or not node_samples:
+        return jsonify({"status": "failure", "message": "Missing relay_id, round_num, or node_samples"}), 400
+
+    with Coordinator.instance.profiler.phase('receive_partial'):
+        accepted = Coordinator.instance.receive_partial_aggregate(relay_id, round_num, state, node_samples,
+                                                                  evaluation=metadata.get('evaluation'))
+    if accepted:
+        return jsonify({"status": "success", "message": f"Partial aggregate from {relay_id} received for round {round_num}."}), 200
+    return jsonify({"status": "failure", "message": f"Failed to process partial aggregate from {relay_id} for round {round_num}."}), 400
 
 @app.route('/submit_model_update', methods=['POST'])
 def submit_model_update():
-    """Endpoint for nodes to submit their local model updates."""
-    data = request.get_json()
+    """Endpoint for nodes to submit their local model updates (binary model message or JSON)."""
+    response, status = Coordinator.instance.handle_model_update(request.mimetype, request.get_data())
+    return jsonify(response), status
+
+@app.route('/global_model', methods=['GET'])
+def global_model():
+    """
+    Endpoint for nodes to pull the latest global model (async mode). With `min_version`, it waits up
+    to `wait` seconds (long poll) for that version; the latest model is returned either way.
+    """
+    coordinator = Coordinator.instance
+    node_id = request.args.get('node_id')
+    min_version = request.args.get('min_version', 0, type=int)
+    wait = min(request.args.get('wait', 0.0, type=float), MAX_PULL_WAIT)
+    version, model = coordinator.wait_for_version(min_version, wait)
+    body, content_type = coordinator.global_model_message(node_id, version, model,
+                                                          include_schema=request.args.get('full') == '1')
+    PAYLOAD_BYTES_TOTAL.inc(len(body), direction='sent')
+    return Response(body, content_type=content_type)
+
+@app.route('/heartbeat', methods=['POST'])
+def heartbeat():
+    """Endpoint for nodes to renew their liveness lease."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"status": "failure", "message": "Expected a JSON object"}), 400
     node_id = data.get('node_id')
-    round_num = data.get('round_num')
-    local_model = data.get('local_model')
-
-    if not node_id or round_num is None or not local_model:
-        return jsonify({"status": "failure", "message": "Missing node_id, round_num, or local_model"}), 400
-
-    if Coordinator.instance.receive_model_update(node_id, round_num, local_model):
-        return jsonify({"status": "success", "message": f"Model update from {node_id} received for round {round_num}."}), 200
-    return jsonify({"status": "failure", "message": f"Failed to process update from {node_id} for round {round_num}."}), 400
-
-def start_training_rounds():
-    """Function to continuously run swarm learning rounds."""
-    MAX_ROUNDS = 5
-    round_count = 0
-    while round_count < MAX_ROUNDS:
-        time.sleep(5)  # Wait a bit before starting the next round
-        if Coordinator.instance.central_registry.get_registered_nodes():
-            Coordinator.instance.run_swarm_learning_round()
-            round_count += 1
-        else:
-            print("Coordinator: No nodes registered. Waiting for registrations...")
-            time.sleep(10)  # Wait longer if no nodes are registered
-    print(f'Coordinator: Training completed after {MAX_ROUNDS} rounds.')
+    if not node_id:
+        return jsonify({"status": "failure", "message": "Missing node_id"}), 400
+
+    if Coordinator.instance.central_registry.heartbeat(node_id):
+        return jsonify({"status": "success"}), 200
+    return jsonify({"status": "failure", "message": f"Node {node_id} is not registered."}), 404
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint: phase histograms, update/delivery counters and payload bytes."""
+    return Response(METRICS.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/admin/profile', methods=['GET', 'POST'])
+def admin_profile():
+    """
+    GET: profiler status. POST {"rounds": N}: captures call stacks and allocations of the next N rounds
+    into PROFILE_DIR (0 cancels pending captures). `?job=<job_id>` selects a training job's rounds.
+    """
+    job = Coordinator.instance.jobs.get(request.args.get('job', DEFAULT_JOB))
+    if job is None:
+        return jsonify({"status": "failure", "message": f"Unknown job {request.args.get('job')!r}"}), 404
+    profiler = job.profiler
+    if request.method == 'GET':
+        return jsonify(profiler.status()), 200
+    rounds = (request.get_json(silent=True) or {}).get('rounds', 1)
+    if not isinstance(rounds, int) or rounds < 0:
+        return jsonify({"status": "failure", "message": "'rounds' must be a non-negative integer"}), 400
+    return jsonify(profiler.arm(rounds)), 200
+
+@app.route('/jobs', methods=['GET', 'POST'])
+def jobs():
+    """
+    GET: status of every training job. POST {"job_id": ..., <JOB_SETTINGS>}: creates a training job
+    over the registered nodes and starts its rounds, concurrently with the running jobs.
+    """
+    coordinator = Coordinator.instance
+    if request.method == 'GET':
+        return jsonify({job_id: job.job_status() for job_id, job in list(coordinator.jobs.items())}), 200
+    settings = request.get_json(silent=True)
+    if not isinstance(settings, dict):
+        return jsonify({"status": "failure", "message": "Expected a JSON object"}), 400
+    settings = dict(settings)
+    job_id = settings.pop('job_id', None)
+    try:
+        job = coordinator.add_job(job_id, settings)
+    except ValueError as e:
+        return jsonify({"status": "failure", "message": str(e)}), 400
+    start_training_thread(job)
+    return jsonify(job.job_status()), 201
+
+def start_training_thread(coordinator=None):
+    training_thread = threading.Thread(target=start_training_rounds, args=(coordinator,))
+    training_thread.daemon = True  # Allow the main program to exit even if this thread is running
+    training_thread.start()
+    return training_thread
+
+def start_training_rounds(coordinator=None):
+    """
+    Runs swarm learning rounds of a training job (the default job if None) until its TrainingController
+    stops training (convergence, target loss, patience or MAX_ROUNDS; the round number continues
+    from a resumed checkpoint).
+    """
+    ROUND_INTERVAL = float(os.environ.get('ROUND_INTERVAL', 0))
+    coordinator = coordinator or Coordinator.instance
+    controller = coordinator.training_controller
+    if coordinator.federation_mode == 'async':
+        # No rounds: a version is published whenever enough updates are buffered; only MAX_ROUNDS applies
+        target_version = controller.max_rounds * int(os.environ.get('ASYNC_VERSIONS_PER_ROUND', 1))
+        coordinator.run_async_training(max(target_version - coordinator.current_round, 0))
+    else:
+        while not controller.should_stop(coordinator.current_round):
+            time.sleep(ROUND_INTERVAL)  # Optional pause before the next round (0 = start immediately)
+            if coordinator.central_registry.get_registered_nodes():
+                coordinator.run_swarm_learning_round()
+            else:
+                logger.warning("Coordinator: No nodes registered. Waiting for registrations...")
+                time.sleep(10)  # Wait longer if no nodes are registered
+    coordinator.checkpoint_persister.flush()  # Make sure the last checkpoints are written
+    coordinator.ledger_writer.flush()  # ...and the last aggregation hashes are committed
+    logger.info(f'Coordinator: Training of job {coordinator.job_id!r} completed after round {coordinator.current_round} '
+                f'({controller.stop_reason or "max_rounds"}, {controller.cumulative_samples} training samples).')
 
 if __name__ == '__main__':
+    # LOG_LEVEL=DEBUG shows per-update and per-registration events; INFO keeps to per-round lines
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+                        format='%(asctime)s %(levelname)s %(message)s')
     COORDINATOR_ID = os.environ.get('COORDINATOR_ID', 'coordinator-default')
     
     # Initialize the Coordinator instance and make it globally accessible for Flask routes
     Coordinator.instance = Coordinator(COORDINATOR_ID)
 
-    # Start a separate thread for running the training rounds
-    training_thread = threading.Thread(target=start_training_rounds)
-    training_thread.daemon = True  # Allow the main program to exit even if this thread is running
-    training_thread.start()
+    # Create the jobs listed in TRAINING_JOBS (a JSON list of {"job_id": ..., <JOB_SETTINGS>} objects,
+    # e.g. a learning-rate sweep) before any training starts, so a bad spec stops startup cleanly
+    jobs = []
+    try:
+        job_specs = json.loads(os.environ.get('TRAINING_JOBS') or '[]')
+        if not isinstance(job_specs, list):
+            raise ValueError("expected a JSON list of job objects")
+        for index, job_settings in enumerate(job_specs):
+            if not isinstance(job_settings, dict):
+                raise ValueError(f"entry {index} is not a JSON object")
+            job_settings = dict(job_settings)
+            jobs.append(Coordinator.instance.add_job(job_settings.pop('job_id', None), job_settings))
+    except ValueError as e:
+        logger.error(f"Coordinator {COORDINATOR_ID}: Invalid TRAINING_JOBS: {e}")
+        raise SystemExit(1)
+
+    # Start a separate thread for running the training rounds, and one per job
+    start_training_thread()
+    for job in jobs:
+        start_training_thread(job)
 
-    # Run the Flask application
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    if os.environ.get('COORDINATOR_SERVER', 'flask') == 'asyncio':
+        # asyncio front end for update bursts; the Flask app still serves the other routes behind it
+        from ingest_server import IngestServer
+        IngestServer(
+            Coordinator.instance, app,
+            max_pending=int(os.environ.get('INGEST_MAX_PENDING', 2048)),
+            parse_workers=int(os.environ.get('INGEST_PARSE_WORKERS', 8)),
+        ).run(host='0.0.0.0', port=5000)
+    else:
+        # Run the Flask application
+        app.run(host='0.0.0.0', port=5000, debug=False)
@@ -0,0 +1,130 @@
+# coordinator/ingest_server.py
+
+import asyncio
+import json
+import logging
+import math
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+from shared_libs.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# Ingestion metrics, served with the Coordinator's other metrics on /metrics
+INGEST_PENDING = METRICS.gauge(
+    'swarm_coordinator_ingest_pending', 'Admitted /register and /submit_model_update requests not answered yet')
+INGEST_SHED_TOTAL = METRICS.counter(
+    'swarm_coordinator_ingest_shed_total', 'Requests answered 503 + Retry-After by admission control', ['route'])
+INGEST_ACK_SECONDS = METRICS.histogram(
+    'swarm_coordinator_ingest_ack_seconds', 'Time from receiving a request to acknowledging it', ['route'])
+
+
+class IngestServer:
+    """
+    asyncio (aiohttp) front end of the Coordinator for update bursts.
+    /register and /submit_model_update are read on the event loop, then decoded and handed to the
+    Coordinator in a bounded pool of `parse_workers` threads, so hundreds of concurrent uploads
+    never block the loop and the Coordinator semantics (Coordinator.handle_registration and
+    handle_model_update) stay those of the Flask app. At most `max_pending` such requests are in
+    flight; beyond that the server answers 503 with a Retry-After hint derived from the current
+    drain rate. Every other route is served by the Flask app (`wsgi_app`) in a worker thread.
+    """
+    def __init__(self, coordinator, wsgi_app, max_pending=2048, parse_workers=8, max_body_bytes=64 * 1024 * 1024,
+                 wsgi_workers=32):
+        self.coordinator = coordinator
+        self.wsgi_app = wsgi_app
+        self.max_pending = max_pending
+        self.max_body_bytes = max_body_bytes
+        self._parse_pool = ThreadPoolExecutor(max_workers=parse_workers, thread_name_prefix="ingest-parse")
+        # Separate pool: /global_model long polls must not occupy the threads that parse updates
+        self._wsgi_pool = ThreadPoolExecutor(max_workers=wsgi_workers, thread_name_prefix="ingest-wsgi")
+        self._pending = 0  # Only touched on the event loop, so no lock is needed
+        self._completions = deque(maxlen=256)  # Monotonic times of recent acknowledgements (drain rate)
+
+    def _retry_after(self) -> int:
+        """Seconds until the current backlog has likely drained, from the recent acknowledgement rate."""
+        if len(self._completions) >= 2:
+            span = self._completions[-1] - self._completions[0]
+            rate = (len(self._completions) - 1) / span if span > 0 else float('inf')
+        else:
+            rate = 0.0
+        if rate <= 0:
+            return 5
+        return min(max(math.ceil(self._pending / rate), 1), 30)
+
+    async def _ingest(self, request, route, handler):
+        """Admission control + off-loop handling shared by the two ingestion routes."""
+        started = time.monotonic()
+        if self._pending >= self.max_pending:
+            INGEST_SHED_TOTAL.inc(route=route)
+            return web.json_response({"status": "failure", "message": "Coordinator busy, retry later."},
+                                     status=503, headers={'Retry-After': str(self._retry_after())})
+        if request.content_length is not None and request.content_length > self.max_body_bytes:
+            return web.json_response({"status": "failure", "message": "Request body too large."}, status=413)
+
+        self._pending += 1
+        INGEST_PENDING.set(self._pending)
+        try:
+            body = await request.read()  # Network I/O stays on the loop; decoding does not
+            loop = asyncio.get_running_loop()
+            response, status = await loop.run_in_executor(self._parse_pool, handler, request.content_type, body)
+        finally:
+            self._pending -= 1
+            INGEST_PENDING.set(self._pending)
+        self._completions.append(time.monotonic())
+        INGEST_ACK_SECONDS.observe(time.monotonic() - started, route=route)
+        return web.json_response(response, status=status)
+
+    def _register(self, content_type, body):
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        return self.coordinator.handle_registration(data)
+
+    async def register(self, request):
+        return await self._ingest(request, 'register', self._register)
+
+    async def submit_model_update(self, request):
+        return await self._ingest(request, 'submit_model_update', self.coordinator.handle_model_update)
+
+    def _call_wsgi(self, method, path, query_string, headers, body):
+        environ = EnvironBuilder(path=path, method=method, query_string=query_string,
+                                 headers=headers, data=body).get_environ()
+        app_iter, status, response_headers = run_wsgi_app(self.wsgi_app, environ, buffered=True)
+        try:
+            return int(status.split(' ', 1)[0]), list(response_headers.items()), b"".join(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+    async def forward_to_wsgi(self, request):
+        """Serves the remaining routes (relays, heartbeats, /global_model, /metrics) with the Flask app."""
+        body = await request.read()
+        headers = [(name, value) for name, value in request.headers.items()
+                   if name.lower() not in ('host', 'content-length')]
+        loop = asyncio.get_running_loop()
+        status, headers, data = await loop.run_in_executor(
+            self._wsgi_pool, self._call_wsgi, request.method, request.path, request.query_string, headers, body)
+        response = web.Response(status=status, body=data)
+        for name, value in headers:
+            if name.lower() not in ('content-length', 'transfer-encoding', 'connection'):
+                response.headers[name] = value
+        return response
+
+    def make_app(self) -> web.Application:
+        application = web.Application(client_max_size=self.max_body_bytes)
+        application.router.add_post('/register', self.register)
+        application.router.add_post('/submit_model_update', self.submit_model_update)
+        application.router.add_route('*', '/{tail:.*}', self.forward_to_wsgi)
+        return application
+
+    def run(self, host='0.0.0.0', port=5000):
+        logger.info(f"Coordinator: Asyncio ingestion server listening on {host}:{port} "
+                    f"(max_pending={self.max_pending}).")
+        web.run_app(self.make_app(), host=host, port=port, backlog=max(self.max_pending, 128), print=None)
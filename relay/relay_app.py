@@ -0,0 +1,307 @@
+import requests
+import time
+import os
+import json
+import logging
+import threading
+
+from flask import Flask, Response, request, jsonify
+
+from shared_libs.aggregator import RunningAggregate
+from shared_libs.federated_eval import EvaluationAggregate
+from shared_libs.metrics import METRICS, METRICS_CONTENT_TYPE
+from shared_libs.model_codec import (ModelCodec, ModelPayload, UnknownSchemaError, apply_delta,
+                                     encode_partial_aggregate, MODEL_CONTENT_TYPE,
+                                     PARTIAL_AGGREGATE_CONTENT_TYPE, SUPPORTED_WIRE_FORMATS, validate_model)
+
+app = Flask(__name__)
+logger = logging.getLogger(__name__)
+
+# Relay metrics, served in Prometheus text format on /metrics
+UPDATES_TOTAL = METRICS.counter('swarm_relay_updates_total', 'Node updates received by the relay by outcome', ['result'])
+FORWARDS_TOTAL = METRICS.counter('swarm_relay_forwards_total', 'Partial aggregates forwarded upstream by outcome', ['result'])
+FORWARD_SECONDS = METRICS.histogram('swarm_relay_forward_seconds', 'Time to encode and forward one partial aggregate')
+PAYLOAD_BYTES_TOTAL = METRICS.counter(
+    'swarm_relay_payload_bytes_total', 'Payload bytes received from nodes or forwarded upstream', ['direction'])
+
+
+class SubAggregator:
+    """
+    Relay between a group of Swarm Nodes and the Coordinator (hierarchical aggregation).
+    It receives the round's global model from the Coordinator, accepts the group's local updates
+    (full or delta, binary or JSON) and folds them into a RunningAggregate. Once the whole group has
+    reported, or `flush_interval` seconds after the first pending update, the partial aggregate
+    (per-feature sums and counts, not an average) is forwarded upstream as one message, so the
+    Coordinator merges one message per group instead of one per node and the result equals flat aggregation.
+    """
+    instance = None
+
+    def __init__(self, relay_id, coordinator_endpoint):
+        self.relay_id = relay_id
+        self.coordinator_endpoint = coordinator_endpoint
+        self.endpoint_url = f"http://{os.environ.get('HOSTNAME', 'localhost')}:{os.environ.get('RELAY_PORT', '5000')}"
+        self.flush_interval = float(os.environ.get('RELAY_FLUSH_INTERVAL', 0.5))
+        # Extra attempts for a forward that fails on a connection error or 5xx; after the last one the
+        # updates are put back and resent by the next flush
+        self.forward_retries = int(os.environ.get('RELAY_FORWARD_RETRIES', 2))
+        self.model_codec = ModelCodec(
+            dtype=os.environ.get('WIRE_DTYPE', 'float64'),
+            compression=os.environ.get('WIRE_COMPRESSION') or None,
+        )
+        self.http = requests.Session()  # Keep-alive session to the Coordinator
+
+        self.current_round = 0
+        self._base_model = None  # Global model of the current round; delta updates apply to it
+        self._delta_bases = {}  # schema hash -> base vector (current round)
+        self._group_size = 0  # Group members that received this round's model
+        # Weighted sums are always kept; the Coordinator decides between uniform and sample weighting
+        self._aggregate = RunningAggregate(weighted=True)
+        self._evaluation = EvaluationAggregate()  # Summed evaluation reports of the pending updates
+        self._pending_samples = {}  # node_id -> num_samples of updates not forwarded yet
+        self._forwarded_ids = set()  # Nodes of this round whose updates were already forwarded
+        self._flush_timer = None
+        self._lock = threading.Lock()  # Protects the per-round state above
+        logger.info(f"Relay '{self.relay_id}' initialized (flush interval {self.flush_interval}s).")
+
+    def accept_model_update(self, mimetype, body):
+        """Starts a new round from the Coordinator's global model. Returns (response dict, HTTP status code)."""
+        if mimetype == MODEL_CONTENT_TYPE:
+            try:
+                payload = self.model_codec.decode(body)
+            except UnknownSchemaError as e:
+                return {"status": "error", "message": str(e)}, 409
+            except ValueError as e:
+                return {"status": "error", "message": f"Invalid model message: {e}"}, 400
+            global_model = payload.to_model()
+            metadata = payload.metadata
+        else:
+            try:
+                metadata = json.loads(body)
+            except ValueError:
+                metadata = None
+            if not isinstance(metadata, dict):
+                return {"status": "error", "message": "Expected a JSON object"}, 400
+            global_model = metadata.get('global_model')
+        round_num = metadata.get('round_num')
+        if round_num is None or not isinstance(global_model, dict):
+            return {"status": "error", "message": "Missing 'round_num' or 'global_model'"}, 400
+
+        with self._lock:
+            self.current_round = round_num
+            self._base_model = global_model
+            self._delta_bases = {}
+            self._group_size = int(metadata.get('group_size', 0))
+            if self._pending_samples:
+                logger.warning("Relay %s: Dropping %d unforwarded updates of the previous round.",
+                               self.relay_id, len(self._pending_samples))
+            self._aggregate.reset()
+            self._evaluation.reset()
+            self._pending_samples = {}
+            self._forwarded_ids = set()
+            self._cancel_flush_timer()
+        logger.info(f"Relay {self.relay_id}: Round {round_num} started for a group of {self._group_size} nodes.")
+        return {"status": "success"}, 200
+
+    def receive_model_update(self, node_id, round_num, local_model, num_samples=None, evaluation=None):
+        """
+        Folds one node update into the group's partial aggregate (same rules as the Coordinator), and
+        its evaluation statistics, if any, into the group's evaluation sums.
+        """
+        with self._lock:
+            if round_num != self.current_round or self._base_model is None:
+                UPDATES_TOTAL.inc(result='out_of_round')
+                logger.debug("Relay %s: Out-of-round update from %s (Expected %s, Got %s). Ignoring.",
+                             self.relay_id, node_id, self.current_round, round_num)
+                return False
+            if node_id in self._pending_samples or node_id in self._forwarded_ids:
+                UPDATES_TOTAL.inc(result='duplicate')
+                return False
+
+            if isinstance(local_model, ModelPayload):
+                if local_model.is_delta:
+                    local_model = apply_delta(local_model, self._base_model, self._delta_bases)
+                self._aggregate.add_arrays(local_model.feature_names, local_model.values, local_model.intercept,
+                                           num_samples, schema=local_model.schema)
+            else:
+                self._aggregate.add(local_model, num_samples=num_samples)
+            if evaluation is not None:
+                try:
+                    self._evaluation.add(evaluation)
+                except ValueError as e:
+                    logger.warning(f"Relay {self.relay_id}: Ignoring evaluation from {node_id}: {e}")
+            self._pending_samples[node_id] = num_samples
+            UPDATES_TOTAL.inc(result='accepted')
+
+            group_complete = len(self._pending_samples) + len(self._forwarded_ids) >= self._group_size
+            if not group_complete and self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.flush_interval, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        if group_complete:
+            self.flush()
+        return True
+
+    def accept_node_update(self, mimetype, body):
+        """Decodes a node's /submit_model_update request and folds it in. Returns (response dict, HTTP status code)."""
+        PAYLOAD_BYTES_TOTAL.inc(len(body), direction='received')
+        if mimetype == MODEL_CONTENT_TYPE:
+            try:
+                local_model = self.model_codec.decode(body)
+            except UnknownSchemaError as e:
+                UPDATES_TOTAL.inc(result='unknown_schema')
+                return {"status": "failure", "message": str(e)}, 409
+            except ValueError as e:
+                UPDATES_TOTAL.inc(result='rejected')
+                return {"status": "failure", "message": f"Invalid model message: {e}"}, 400
+            data = local_model.metadata
+        else:
+            try:
+                data = json.loads(body)
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                UPDATES_TOTAL.inc(result='rejected')
+                return {"status": "failure", "message": "Expected a JSON object"}, 400
+            local_model = data.get('local_model')
+        node_id = data.get('node_id')
+        round_num = data.get('round_num')
+        num_samples = data.get('num_samples')
+
+        if not node_id or round_num is None or not local_model:
+            UPDATES_TOTAL.inc(result='rejected')
+            return {"status": "failure", "message": "Missing node_id, round_num, or local_model"}, 400
+        try:
+            validate_model(local_model)
+        except ValueError as e:
+            UPDATES_TOTAL.inc(result='rejected')
+            return {"status": "failure", "message": f"Invalid local_model: {e}"}, 400
+        if num_samples is not None and (not isinstance(num_samples, int) or isinstance(num_samples, bool)
+                                        or num_samples < 0):
+            UPDATES_TOTAL.inc(result='rejected')
+            return {"status": "failure", "message": "'num_samples' must be a non-negative integer"}, 400
+
+        if self.receive_model_update(node_id, round_num, local_model, num_samples=num_samples,
+                                     evaluation=data.get('evaluation')):
+            return {"status": "success", "message": f"Model update from {node_id} received for round {round_num}."}, 200
+        return {"status": "failure", "message": f"Failed to process update from {node_id} for round {round_num}."}, 400
+
+    def _cancel_flush_timer(self):
+        """Caller holds _lock."""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+
+    def flush(self):
+        """
+        Forwards the pending partial aggregate to the Coordinator (no-op if nothing is pending).
+        If the Coordinator cannot be reached, the updates are restored for the next flush, so updates
+        the nodes were already told were received are not lost.
+        """
+        with self._lock:
+            self._cancel_flush_timer()
+            if not self._pending_samples:
+                return
+            state = self._aggregate.export_state()
+            metadata = {'relay_id': self.relay_id, 'round_num': self.current_round, 'node_samples': self._pending_samples}
+            if self._evaluation.num_nodes:
+                metadata['evaluation'] = self._evaluation.export_state()
+            node_samples = self._pending_samples
+            round_num = self.current_round
+            self._forwarded_ids.update(node_samples)
+            self._aggregate.reset()
+            self._evaluation.reset()
+            self._pending_samples = {}
+
+        with FORWARD_SECONDS.time():
+            body = encode_partial_aggregate(state, metadata)
+            for attempt in range(self.forward_retries + 1):
+                if attempt:
+                    time.sleep(0.5 * 2 ** (attempt - 1))
+                PAYLOAD_BYTES_TOTAL.inc(len(body), direction='sent')
+                try:
+                    response = self.http.post(f"{self.coordinator_endpoint}/submit_partial_aggregate", data=body,
+                                              headers={'Content-Type': PARTIAL_AGGREGATE_CONTENT_TYPE}, timeout=30)
+                    response.raise_for_status()
+                    FORWARDS_TOTAL.inc(result='accepted')
+                    logger.debug("Relay %s: Forwarded %d updates for round %s.", self.relay_id, len(node_samples), round_num)
+                    return
+                except requests.exceptions.HTTPError as e:
+                    if e.response is not None and e.response.status_code < 500:
+                        # Rejected (e.g. the round already closed): resending cannot succeed
+                        FORWARDS_TOTAL.inc(result='rejected')
+                        logger.warning(f"Relay {self.relay_id}: Coordinator rejected {len(node_samples)} updates "
+                                       f"for round {round_num}: {e}")
+                        return
+                    error = e
+                except requests.exceptions.RequestException as e:
+                    error = e
+                FORWARDS_TOTAL.inc(result='failed')
+                logger.warning(f"Relay {self.relay_id}: ERROR forwarding {len(node_samples)} updates for round "
+                               f"{round_num} (attempt {attempt + 1}): {error}")
+        self._restore(round_num, state, metadata.get('evaluation'), node_samples)
+
+    def _restore(self, round_num, state, evaluation, node_samples):
+        """Puts a partial aggregate that could not be forwarded back into the pending state of its round."""
+        with self._lock:
+            if round_num != self.current_round:
+                logger.error(f"Relay {self.relay_id}: Dropping {len(node_samples)} unforwarded updates of "
+                             f"round {round_num}; round {self.current_round} has started.")
+                return
+            self._aggregate.merge_state(state)
+            if evaluation is not None:
+                self._evaluation.merge_state(evaluation)
+            self._pending_samples.update(node_samples)
+            self._forwarded_ids.difference_update(node_samples)
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.flush_interval, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+        logger.error(f"Relay {self.relay_id}: Could not forward {len(node_samples)} updates for round {round_num}. "
+                     f"Retrying with the next flush.")
+
+    def _register_with_coordinator(self):
+        """Registers this relay with the Coordinator, retrying until it succeeds."""
+        while True:
+            try:
+                logger.info(f"Relay {self.relay_id}: Registering with Coordinator at {self.coordinator_endpoint}...")
+                response = self.http.post(f"{self.coordinator_endpoint}/register_relay",
+                                          json={"relay_id": self.relay_id, "endpoint_url": self.endpoint_url,
+                                                "wire_formats": SUPPORTED_WIRE_FORMATS}, timeout=10)
+                response.raise_for_status()
+                logger.info(f"Relay {self.relay_id}: Registration successful.")
+                return True
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Relay {self.relay_id}: ERROR registering with Coordinator: {e}")
+                time.sleep(5)
+
+
+# --- Flask API Endpoints ---
+@app.route('/model_update', methods=['POST'])
+def model_update_endpoint():
+    """Endpoint for the Coordinator to start a round on this relay."""
+    response, status_code = SubAggregator.instance.accept_model_update(request.mimetype, request.get_data())
+    return jsonify(response), status_code
+
+@app.route('/submit_model_update', methods=['POST'])
+def submit_model_update():
+    """Endpoint for the group's nodes to submit their local updates (same protocol as the Coordinator)."""
+    response, status_code = SubAggregator.instance.accept_node_update(request.mimetype, request.get_data())
+    return jsonify(response), status_code
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint."""
+    return Response(METRICS.render(), content_type=METRICS_CONTENT_TYPE)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+                        format='%(asctime)s %(levelname)s %(message)s')
+    RELAY_ID = os.environ.get('RELAY_ID', 'relay-default')
+    COORDINATOR_ENDPOINT = os.environ.get('COORDINATOR_ENDPOINT', 'http://localhost:5000')
+    RELAY_PORT = int(os.environ.get('RELAY_PORT', 5000))
+
+    SubAggregator.instance = SubAggregator(RELAY_ID, COORDINATOR_ENDPOINT)
+    # Register in the background so the endpoints are already up when the first round starts
+    threading.Thread(target=SubAggregator.instance._register_with_coordinator, daemon=True).start()
+
+    app.run(host='0.0.0.0', port=RELAY_PORT, debug=False)
@@ -0,0 +1,125 @@
+import os
+import time
+import logging
+
+import numpy as np
+import pyarrow as pa
+from flask import Flask, Response, request, jsonify
+
+from shared_libs.metrics import METRICS, METRICS_CONTENT_TYPE
+from shared_libs.model_scorer import ModelStore
+
+app = Flask(__name__)
+logger = logging.getLogger(__name__)
+
+# Columnar request/response bodies: an Arrow IPC stream (one table of feature columns in, a 'score' column out)
+ARROW_CONTENT_TYPE = "application/vnd.apache.arrow.stream"
+
+# Scoring metrics, served in Prometheus text format on /metrics
+SCORED_ROWS_TOTAL = METRICS.counter('swarm_scoring_rows_total', 'Rows scored by request format', ['format'])
+SCORE_SECONDS = METRICS.histogram('swarm_scoring_request_seconds', 'Time to decode and score one request', ['format'])
+MODEL_VERSION = METRICS.gauge('swarm_scoring_model_round', 'Round of the global model being served')
+
+
+class ScoringService:
+    """
+    Batch credit-scoring service for the swarm's global model.
+    The model comes from the checkpoints the Coordinator writes after every round (MODEL_SAVE_DIR)
+    and is hot-swapped by a ModelStore when a newer round appears; each request is scored
+    entirely with the model it started with.
+    """
+    instance = None
+
+    def __init__(self, model_dir, reload_interval=5.0):
+        self.model_store = ModelStore(model_dir, reload_interval=reload_interval)
+        self.model_store.start()
+        logger.info(f"Scoring service initialized (model dir {model_dir}, reload every {reload_interval}s).")
+
+    def score_json(self, data):
+        """
+        Scores a JSON body: {"row": {...}}, {"rows": [{...}, ...]} or the columnar
+        {"columns": [...], "data": [[...], ...]}. Returns (model, scores).
+        """
+        model = self.model_store.current
+        if 'row' in data:
+            scores = model.score_rows([data['row']])
+        elif 'rows' in data:
+            scores = model.score_rows(data['rows'])
+        elif 'columns' in data and 'data' in data:
+            X = np.asarray(data['data'], dtype=np.float64).reshape(-1, len(data['columns']))
+            scores = model.score_matrix(X, data['columns'])
+        else:
+            raise ValueError("Expected 'row', 'rows' or 'columns' + 'data'")
+        return model, scores
+
+    def score_arrow(self, body):
+        """Scores an Arrow IPC stream of feature columns. Returns (model, scores)."""
+        model = self.model_store.current
+        table = pa.ipc.open_stream(body).read_all()
+        arrays = [column.to_numpy() for column in table.columns]
+        return model, model.score_columns(arrays, table.column_names)
+
+
+# --- Flask API Endpoints ---
+@app.route('/score', methods=['POST'])
+def score():
+    """Scores one row or a batch (JSON or Arrow stream) with the current global model."""
+    service = ScoringService.instance
+    if service.model_store.current is None:
+        return jsonify({"status": "error", "message": "No global model checkpoint available yet."}), 503
+
+    started = time.perf_counter()
+    if request.mimetype == ARROW_CONTENT_TYPE:
+        try:
+            model, scores = service.score_arrow(request.get_data())
+        except (pa.ArrowException, ValueError) as e:
+            return jsonify({"status": "error", "message": f"Invalid Arrow stream: {e}"}), 400
+        sink = pa.BufferOutputStream()
+        result = pa.table({'score': scores})
+        with pa.ipc.new_stream(sink, result.schema) as writer:
+            writer.write_table(result)
+        response = Response(sink.getvalue().to_pybytes(), content_type=ARROW_CONTENT_TYPE)
+        response.headers['X-Model-Round'] = str(model.version)
+        request_format = 'arrow'
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"status": "error", "message": "Expected a JSON object"}), 400
+        try:
+            model, scores = service.score_json(data)
+        except (ValueError, TypeError, AttributeError) as e:
+            return jsonify({"status": "error", "message": f"Invalid scoring request: {e}"}), 400
+        response = jsonify({"model_round": model.version, "scores": scores.tolist()})
+        request_format = 'json'
+
+    SCORE_SECONDS.observe(time.perf_counter() - started, format=request_format)
+    SCORED_ROWS_TOTAL.inc(len(scores), format=request_format)
+    return response
+
+@app.route('/model', methods=['GET'])
+def model_info():
+    """Round and feature names of the model being served."""
+    model = ScoringService.instance.model_store.current
+    if model is None:
+        return jsonify({"status": "error", "message": "No global model checkpoint available yet."}), 503
+    return jsonify({"model_round": model.version, "features": model.feature_names}), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint."""
+    model = ScoringService.instance.model_store.current
+    if model is not None:
+        MODEL_VERSION.set(model.version)
+    return Response(METRICS.render(), content_type=METRICS_CONTENT_TYPE)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+                        format='%(asctime)s %(levelname)s %(message)s')
+    MODEL_SAVE_DIR = os.environ.get('MODEL_SAVE_DIR', '/app/models')  # Same volume the Coordinator writes to
+    SCORING_PORT = int(os.environ.get('SCORING_PORT', 5000))
+
+    ScoringService.instance = ScoringService(
+        MODEL_SAVE_DIR, reload_interval=float(os.environ.get('MODEL_RELOAD_INTERVAL', 5)))
+
+    # threaded=True: requests are independent, the model reference is swapped atomically
+    app.run(host='0.0.0.0', port=SCORING_PORT, debug=False, threaded=True)
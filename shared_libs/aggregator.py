@@ -1,92 +1,431 @@
 import pandas as pd
-from sklearn.linear_model import SGDRegressor
-from sklearn.metrics import mean_squared_error
 import numpy as np
-import boto3
-from io import BytesIO  # Để đọc dữ liệu từ S3 mà không cần lưu trực tiếp vào đĩa
+import logging
+import os
+import threading
+import time
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from shared_libs.metrics import METRICS
+from shared_libs.object_store import object_store_from_env
+
+logger = logging.getLogger(__name__)
+
+PHASE_SECONDS = METRICS.histogram(
+    'swarm_coordinator_phase_seconds', 'Time spent per round phase', ['phase'])
 
 class Aggregator:
     """
     Handles the aggregation of model parameters received from multiple Swarm Nodes.
     """
-    def __init__(self):
-        print("Aggregator initialized.")
+    def __init__(self, test_set_cache=None):
+        """`test_set_cache` shares another Aggregator's cached test set (e.g. between training jobs)."""
+        # 'central' scores every aggregated model on test.parquet here; 'federated' leaves evaluation
+        # to the nodes (see Coordinator), 'both' does both, e.g. to compare them
+        self.evaluation_mode = os.environ.get('EVALUATION_MODE', 'central')
+        self.central_evaluation = self.evaluation_mode != 'federated'
+        self.test_set_cache = test_set_cache
+        if self.test_set_cache is None:
+            self.test_set_cache = TestSetCache(
+                s3_bucket_name=os.environ.get('S3_BUCKET_NAME', 'durian-bucket-titan'),  # Sử dụng tên bucket từ biến môi trường
+                s3_key='data/test.parquet',
+                local_path=os.environ.get('TEST_DATA_PATH'),  # Optional local copy, e.g. data/test.parquet
+                revalidate_interval=float(os.environ.get('TEST_SET_REVALIDATE_SECONDS', 60)),
+                target_column=os.environ.get('TARGET_COLUMN', 'Target'),
+            )
+            if self.central_evaluation:
+                self.test_set_cache.prefetch()  # Load in the background so the first round does not wait on S3
+        self.last_test_mse = None  # MSE of the latest evaluated model, e.g. for comparing update encodings
+        logger.info("Aggregator initialized.")
 
-    def aggregate_models(self, local_model_params_list) -> dict:
+    def aggregate_models(self, local_model_params_list, sample_counts=None) -> dict:
         """
         Aggregates a list of local model parameters into a single global model.
         For each feature, it averages coefficients only across the models that have that feature.
+        If `sample_counts` is given, models are weighted by their number of training samples (FedAvg).
+        """
+        with PHASE_SECONDS.time(phase='aggregate'):
+            aggregated_model = self.average_models(local_model_params_list, sample_counts)
+
+        logger.info("Aggregator: Successfully aggregated %d models.", len(local_model_params_list))
+        if self.central_evaluation:
+            with PHASE_SECONDS.time(phase='evaluate'):
+                logger.info(self.test_accuracy(aggregated_model))  # Test the accuracy after aggregation
+        return aggregated_model
+
+    def aggregate_running(self, running_aggregate) -> dict:
+        """
+        Finalizes a RunningAggregate that was fed incrementally during the round.
+        Same output and evaluation as aggregate_models, without holding the local models.
+        """
+        with PHASE_SECONDS.time(phase='aggregate'):
+            aggregated_model = running_aggregate.result()
+
+        logger.info("Aggregator: Successfully aggregated %d models (incremental).", running_aggregate.num_models)
+        if self.central_evaluation:
+            with PHASE_SECONDS.time(phase='evaluate'):
+                logger.info(self.test_accuracy(aggregated_model))  # Test the accuracy after aggregation
+        return aggregated_model
+
+    def average_models(self, local_model_params_list, sample_counts=None) -> dict:
+        """
+        Vectorized (NumPy) averaging of local models, without evaluation.
+        Feature names are mapped to a shared column index once, the models are stacked into
+        a dense value matrix plus a presence mask, and per-feature means are taken over the
+        models that have each feature.
         """
         if not local_model_params_list:
             raise ValueError("Cannot aggregate an empty list of models.")
 
-        aggregated_coef = {}
-        coef_counts = {}
-        aggregated_intercept = 0.0
+        if sample_counts is None:
+            weights = np.ones(len(local_model_params_list))
+        else:
+            weights = np.asarray(sample_counts, dtype=np.float64)
+            if weights.shape != (len(local_model_params_list),):
+                raise ValueError("sample_counts must have one entry per local model.")
+            if np.any(weights < 0) or weights.sum() <= 0:
+                raise ValueError("sample_counts must be non-negative with a positive total.")
 
-        for model_params in local_model_params_list:
-            for key, value in model_params['coef'].items():
-                if key not in aggregated_coef:
-                    aggregated_coef[key] = 0.0
-                    coef_counts[key] = 0
-                aggregated_coef[key] += value
-                coef_counts[key] += 1
-            aggregated_intercept += model_params['intercept']
-
-        for key in aggregated_coef:
-            aggregated_coef[key] /= coef_counts[key]
-        aggregated_intercept /= len(local_model_params_list)
-
-        aggregated_model = {
-            'coef': aggregated_coef,
-            'intercept': aggregated_intercept
+        feature_names, values, present, intercepts = self._stack_models(local_model_params_list)
+
+        weighted_sums = weights @ values
+        weighted_counts = weights @ present
+        with np.errstate(divide='ignore', invalid='ignore'):
+            coef = weighted_sums / weighted_counts
+        # Features only reported by zero-weight models fall back to their unweighted mean
+        missing = weighted_counts == 0
+        if np.any(missing):
+            coef[missing] = values[:, missing].sum(axis=0) / present[:, missing].sum(axis=0)
+
+        return {
+            'coef': dict(zip(feature_names, coef.tolist())),
+            'intercept': float(weights @ intercepts / weights.sum())
         }
 
-        print(f"Aggregator: Successfully aggregated {len(local_model_params_list)} models.")
-        print(self.test_accuracy(aggregated_model))  # Test the accuracy after aggregation
-        return aggregated_model
-    
-    def test_accuracy(self, params):
-        """Test the aggregated model on test data from S3."""
-        s3_bucket_name = os.environ.get('S3_BUCKET_NAME', 'durian-bucket-titan')  # Sử dụng tên bucket từ biến môi trường
-        s3_key = 'data/test.parquet'  # Đảm bảo key đúng
+    @staticmethod
+    def _stack_models(local_model_params_list):
+        """
+        Stacks `{'coef': {feature: value}, 'intercept': value}` dicts into arrays.
+        Returns (feature_names, values[n_models, n_features], present[n_models, n_features], intercepts[n_models]).
+        Absent features are stored as 0.0 with present = 0.0, so sums over rows ignore them.
+        """
+        n_models = len(local_model_params_list)
+        first_keys = list(local_model_params_list[0]['coef'].keys())
+        intercepts = np.fromiter((m['intercept'] for m in local_model_params_list), dtype=np.float64, count=n_models)
+
+        # Fast path: every model reports the same features in the same order
+        if all(len(m['coef']) == len(first_keys) and list(m['coef'].keys()) == first_keys
+               for m in local_model_params_list):
+            values = np.empty((n_models, len(first_keys)), dtype=np.float64)
+            for row, model_params in enumerate(local_model_params_list):
+                values[row] = np.fromiter(model_params['coef'].values(), dtype=np.float64, count=len(first_keys))
+            return first_keys, values, np.ones_like(values), intercepts
+
+        feature_index = {}
+        for model_params in local_model_params_list:
+            for key in model_params['coef']:
+                if key not in feature_index:
+                    feature_index[key] = len(feature_index)
 
-        print(f"Aggregator: Loading test data from S3://{s3_bucket_name}/{s3_key}...")
+        values = np.zeros((n_models, len(feature_index)), dtype=np.float64)
+        present = np.zeros_like(values)
+        for row, model_params in enumerate(local_model_params_list):
+            coef = model_params['coef']
+            cols = np.fromiter(map(feature_index.__getitem__, coef.keys()), dtype=np.intp, count=len(coef))
+            values[row, cols] = np.fromiter(coef.values(), dtype=np.float64, count=len(coef))
+            present[row, cols] = 1.0
+        return list(feature_index.keys()), values, present, intercepts
 
+    def test_accuracy(self, params):
+        """Test the aggregated model on the cached test data (loaded once, revalidated by ETag/mtime)."""
         try:
-            s3 = boto3.client('s3')
-            obj = s3.get_object(Bucket=s3_bucket_name, Key=s3_key)
-            with BytesIO(obj['Body'].read()) as data_buffer:
-                test_df = pd.read_parquet(data_buffer)
-            print(f"Aggregator: Successfully loaded test data from S3.")
+            test_set = self.test_set_cache.get()
         except Exception as e:
-            print(f"Aggregator: ERROR loading test data from S3: {e}")
+            logger.error(f"Aggregator: ERROR loading test data from S3: {e}")
             return "Error loading data from S3"
 
-        test_X = test_df.drop(columns=['Target'])
-        test_y = test_df['Target']
-        feature_set = test_X.columns.tolist()
+        model_features = params['coef']
+        try:
+            X, model_columns = test_set.aligned_to(model_features.keys())
+        except KeyError as e:
+            logger.error(f"Aggregator: ERROR test feature {e} missing from the model.")
+            return "Error aligning model to test data"
 
-        model = SGDRegressor(
-            loss='squared_error',
-            penalty=None, alpha=0.0001,
-            max_iter=1, tol=None,
-            learning_rate='constant', eta0=0.01,
-            random_state=42 # for reproducibility
-        )
+        coef = np.fromiter(model_features.values(), dtype=np.float64, count=len(model_features))[model_columns]
+        residuals = X @ coef + params['intercept'] - test_set.y
+        mse = float(residuals @ residuals) / len(residuals)
+        self.last_test_mse = mse
+        return f'Accuracy (MSE): {mse}'
 
-        # Warm-up fit to avoid assignment error
-        model.partial_fit(test_X[:1], test_y[:1])
+class RunningAggregate:
+    """
+    Streaming counterpart of Aggregator.average_models.
+    Each local model is folded into running per-feature sums and counts as it arrives, so memory
+    stays O(features) instead of O(nodes x features) and finalizing does not depend on the node count.
+    Not thread-safe: callers serialize add() (each RoundSlots stripe has its own aggregate and lock).
+    """
+    def __init__(self, weighted=False):
+        """If `weighted` is True, models are also accumulated with their sample counts (FedAvg)."""
+        self.weighted = weighted
+        self.reset()
 
-        # Prepare initial parameters for SGDRegressor from our dict format
-        # Ensure order matches self.X.columns
-        initial_coef = np.array([params['coef'][f] for f in feature_set])
-        initial_intercept = np.array([params['intercept']])
+    def reset(self):
+        """Clears all accumulated state for a new round."""
+        self._feature_index = {}
+        self._schema_columns = {}  # schema hash -> column indices of that feature order
+        self._sums = np.zeros(0)
+        self._counts = np.zeros(0)
+        self._intercept_sum = 0.0
+        self._weighted_sums = np.zeros(0)
+        self._weighted_counts = np.zeros(0)
+        self._weighted_intercept_sum = 0.0
+        self._weight_total = 0.0
+        self._all_weighted = True  # False once an update arrives without a sample count
+        self.num_models = 0
 
-        # partial_fit requires initial_coef and initial_intercept set directly
-        model.coef_ = initial_coef
-        model.intercept_ = initial_intercept
+    def _ensure_capacity(self, n_features):
+        """Grows the accumulators (doubling) so they can hold `n_features` columns."""
+        capacity = len(self._sums)
+        if n_features <= capacity:
+            return
+        new_capacity = max(n_features, 2 * capacity, 16)
+        for name in ('_sums', '_counts', '_weighted_sums', '_weighted_counts'):
+            grown = np.zeros(new_capacity)
+            grown[:capacity] = getattr(self, name)
+            setattr(self, name, grown)
 
-        predictions = model.predict(test_X)
-        mse = mean_squared_error(test_y, predictions)
-        return f'Accuracy (MSE): {mse}'
+    def add(self, model_params, num_samples=None):
+        """Folds one `{'coef': {feature: value}, 'intercept': value}` model into the running sums."""
+        coef = model_params['coef']
+        values = np.fromiter(coef.values(), dtype=np.float64, count=len(coef))
+        self.add_arrays(coef.keys(), values, model_params['intercept'], num_samples)
+
+    def add_arrays(self, feature_names, values, intercept, num_samples=None, schema=None):
+        """
+        Folds one model given as an ordered parameter vector (e.g. a decoded binary ModelPayload).
+        If `schema` (a hash of the feature order) is given, the column mapping is computed once per
+        schema and reused for every later model with the same feature order.
+        """
+        cols = self._schema_columns.get(schema) if schema is not None else None
+        if cols is None:
+            index = self._feature_index
+            # setdefault assigns the next free column to features seen for the first time
+            cols = np.fromiter((index.setdefault(key, len(index)) for key in feature_names),
+                               dtype=np.intp, count=len(values))
+            self._ensure_capacity(len(index))
+            if schema is not None:
+                self._schema_columns[schema] = cols
+
+        self._sums[cols] += values
+        self._counts[cols] += 1.0
+        self._intercept_sum += intercept
+
+        if self.weighted:
+            if num_samples is None:
+                self._all_weighted = False
+            else:
+                weight = float(num_samples)
+                self._weighted_sums[cols] += weight * values
+                self._weighted_counts[cols] += weight
+                self._weighted_intercept_sum += weight * intercept
+                self._weight_total += weight
+        self.num_models += 1
+
+    def export_state(self) -> dict:
+        """
+        Sufficient statistics of everything added so far (per-feature sums and counts, weighted and
+        unweighted, plus intercept sums). Merging the states of disjoint groups with merge_state()
+        yields the same result as adding every model to one aggregate (up to float summation order).
+        """
+        n_features = len(self._feature_index)
+        return {
+            'feature_names': list(self._feature_index.keys()),
+            'sums': self._sums[:n_features].copy(),
+            'counts': self._counts[:n_features].copy(),
+            'weighted_sums': self._weighted_sums[:n_features].copy(),
+            'weighted_counts': self._weighted_counts[:n_features].copy(),
+            'intercept_sum': self._intercept_sum,
+            'weighted_intercept_sum': self._weighted_intercept_sum,
+            'weight_total': self._weight_total,
+            'all_weighted': self.weighted and self._all_weighted,
+            'num_models': self.num_models,
+        }
+
+    def merge_state(self, state):
+        """Folds a partial aggregate produced by export_state() (e.g. by a sub-aggregator) into this one."""
+        if state['num_models'] == 0:
+            return
+        index = self._feature_index
+        cols = np.fromiter((index.setdefault(key, len(index)) for key in state['feature_names']),
+                           dtype=np.intp, count=len(state['feature_names']))
+        self._ensure_capacity(len(index))
+
+        self._sums[cols] += state['sums']
+        self._counts[cols] += state['counts']
+        self._intercept_sum += state['intercept_sum']
+        if self.weighted:
+            if not state['all_weighted']:
+                self._all_weighted = False
+            self._weighted_sums[cols] += state['weighted_sums']
+            self._weighted_counts[cols] += state['weighted_counts']
+            self._weighted_intercept_sum += state['weighted_intercept_sum']
+            self._weight_total += state['weight_total']
+        self.num_models += state['num_models']
+
+    def result(self) -> dict:
+        """Returns the aggregated model for everything added so far."""
+        if self.num_models == 0:
+            raise ValueError("Cannot aggregate an empty list of models.")
+
+        n_features = len(self._feature_index)
+        sums = self._sums[:n_features]
+        counts = self._counts[:n_features]
+
+        if self.weighted and self._all_weighted and self._weight_total > 0:
+            weighted_counts = self._weighted_counts[:n_features]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                coef = self._weighted_sums[:n_features] / weighted_counts
+            # Features only reported by zero-weight models fall back to their unweighted mean
+            missing = weighted_counts == 0
+            coef[missing] = sums[missing] / counts[missing]
+            intercept = self._weighted_intercept_sum / self._weight_total
+        else:
+            if self.weighted:
+                logger.warning("RunningAggregate: Some updates carry no sample count. Falling back to uniform averaging.")
+            coef = sums / counts
+            intercept = self._intercept_sum / self.num_models
+
+        return {
+            'coef': dict(zip(self._feature_index.keys(), coef.tolist())),
+            'intercept': float(intercept)
+        }
+
+
+class TestSet:
+    """
+    Evaluation data held as a contiguous float64 feature matrix plus target vector.
+    Rows with missing (non-finite) features or target are dropped, as in local training, so one
+    NaN cannot turn the test MSE into NaN.
+    Column alignments for a given model feature order are computed once and cached.
+    """
+    def __init__(self, test_df, version, target_column='Target'):
+        self.version = version
+        self.feature_names = [c for c in test_df.columns if c != target_column]
+        X = test_df[self.feature_names].to_numpy(dtype=np.float64)
+        y = test_df[target_column].to_numpy(dtype=np.float64)
+        finite = np.isfinite(X).all(axis=1) & np.isfinite(y)
+        self.dropped_rows = int(len(y) - finite.sum())
+        if self.dropped_rows:
+            X, y = X[finite], y[finite]
+            logger.warning(f"Aggregator: Dropped {self.dropped_rows} of {len(finite)} test rows with missing values.")
+        self.X = np.ascontiguousarray(X)
+        self.y = np.ascontiguousarray(y)
+        self._alignments = {}  # tuple(model feature order) -> (X aligned to model order, model column indices)
+
+    def aligned_to(self, model_features):
+        """
+        Returns (X, model_columns) where X holds the test columns in the model's feature order and
+        model_columns selects the matching entries of the model's coefficient vector.
+        Model features absent from the test set are ignored. Test features absent from the model
+        count with a coefficient of 0 (a job trained on a feature subset); if the model has none of
+        the test features, KeyError is raised.
+        """
+        key = tuple(model_features)
+        alignment = self._alignments.get(key)
+        if alignment is None:
+            model_position = {name: i for i, name in enumerate(key)}
+            if self.feature_names and not any(name in model_position for name in self.feature_names):
+                raise KeyError(self.feature_names[0])
+            test_position = {name: i for i, name in enumerate(self.feature_names)}
+            model_columns = np.array([i for i, name in enumerate(key) if name in test_position], dtype=np.intp)
+            test_columns = [test_position[key[i]] for i in model_columns]
+            alignment = (np.ascontiguousarray(self.X[:, test_columns]), model_columns)
+            self._alignments[key] = alignment
+        return alignment
+
+
+class TestSetCache:
+    """
+    Keeps the test set in memory across rounds.
+    The source is checked at most every `revalidate_interval` seconds (S3 ETag, or mtime/size for a
+    local file) and only reloaded when it changed; revalidation runs in the background so
+    evaluation never waits on S3 once the first load has completed.
+    """
+    def __init__(self, s3_bucket_name, s3_key, local_path=None, revalidate_interval=60.0, target_column='Target'):
+        self.s3_bucket_name = s3_bucket_name
+        self.s3_key = s3_key
+        self.local_path = local_path
+        self.revalidate_interval = revalidate_interval
+        self.target_column = target_column
+        self._object_store = None  # Reused across rounds
+        self._test_set = None
+        self._last_validated = 0.0
+        self._load_lock = threading.Lock()  # Serializes loads
+        self._refresh_flag_lock = threading.Lock()
+        self._refreshing = False  # True while a background refresh is queued or running
+
+    def _store(self):
+        if self._object_store is None:
+            self._object_store = object_store_from_env(self.s3_bucket_name)
+        return self._object_store
+
+    def _source_version(self):
+        """Returns a token that changes whenever the underlying test data changes."""
+        if self.local_path:
+            stat = os.stat(self.local_path)
+            return f"{stat.st_mtime_ns}-{stat.st_size}"
+        return self._store().head(self.s3_key).etag
+
+    def _load(self, version):
+        if self.local_path:
+            logger.info(f"Aggregator: Loading test data from {self.local_path}...")
+            test_df = pd.read_parquet(self.local_path)
+        else:
+            logger.info(f"Aggregator: Loading test data from S3://{self.s3_bucket_name}/{self.s3_key}...")
+            # Parallel ranged download into one buffer, which Arrow reads in place
+            data, info = self._store().read_bytes(self.s3_key)
+            version = info.etag
+            test_df = pq.read_table(pa.py_buffer(data)).to_pandas()
+        test_set = TestSet(test_df, version, target_column=self.target_column)
+        logger.info(f"Aggregator: Successfully loaded {len(test_set.y)} test samples (version {version}).")
+        return test_set
+
+    def _refresh(self):
+        """Revalidates the cached test set and reloads it if the source version changed."""
+        with self._load_lock:
+            version = self._source_version()
+            if self._test_set is None or self._test_set.version != version:
+                self._test_set = self._load(version)
+            self._last_validated = time.monotonic()
+
+    def _refresh_in_background(self):
+        with self._refresh_flag_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh_quietly, daemon=True).start()
+
+    def _refresh_quietly(self):
+        try:
+            self._refresh()
+        except Exception as e:
+            logger.error(f"Aggregator: ERROR revalidating test data: {e}")
+        finally:
+            with self._refresh_flag_lock:
+                self._refreshing = False
+
+    def prefetch(self):
+        """Starts loading the test set in the background."""
+        self._refresh_in_background()
+
+    def get(self) -> TestSet:
+        """
+        Returns the cached test set. Only the very first call (if the prefetch has not finished)
+        blocks on loading; later calls trigger a background revalidation when it is due.
+        """
+        if self._test_set is None:
+            self._refresh()
+        elif time.monotonic() - self._last_validated >= self.revalidate_interval:
+            self._refresh_in_background()
+        return self._test_set
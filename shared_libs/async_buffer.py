@@ -0,0 +1,72 @@
+# shared_libs/async_buffer.py
+
+import time
+
+from shared_libs.aggregator import RunningAggregate
+
+
+class AsyncUpdateBuffer:
+    """
+    Update buffer of the asynchronous (FedBuff-style) mode.
+    Nodes train on whatever global model version is current and report the change from it; a fast
+    node may have several updates (on different versions) in one buffer. Each delta is discounted
+    by its staleness (versions published since the node's base version) with weight
+    (1 + staleness) ** -staleness_exponent, and the buffer yields the weighted mean delta
+    sum(w_i * m_i * delta_i) / sum(m_i), where m_i is the node's sample count in sample-weighted
+    mode and 1 otherwise. The Coordinator publishes a new version every `buffer_size` updates.
+    Not thread-safe: callers serialize access (the Coordinator holds its _update_lock).
+    """
+    def __init__(self, buffer_size=10, staleness_exponent=0.5, max_staleness=10, sample_weighted=False):
+        """
+        buffer_size:        updates per published version (K).
+        staleness_exponent: exponent of the polynomial staleness discount; 0 disables it.
+        max_staleness:      updates based on older versions are rejected.
+        sample_weighted:    weight deltas by the nodes' sample counts as well.
+        """
+        if buffer_size < 1:
+            raise ValueError("buffer_size must be at least 1.")
+        self.buffer_size = buffer_size
+        self.staleness_exponent = staleness_exponent
+        self.max_staleness = max_staleness
+        self.sample_weighted = sample_weighted
+        # Deltas are folded in pre-scaled by their staleness weight, with m_i as the sample count
+        self._aggregate = RunningAggregate(weighted=True)
+        self._staleness = []  # One entry per buffered update
+        self._first_update_at = None
+
+    def staleness_weight(self, staleness) -> float:
+        return (1.0 + staleness) ** -self.staleness_exponent
+
+    def accepts(self, staleness) -> bool:
+        """False for updates based on a future or too old version."""
+        return 0 <= staleness <= self.max_staleness
+
+    def add(self, feature_names, delta_values, delta_intercept, staleness, num_samples=None, schema=None):
+        """Buffers one node's delta (vector aligned with `feature_names`) computed `staleness` versions ago."""
+        weight = self.staleness_weight(staleness)
+        mass = float(num_samples) if self.sample_weighted and num_samples else 1.0
+        self._aggregate.add_arrays(feature_names, weight * delta_values, weight * delta_intercept, mass, schema=schema)
+        self._staleness.append(staleness)
+        if self._first_update_at is None:
+            self._first_update_at = time.monotonic()
+
+    def __len__(self):
+        return len(self._staleness)
+
+    def age(self) -> float:
+        """Seconds since the oldest buffered update arrived (0 when empty)."""
+        return 0.0 if self._first_update_at is None else time.monotonic() - self._first_update_at
+
+    def drain(self):
+        """
+        Returns (mean delta as a `{'coef', 'intercept'}` dict, staleness list of the buffered
+        updates) and empties the buffer.
+        """
+        if not self._staleness:
+            raise ValueError("Cannot drain an empty update buffer.")
+        mean_delta = self._aggregate.result()
+        staleness = self._staleness
+        self._aggregate.reset()
+        self._staleness = []
+        self._first_update_at = None
+        return mean_delta, staleness
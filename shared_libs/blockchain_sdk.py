@@ -1,8 +1,23 @@
 # shared_libs/blockchain_sdk.py
 
 import json
+import logging
+import queue
+import threading
 import time
 
+import numpy as np
+
+from shared_libs.local_ledger import LocalLedger, LedgerError, merkle_root, record_leaf_hash
+from shared_libs.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+PHASE_SECONDS = METRICS.histogram(
+    'swarm_coordinator_phase_seconds', 'Time spent per round phase', ['phase'])
+LEDGER_RECORDS_TOTAL = METRICS.counter(
+    'swarm_coordinator_ledger_records_total', 'Aggregation hashes written to the ledger by outcome', ['result'])
+
 class BlockchainClientSDK:
     """
     A simulated (or actual) SDK for interacting with a blockchain ledger
@@ -16,12 +31,17 @@ class BlockchainClientSDK:
         """
         self.client_id = client_id
         self.config = config if config else {}
+        # Optional SQLite-backed stand-in ledger ('local_ledger_path' in config), used instead of print simulation
+        self.ledger = None
+        if self.config.get('local_ledger_path'):
+            self.ledger = LocalLedger(self.config['local_ledger_path'],
+                                      commit_latency=self.config.get('local_ledger_commit_latency', 0.0))
         # Simulate connection to the blockchain network
-        print(f"BlockchainClientSDK initialized for client '{self.client_id}'.")
-        print("NOTE: This is a simulated blockchain interaction.")
-        print("      To integrate with a real Hyperledger Fabric network,")
-        print("      you would replace these print statements with actual")
-        print("      Fabric SDK calls (e.g., using 'hlf-sdk-py').")
+        logger.info("BlockchainClientSDK initialized for client '%s'.", self.client_id)
+        if self.ledger is None:
+            # To integrate with a real Hyperledger Fabric network, replace the simulated transactions
+            # below with actual Fabric SDK calls (e.g., using 'hlf-sdk-py')
+            logger.info("BlockchainClientSDK: Using simulated blockchain transactions (no ledger configured).")
         
         # In a real setup, you might load identities here
         # self._load_fabric_identity() 
@@ -31,6 +51,9 @@ class BlockchainClientSDK:
         Simulates recording the aggregated model's hash and metadata on the blockchain.
         In a real scenario, this would invoke a chaincode function.
         """
+        if self.ledger is not None:
+            return self.ledger.record_hash(round_num, model_hash, aggregated_by)
+
         timestamp = int(time.time())
         transaction_data = {
             "type": "model_aggregation",
@@ -41,30 +64,37 @@ class BlockchainClientSDK:
             "client_id": self.client_id # Record who initiated the transaction
         }
         
-        print(f"\n--- Blockchain Transaction Simulation ---")
-        print(f"Submitting transaction to record model hash:")
-        print(f"  Chaincode: 'hash_recorder_chaincode'")
-        print(f"  Function: 'recordHash'")
-        print(f"  Args: {json.dumps(transaction_data, indent=2)}")
-        print(f"  Status: Transaction 'simulated' and recorded on ledger.")
-        print(f"---------------------------------------")
+        logger.debug("Blockchain (simulated): hash_recorder_chaincode.recordHash %s", json.dumps(transaction_data))
         
         # In a real Fabric SDK call:
         # try:
         #     response = self.gateway.submit_transaction('hash_recorder_chaincode', 'recordHash', [json.dumps(transaction_data)])
-        #     print(f"Blockchain: Hash recorded successfully. Transaction ID: {response.transaction_id}")
+        #     logger.info("Blockchain: Hash recorded successfully. Transaction ID: %s", response.transaction_id)
         # except Exception as e:
-        #     print(f"Blockchain: ERROR recording hash: {e}")
+        #     logger.error("Blockchain: ERROR recording hash: %s", e)
+
+    def record_aggregation_hashes(self, records) -> tuple:
+        """
+        Records several aggregation hashes in a single transaction (chaincode 'RecordHashBatch').
+        `records` is a list of {'round_num', 'model_hash', 'aggregated_by'} dicts. The Merkle root of
+        the records is sent along and re-computed by the chaincode. Returns (tx_id, merkle_root).
+        """
+        root = merkle_root(record_leaf_hash(r) for r in records)
+        if self.ledger is not None:
+            return self.ledger.record_hash_batch(records, expected_root=root)
+
+        logger.debug("Blockchain (simulated): hash_recorder_chaincode.recordHashBatch of %d hashes, rounds %s, "
+                     "Merkle root %s", len(records), [r['round_num'] for r in records], root)
+        return None, root
 
     def query_model_hash(self, round_num: int) -> dict:
         """
         Simulates querying a model hash from the blockchain.
         In a real scenario, this would query a chaincode function.
         """
-        print(f"\n--- Blockchain Query Simulation ---")
-        print(f"Querying model hash for round {round_num}")
-        print(f"  Chaincode: 'hash_recorder_chaincode'")
-        print(f"  Function: 'queryHash'")
+        if self.ledger is not None:
+            return self.ledger.query_hash(round_num)
+
         # Simulate a result that might come from the blockchain
         simulated_result = {
             "round_num": round_num,
@@ -73,8 +103,8 @@ class BlockchainClientSDK:
             "timestamp": int(time.time()) - (100 * (round_num-1)), # Older timestamp for previous rounds
             "status": "simulated_success"
         }
-        print(f"  Result: {json.dumps(simulated_result, indent=2)}")
-        print(f"-----------------------------------")
+        logger.debug("Blockchain (simulated): hash_recorder_chaincode.queryHash for round %s: %s",
+                     round_num, json.dumps(simulated_result))
         return simulated_result
 
     # You might add more generic invoke/query methods for other chaincode interactions
@@ -84,4 +114,134 @@ class BlockchainClientSDK:
 
     # def query_chaincode(self, chaincode_name, function_name, args):
     #     # Real Fabric SDK call to query chaincode
-    #     pass
\ No newline at end of file
+    #     pass
+
+
+class LedgerWriter:
+    """
+    Background writer that takes ledger records off the round's critical path.
+    Records are queued by the Coordinator; the worker coalesces everything pending (up to
+    `max_batch_size`) into one RecordHashBatch transaction, so a slow endorsement+commit round trip
+    is paid once per batch instead of once per round. Per-record commit latency is tracked.
+    """
+    def __init__(self, blockchain_client, max_batch_size=32, linger=0.0, max_pending=1024):
+        """
+        blockchain_client: BlockchainClientSDK used to submit transactions.
+        max_batch_size:    maximum number of records per transaction.
+        linger:            seconds to wait for more records after the first one before committing.
+        max_pending:       bound of the record queue (submit() blocks when it is full).
+        """
+        self.blockchain_client = blockchain_client
+        self.max_batch_size = max_batch_size
+        self.linger = linger
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._stats_lock = threading.Lock()
+        self._commit_latencies = []  # Seconds from submit() to commit, most recent last
+        self._committed_records = 0
+        self._transactions = 0
+        self._failed_records = 0
+        self._worker = threading.Thread(target=self._run, name="ledger-writer", daemon=True)
+        self._worker.start()
+        logger.info(f"LedgerWriter initialized (max_batch_size={max_batch_size}, linger={linger}s).")
+
+    def submit(self, round_num: int, model_hash: str, aggregated_by: str):
+        """Queues a record for the ledger and returns immediately."""
+        record = {'round_num': round_num, 'model_hash': model_hash, 'aggregated_by': aggregated_by}
+        self._queue.put((record, time.monotonic()))
+
+    def _next_batch(self):
+        """Blocks for the first record, then collects what else is pending (up to max_batch_size)."""
+        batch = [self._queue.get()]
+        if batch[0] is None:
+            return batch
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is None:
+                break
+        return batch
+
+    def _commit(self, items):
+        records = [record for record, _ in items]
+        with PHASE_SECONDS.time(phase='ledger_record'):
+            if len(records) == 1:
+                self.blockchain_client.record_aggregation_hash(
+                    round_num=records[0]['round_num'],
+                    model_hash=records[0]['model_hash'],
+                    aggregated_by=records[0]['aggregated_by'])
+            else:
+                self.blockchain_client.record_aggregation_hashes(records)
+        committed_at = time.monotonic()
+        LEDGER_RECORDS_TOTAL.inc(len(records), result='committed')
+        with self._stats_lock:
+            self._transactions += 1
+            self._committed_records += len(records)
+            self._commit_latencies.extend(committed_at - submitted_at for _, submitted_at in items)
+            del self._commit_latencies[:-1000]  # Keep a bounded window
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            stop = batch[-1] is None
+            items = [item for item in batch if item is not None]
+            if items:
+                try:
+                    self._commit(items)
+                    logger.debug("LedgerWriter: Committed %d record(s) for rounds %s in one transaction.",
+                                 len(items), [record['round_num'] for record, _ in items])
+                except LedgerError as e:
+                    if len(items) == 1:
+                        logger.error(f"LedgerWriter: ERROR recording round {items[0][0]['round_num']}: {e}")
+                        LEDGER_RECORDS_TOTAL.inc(result='failed')
+                        with self._stats_lock:
+                            self._failed_records += 1
+                    else:
+                        # One bad record rejects the whole batch; retry individually to isolate it
+                        logger.warning(f"LedgerWriter: Batch rejected ({e}). Retrying records one by one.")
+                        for item in items:
+                            self._commit_single(item)
+                except Exception as e:
+                    logger.error(f"LedgerWriter: ERROR recording aggregation hashes on blockchain: {e}")
+                    LEDGER_RECORDS_TOTAL.inc(len(items), result='failed')
+                    with self._stats_lock:
+                        self._failed_records += len(items)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _commit_single(self, item):
+        try:
+            self._commit([item])
+        except Exception as e:
+            logger.error(f"LedgerWriter: ERROR recording round {item[0]['round_num']}: {e}")
+            LEDGER_RECORDS_TOTAL.inc(result='failed')
+            with self._stats_lock:
+                self._failed_records += 1
+
+    def stats(self) -> dict:
+        """Returns throughput and commit-latency metrics of the writer."""
+        with self._stats_lock:
+            latencies = np.array(self._commit_latencies) if self._commit_latencies else None
+            return {
+                "pending": self._queue.qsize(),
+                "transactions": self._transactions,
+                "committed_records": self._committed_records,
+                "failed_records": self._failed_records,
+                "commit_latency_p50_seconds": float(np.percentile(latencies, 50)) if latencies is not None else 0.0,
+                "commit_latency_p99_seconds": float(np.percentile(latencies, 99)) if latencies is not None else 0.0,
+            }
+
+    def flush(self):
+        """Blocks until every queued record has been committed (or has failed)."""
+        self._queue.join()
+
+    def close(self):
+        """Commits what is still queued, then stops the worker."""
+        self._queue.put(None)
+        self._worker.join()
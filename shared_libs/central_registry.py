@@ -1,44 +1,224 @@
 # shared_libs/central_registry.py
 
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
 class CentralRegistry:
     """
     Manages the registration and state of active Swarm Nodes.
     The Coordinator uses this registry to keep track of participating nodes.
+    Liveness is lease based: a node stays active while it heartbeats (or otherwise proves it is alive)
+    within `lease_seconds`, and is skipped after `max_consecutive_failures` failed deliveries until
+    a heartbeat after `failure_cooldown` seconds gives it another chance.
+    For hierarchical aggregation it also tracks sub-aggregators (relays) and assigns every node to
+    the group of one relay, which collects and pre-aggregates that group's updates.
     """
-    def __init__(self):
-        self._registered_nodes = {} # Stores node_id: {"endpoint": url, "status": "active"}
-        print("CentralRegistry initialized.")
+    def __init__(self, lease_seconds=30.0, max_consecutive_failures=3, failure_cooldown=30.0, latency_smoothing=0.2):
+        self.lease_seconds = lease_seconds
+        self.max_consecutive_failures = max_consecutive_failures
+        self.failure_cooldown = failure_cooldown
+        self.latency_smoothing = latency_smoothing  # Weight of the newest sample in the latency moving average
+        self._registered_nodes = {} # Stores node_id: {"endpoint": url, "status": "active", "last_seen": ..., ...}
+        # Indexed view of active nodes, ordered by last_seen so expired leases are found at the front
+        self._active_nodes = OrderedDict()  # node_id -> endpoint url
+        self._relays = {}  # relay_id -> {"endpoint": url, "members": set of node_ids, "last_seen": ...}
+        self._lock = threading.Lock()
+        logger.info("CentralRegistry initialized.")
 
     def register_node(self, node_id: str, endpoint_url: str):
         """
         Registers a new Swarm Node or updates an existing one.
         """
-        self._registered_nodes[node_id] = {"endpoint": endpoint_url, "status": "active"}
-        print(f"Registry: Node '{node_id}' registered/updated with endpoint {endpoint_url}")
+        now = time.monotonic()
+        with self._lock:
+            previous = self._registered_nodes.get(node_id, {})
+            self._registered_nodes[node_id] = {
+                "endpoint": endpoint_url,
+                "status": "active",
+                "registered_at": previous.get("registered_at", now),
+                "last_seen": now,
+                "latency_ewma": previous.get("latency_ewma"),
+                "consecutive_failures": 0,
+                "total_failures": previous.get("total_failures", 0),
+                "last_failure": None,
+                "group": previous.get("group"),
+            }
+            self._activate(node_id)
+        logger.debug("Registry: Node '%s' registered/updated with endpoint %s", node_id, endpoint_url)
+        return True
+
+    def _activate(self, node_id):
+        """Puts a node at the back (most recently seen end) of the active view. Caller holds the lock."""
+        self._active_nodes[node_id] = self._registered_nodes[node_id]["endpoint"]
+        self._active_nodes.move_to_end(node_id)
+
+    def _deactivate(self, node_id, status):
+        """Removes a node from the active view. Caller holds the lock."""
+        self._active_nodes.pop(node_id, None)
+        self._registered_nodes[node_id]["status"] = status
+
+    def _expire_leases(self, now):
+        """Drops nodes whose lease ran out. Only inspects the stale front of the view. Caller holds the lock."""
+        while self._active_nodes:
+            node_id = next(iter(self._active_nodes))
+            if now - self._registered_nodes[node_id]["last_seen"] <= self.lease_seconds:
+                break
+            self._deactivate(node_id, "expired")
+            logger.warning("Registry: Node '%s' lease expired. Marked as expired.", node_id)
+
+    def heartbeat(self, node_id: str) -> bool:
+        """
+        Renews a node's lease. Returns False for unknown nodes (they have to register again).
+        """
+        now = time.monotonic()
+        with self._lock:
+            node = self._registered_nodes.get(node_id)
+            if node is None:
+                return False
+            node["last_seen"] = now
+            if node["consecutive_failures"] >= self.max_consecutive_failures:
+                if node["last_failure"] is None or now - node["last_failure"] < self.failure_cooldown:
+                    return True  # Still cooling down; stays out of the active view
+                node["consecutive_failures"] = 0  # Give the node another chance
+            node["status"] = "active"
+            self._activate(node_id)
+            return True
+
+    def record_success(self, node_id: str, latency: float = None):
+        """Records a successful interaction (delivery or update); also renews the lease."""
+        with self._lock:
+            node = self._registered_nodes.get(node_id)
+            if node is None:
+                return
+            node["consecutive_failures"] = 0
+            if latency is not None:
+                previous = node["latency_ewma"]
+                node["latency_ewma"] = latency if previous is None else (
+                    self.latency_smoothing * latency + (1 - self.latency_smoothing) * previous)
+            if node["status"] in ("active", "expired", "unhealthy"):
+                node["last_seen"] = time.monotonic()
+                node["status"] = "active"
+                self._activate(node_id)
+
+    def record_failure(self, node_id: str):
+        """Records a failed interaction; too many in a row mark the node unhealthy."""
+        with self._lock:
+            node = self._registered_nodes.get(node_id)
+            if node is None:
+                return
+            node["consecutive_failures"] += 1
+            node["total_failures"] += 1
+            node["last_failure"] = time.monotonic()
+            if node["consecutive_failures"] >= self.max_consecutive_failures and node_id in self._active_nodes:
+                self._deactivate(node_id, "unhealthy")
+                logger.warning(f"Registry: Node '{node_id}' marked unhealthy after {node['consecutive_failures']} consecutive failures.")
 
     def get_registered_nodes(self) -> dict:
         """
         Returns a dictionary of all currently registered and active nodes.
         """
-        # In a more complex scenario, you might filter by 'active' status
-        return self._registered_nodes
+        with self._lock:
+            self._expire_leases(time.monotonic())
+            return {node_id: self._registered_nodes[node_id] for node_id in self._active_nodes}
+
+    def get_all_nodes(self) -> dict:
+        """
+        Returns every node that ever registered (and was not removed), whatever its status.
+        """
+        with self._lock:
+            self._expire_leases(time.monotonic())
+            return dict(self._registered_nodes)
+
+    def is_active(self, node_id: str) -> bool:
+        """O(1) liveness lookup through the active-node index."""
+        with self._lock:
+            self._expire_leases(time.monotonic())
+            return node_id in self._active_nodes
 
     def remove_node(self, node_id: str):
         """
         Removes a node from the registry (e.g., if it goes offline).
         """
-        if node_id in self._registered_nodes:
-            del self._registered_nodes[node_id]
-            print(f"Registry: Node '{node_id}' removed.")
-        else:
-            print(f"Registry: Node '{node_id}' not found for removal.")
+        with self._lock:
+            if node_id in self._registered_nodes:
+                group = self._registered_nodes.pop(node_id).get("group")
+                if group in self._relays:
+                    self._relays[group]["members"].discard(node_id)
+                self._active_nodes.pop(node_id, None)
+                logger.info(f"Registry: Node '{node_id}' removed.")
+            else:
+                logger.info(f"Registry: Node '{node_id}' not found for removal.")
 
     def update_node_status(self, node_id: str, status: str):
         """
         Updates the status of a registered node.
         """
-        if node_id in self._registered_nodes:
-            self._registered_nodes[node_id]["status"] = status
-            print(f"Registry: Node '{node_id}' status updated to '{status}'.")
-        else:
-            print(f"Registry: Node '{node_id}' not found for status update.")
\ No newline at end of file
+        with self._lock:
+            if node_id in self._registered_nodes:
+                if status == "active":
+                    self._registered_nodes[node_id]["status"] = status
+                    self._registered_nodes[node_id]["last_seen"] = time.monotonic()
+                    self._activate(node_id)
+                else:
+                    self._deactivate(node_id, status)
+                logger.info(f"Registry: Node '{node_id}' status updated to '{status}'.")
+            else:
+                logger.info(f"Registry: Node '{node_id}' not found for status update.")
+
+    def register_relay(self, relay_id: str, endpoint_url: str):
+        """Registers (or re-registers) a sub-aggregator that can take a group of nodes."""
+        with self._lock:
+            previous = self._relays.get(relay_id, {})
+            self._relays[relay_id] = {
+                "endpoint": endpoint_url,
+                "members": previous.get("members", set()),
+                "last_seen": time.monotonic(),
+            }
+        logger.info(f"Registry: Relay '{relay_id}' registered with endpoint {endpoint_url}")
+        return True
+
+    def remove_relay(self, relay_id: str):
+        """Drops a relay; its members are reassigned the next time assign_group() is called for them."""
+        with self._lock:
+            relay = self._relays.pop(relay_id, None)
+            if relay is None:
+                return
+            for node_id in relay["members"]:
+                if node_id in self._registered_nodes:
+                    self._registered_nodes[node_id]["group"] = None
+        logger.warning(f"Registry: Relay '{relay_id}' removed; its nodes report to the Coordinator directly.")
+
+    def assign_group(self, node_id: str):
+        """
+        Returns (relay_id, endpoint) of the group a node reports to, or (None, None) without relays.
+        Assignments are sticky; new nodes join the relay with the fewest members.
+        """
+        with self._lock:
+            node = self._registered_nodes.get(node_id)
+            if node is None or not self._relays:
+                return None, None
+            group = node.get("group")
+            if group not in self._relays:
+                group = min(self._relays, key=lambda relay_id: (len(self._relays[relay_id]["members"]), relay_id))
+                self._relays[group]["members"].add(node_id)
+                node["group"] = group
+            return group, self._relays[group]["endpoint"]
+
+    def get_relays(self) -> dict:
+        """Returns {relay_id: endpoint} of all registered relays."""
+        with self._lock:
+            return {relay_id: relay["endpoint"] for relay_id, relay in self._relays.items()}
+
+    def group_sizes(self, node_ids) -> dict:
+        """Counts the given nodes per relay group: {relay_id: number of those nodes in its group}."""
+        sizes = {}
+        with self._lock:
+            for node_id in node_ids:
+                group = self._registered_nodes.get(node_id, {}).get("group")
+                if group in self._relays:
+                    sizes[group] = sizes.get(group, 0) + 1
+        return sizes
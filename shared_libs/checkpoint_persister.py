@@ -0,0 +1,156 @@
+# shared_libs/checkpoint_persister.py
+
+import logging
+import os
+import queue
+import threading
+import time
+
+from shared_libs.checkpoint_store import CheckpointStore, MANIFEST_NAME
+from shared_libs.metrics import METRICS
+from shared_libs.object_store import shared_s3_client
+
+logger = logging.getLogger(__name__)
+
+PHASE_SECONDS = METRICS.histogram(
+    'swarm_coordinator_phase_seconds', 'Time spent per round phase', ['phase'])
+PENDING_CHECKPOINTS = METRICS.gauge('swarm_coordinator_pending_checkpoints', 'Checkpoints queued for persistence')
+
+class CheckpointPersister:
+    """
+    Background persistence stage for round checkpoints.
+    Models are queued by the Coordinator and written to a versioned CheckpointStore (compact binary
+    files plus a manifest), then uploaded to S3 with a single reused client. The queue is bounded: if
+    persistence falls behind by `max_pending` checkpoints, submit() blocks until a slot frees up.
+    """
+    def __init__(self, model_save_dir, s3_bucket_name=None, s3_prefix="models", max_pending=4, full_every=10):
+        """
+        model_save_dir: local directory for checkpoint files (e.g. the mounted /app/models volume).
+        s3_bucket_name: bucket to upload checkpoints to; None disables the upload.
+        s3_prefix:      key prefix of uploaded checkpoints.
+        max_pending:    maximum number of checkpoints waiting to be persisted (backpressure bound).
+        full_every:     a full checkpoint every this many rounds, deltas against the previous round in between.
+        """
+        self.model_save_dir = model_save_dir
+        self.s3_bucket_name = s3_bucket_name
+        self.s3_prefix = s3_prefix
+        self.store = CheckpointStore(model_save_dir, full_every=full_every)
+        self._queue = queue.Queue(maxsize=max_pending)
+
+        self._stats_lock = threading.Lock()
+        self._pending_since = {}  # round_num -> submit time of checkpoints not yet persisted
+        self._last_persist_lag = 0.0
+        self._persisted_count = 0
+        self._failed_count = 0
+
+        os.makedirs(self.model_save_dir, exist_ok=True)
+        self._worker = threading.Thread(target=self._run, name="checkpoint-persister", daemon=True)
+        self._worker.start()
+        logger.info(f"CheckpointPersister initialized (dir={model_save_dir}, bucket={s3_bucket_name}, max_pending={max_pending}).")
+
+    def submit(self, round_num: int, model: dict, metrics=None):
+        """
+        Queues the checkpoint of `round_num` for persistence and returns immediately,
+        unless `max_pending` checkpoints are already waiting (then it blocks: backpressure).
+        `model` must not be mutated afterwards; the Coordinator replaces its global model dict each round.
+        """
+        with self._stats_lock:
+            self._pending_since[round_num] = time.monotonic()
+        if self._queue.full():
+            logger.warning("CheckpointPersister: Queue full, round %s waits for pending checkpoints to persist.", round_num)
+        self._queue.put((round_num, model, metrics))
+        PENDING_CHECKPOINTS.set(self._queue.qsize())
+
+    def _client(self):
+        return shared_s3_client()  # One pooled client per process, shared with the object store
+
+    def _persist(self, round_num, model, metrics=None):
+        entry = self.store.write(round_num, model, metrics)
+        model_filepath = os.path.join(self.model_save_dir, entry['file'])
+        logger.debug("CheckpointPersister: Global model for round %s saved to %s (%s, %d bytes)",
+                     round_num, model_filepath, entry['kind'], entry['size'])
+
+        if self.s3_bucket_name:
+            s3_key = f"{self.s3_prefix}/{entry['file']}"
+            self._client().upload_file(model_filepath, self.s3_bucket_name, s3_key)
+            # The manifest goes last, so it never references a checkpoint that is not uploaded yet
+            self._client().upload_file(self.store.manifest_path, self.s3_bucket_name, f"{self.s3_prefix}/{MANIFEST_NAME}")
+            logger.debug("CheckpointPersister: Global model for round %s uploaded to S3://%s/%s", round_num, self.s3_bucket_name, s3_key)
+
+    def restore_from_s3(self) -> bool:
+        """
+        Downloads the manifest and the checkpoint chain of the latest write from S3 when the local
+        store is empty (e.g. a Coordinator on a fresh volume). Returns True if anything was restored.
+        """
+        if not self.s3_bucket_name or self.store.rounds():
+            return False
+        try:
+            manifest_tmp = self.store.manifest_path + ".download"
+            self._client().download_file(self.s3_bucket_name, f"{self.s3_prefix}/{MANIFEST_NAME}", manifest_tmp)
+            os.replace(manifest_tmp, self.store.manifest_path)
+            entry = self.store.latest_written()  # What load_latest() resumes from
+            while entry is not None:
+                self._client().download_file(self.s3_bucket_name, f"{self.s3_prefix}/{entry['file']}",
+                                             os.path.join(self.model_save_dir, entry['file']))
+                entry = self.store.entry(entry['base_round']) if entry['kind'] == 'xor_delta' else None
+        except Exception as e:
+            logger.warning(f"CheckpointPersister: No checkpoints restored from S3://{self.s3_bucket_name}/{self.s3_prefix}: {e}")
+            return False
+        logger.info(f"CheckpointPersister: Restored checkpoints up to round {self.store.latest_written()['round']} from S3.")
+        return True
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            round_num, model, metrics = item
+            try:
+                with PHASE_SECONDS.time(phase='persist'):
+                    self._persist(round_num, model, metrics)
+                succeeded = True
+            except Exception as e:
+                logger.error(f"CheckpointPersister: ERROR saving model for round {round_num}: {e}")
+                succeeded = False
+            with self._stats_lock:
+                submitted_at = self._pending_since.pop(round_num, None)
+                if submitted_at is not None:
+                    self._last_persist_lag = time.monotonic() - submitted_at
+                if succeeded:
+                    self._persisted_count += 1
+                else:
+                    self._failed_count += 1
+            PENDING_CHECKPOINTS.set(self._queue.qsize())
+            self._queue.task_done()
+
+    def persist_lag(self) -> float:
+        """
+        Seconds the persistence stage is behind: the age of the oldest pending checkpoint,
+        or the lag of the last persisted one if nothing is pending.
+        """
+        with self._stats_lock:
+            if self._pending_since:
+                return time.monotonic() - min(self._pending_since.values())
+            return self._last_persist_lag
+
+    def stats(self) -> dict:
+        """Returns persistence metrics (pending count, lag in seconds, persisted/failed totals)."""
+        lag = self.persist_lag()
+        with self._stats_lock:
+            return {
+                "pending": len(self._pending_since),
+                "persist_lag_seconds": lag,
+                "last_persist_lag_seconds": self._last_persist_lag,
+                "persisted": self._persisted_count,
+                "failed": self._failed_count,
+            }
+
+    def flush(self):
+        """Blocks until every queued checkpoint has been persisted (or has failed)."""
+        self._queue.join()
+
+    def close(self):
+        """Persists what is still queued, then stops the worker."""
+        self._queue.put(None)
+        self._worker.join()
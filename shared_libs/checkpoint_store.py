@@ -0,0 +1,208 @@
+# shared_libs/checkpoint_store.py
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from shared_libs.model_codec import ModelCodec, model_hash
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.jsonl"
+
+
+def _write_order(entry):
+    """Sort key of manifest entries by when they were written (entries without 'seq' predate it)."""
+    return entry.get('seq', 0), entry.get('created_at', 0), entry['round']
+
+
+class CheckpointStore:
+    """
+    Versioned store of global model checkpoints in one directory.
+    Checkpoints are binary ModelCodec messages (float64, gzip). Every `full_every` rounds, or when the
+    feature order changes, a full checkpoint is written; in between, a checkpoint stores the XOR of
+    its float64 bit patterns with the previous round's, which compresses well when coefficients
+    change little and restores the model bit for bit. `manifest.jsonl` gets one line per round
+    (round, SHA-256 model hash, file, kind, base round, size, metrics, write sequence), appended and
+    fsynced, so a crash can at most lose or truncate the last line. A run that starts over in the
+    same directory overwrites rounds; the write sequence tells which checkpoint is the newest.
+    """
+    def __init__(self, directory, full_every=10, compression="gzip"):
+        self.directory = directory
+        self.full_every = max(int(full_every), 1)
+        self._codec = ModelCodec(dtype="float64", compression=compression)
+        self._lock = threading.Lock()
+        # (round, feature names, float64 bits as uint64, intercept) of the last model written or loaded
+        self._last = None
+        self._entries = None  # round -> manifest entry, loaded lazily
+        self._manifest_stat = None
+        self._seq = 0  # Highest write sequence in the manifest, including overwritten entries
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, MANIFEST_NAME)
+
+    def _read_manifest(self):
+        """Caller holds _lock. (Re)reads the manifest if it changed on disk."""
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            self._entries, self._manifest_stat = {}, None
+            return self._entries
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if self._entries is not None and signature == self._manifest_stat:
+            return self._entries
+        entries = {}
+        seq = 0
+        with open(self.manifest_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logger.warning("CheckpointStore: Skipping a damaged manifest line (interrupted write?).")
+                    continue
+                entries[entry['round']] = entry
+                seq = max(seq, entry.get('seq', 0))
+        self._entries, self._manifest_stat, self._seq = entries, signature, seq
+        return entries
+
+    def rounds(self):
+        """Rounds with a checkpoint, ascending."""
+        with self._lock:
+            return sorted(self._read_manifest())
+
+    def entry(self, round_num):
+        with self._lock:
+            return self._read_manifest().get(round_num)
+
+    def _write_file(self, name, data):
+        """Writes `data` to a temp file in the directory, then renames it into place."""
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp_")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, os.path.join(self.directory, name))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def write(self, round_num, model, metrics=None) -> dict:
+        """Stores the checkpoint of `round_num` and appends its manifest entry. Returns the entry."""
+        coef = model['coef']
+        feature_names = list(coef.keys())
+        bits = np.fromiter(coef.values(), dtype=np.float64, count=len(coef)).view(np.uint64)
+        intercept = float(model['intercept'])
+
+        with self._lock:
+            entries = self._read_manifest()
+            last = self._last
+            base_entry = entries.get(last[0]) if last else None
+            delta = (base_entry is not None and last[1] == feature_names
+                     and base_entry.get('chain_length', 0) + 1 < self.full_every)
+            if delta:
+                metadata = {'round_num': round_num, 'kind': 'xor_delta', 'base_round': last[0]}
+                body = self._codec.encode(feature_names, (bits ^ last[2]).view(np.float64), intercept,
+                                          metadata, include_schema=False)
+                chain_length = base_entry.get('chain_length', 0) + 1
+            else:
+                metadata = {'round_num': round_num, 'kind': 'full'}
+                body = self._codec.encode(feature_names, bits.view(np.float64), intercept, metadata)
+                self._codec.register_schema(feature_names)  # Deltas based on this round omit the names
+                chain_length = 0
+
+            name = f"global_model_round_{round_num}.swm"
+            self._write_file(name, body)
+            entry = {
+                'round': round_num,
+                'hash': model_hash(model),
+                'file': name,
+                'kind': metadata['kind'],
+                'base_round': metadata.get('base_round'),
+                'chain_length': chain_length,
+                'size': len(body),
+                'metrics': metrics or {},
+                'created_at': time.time(),
+                'seq': self._seq + 1,
+            }
+            with open(self.manifest_path, 'a') as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            entries[round_num] = entry
+            self._seq = entry['seq']
+            stat = os.stat(self.manifest_path)
+            self._manifest_stat = (stat.st_mtime_ns, stat.st_size)
+            self._last = (round_num, feature_names, bits, intercept)
+        return entry
+
+    def _load_locked(self, round_num):
+        entries = self._read_manifest()
+        entry = entries.get(round_num)
+        if entry is None:
+            raise KeyError(f"No checkpoint for round {round_num}.")
+        last = self._last
+        if entry['kind'] == 'xor_delta' and (last is None or last[0] != entry['base_round']):
+            self._load_locked(entry['base_round'])  # Restores the chain up to the base into self._last
+            last = self._last
+
+        with open(os.path.join(self.directory, entry['file']), 'rb') as f:
+            payload = self._codec.decode(f.read())
+        bits = payload.values.view(np.uint64)
+        if entry['kind'] == 'xor_delta':
+            bits = bits ^ last[2]
+        model = {'coef': dict(zip(payload.feature_names, bits.view(np.float64).tolist())),
+                 'intercept': payload.intercept}
+        if model_hash(model) != entry['hash']:
+            raise ValueError(f"Checkpoint of round {round_num} does not match its recorded SHA-256.")
+        self._last = (round_num, list(payload.feature_names), bits, payload.intercept)
+        return model
+
+    def load(self, round_num) -> dict:
+        """Loads and verifies the checkpoint of `round_num` (following its delta chain)."""
+        with self._lock:
+            return self._load_locked(round_num)
+
+    def written_rounds(self):
+        """Rounds with a checkpoint, in the order their checkpoints were written (newest last)."""
+        with self._lock:
+            return [entry['round'] for entry in sorted(self._read_manifest().values(), key=_write_order)]
+
+    def latest_written(self):
+        """
+        Manifest entry of the checkpoint written last, or None. Unlike latest_round(), this follows
+        a Coordinator that restarted from round 1 without resuming.
+        """
+        with self._lock:
+            entries = self._read_manifest()
+            if not entries:
+                return None
+            return max(entries.values(), key=_write_order)
+
+    def latest_round(self):
+        """Newest round in the manifest, or None."""
+        rounds = self.rounds()
+        return rounds[-1] if rounds else None
+
+    def load_latest(self):
+        """
+        Returns (round, model) of the most recently written checkpoint that loads and matches its hash,
+        trying earlier writes if it is missing or damaged; (None, None) if there is none. After a run
+        that started over, this is its newest round, not a higher round left by the previous run.
+        """
+        for round_num in reversed(self.written_rounds()):
+            try:
+                return round_num, self.load(round_num)
+            except (OSError, KeyError, ValueError) as e:
+                logger.error(f"CheckpointStore: Checkpoint of round {round_num} is unusable ({e}). Trying an older one.")
+                with self._lock:
+                    self._last = None
+        return None, None
@@ -0,0 +1,137 @@
+# shared_libs/data_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pyarrow.parquet as pq
+
+from shared_libs.object_store import object_store_from_env
+
+logger = logging.getLogger(__name__)
+
+
+class CachedDataset:
+    """Feature matrix (float32, usually a read-only memory map), target vector and feature names."""
+    def __init__(self, feature_names, X, y):
+        self.feature_names = feature_names
+        self.X = X
+        self.y = y
+
+    def __len__(self):
+        return len(self.y)
+
+
+class LocalDataCache:
+    """
+    On-disk, content-addressed cache for the Parquet datasets of a Swarm Node.
+    Objects are stored under a digest of their S3 ETag, so a restarted container reuses its
+    previous download as long as the object did not change; downloads go through an ObjectStore
+    (parallel ranged GETs written straight into the cache file). Parquet files are read through Arrow
+    memory maps with column projection, and can be converted once into a contiguous float32
+    feature matrix (.npy) that later starts load with np.load(mmap_mode='r') in near-constant time.
+    """
+    def __init__(self, cache_dir, s3_bucket_name=None, object_store=None):
+        self.cache_dir = cache_dir
+        self.s3_bucket_name = s3_bucket_name
+        self._object_store = object_store  # Created on the first download unless given
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _store(self):
+        if self._object_store is None:
+            self._object_store = object_store_from_env(self.s3_bucket_name)
+        return self._object_store
+
+    @staticmethod
+    def _digest(*parts) -> str:
+        return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:32]
+
+    def fetch(self, s3_key, local_path=None):
+        """
+        Returns (parquet_path, version) for the dataset.
+        With `local_path` the file is used in place and versioned by mtime/size; otherwise the
+        S3 object is downloaded (ranges in parallel, straight to disk) unless its ETag is already cached.
+        """
+        if local_path:
+            stat = os.stat(local_path)
+            return local_path, f"{local_path}@{stat.st_mtime_ns}-{stat.st_size}"
+
+        info = self._store().head(s3_key)
+        etag = info.etag
+        version = f"s3://{self.s3_bucket_name}/{s3_key}@{etag}"
+        cached_path = os.path.join(self.cache_dir, f"{self._digest(version)}.parquet")
+        if os.path.exists(cached_path):
+            logger.debug("LocalDataCache: Cache hit for S3://%s/%s (ETag %s).", self.s3_bucket_name, s3_key, etag)
+            return cached_path, version
+
+        logger.info("LocalDataCache: Downloading S3://%s/%s (ETag %s)...", self.s3_bucket_name, s3_key, etag)
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".tmp_", suffix=".parquet")
+        os.close(fd)
+        try:
+            self._store().download_to_file(s3_key, tmp_path, info=info)
+            os.replace(tmp_path, cached_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return cached_path, version
+
+    def load_frame(self, parquet_path, columns=None):
+        """Reads the Parquet file into pandas through an Arrow memory map, keeping only `columns`."""
+        return pq.read_table(parquet_path, columns=columns, memory_map=True).to_pandas()
+
+    def load_feature_matrix(self, parquet_path, version, target_column='Target', feature_columns=None) -> CachedDataset:
+        """
+        Returns the dataset as a read-only float32 memory map of the features plus the target vector.
+        The .npy files are built once per (version, projection) by copying one row group and one
+        column at a time, so peak memory stays around a single column chunk.
+        """
+        entry_dir = os.path.join(self.cache_dir, self._digest(version, target_column, feature_columns))
+        if not os.path.isdir(entry_dir):
+            self._build_feature_matrix(parquet_path, entry_dir, target_column, feature_columns)
+        else:
+            logger.debug("LocalDataCache: Reusing feature matrix %s.", entry_dir)
+
+        with open(os.path.join(entry_dir, "features.json")) as f:
+            feature_names = json.load(f)
+        X = np.load(os.path.join(entry_dir, "X.npy"), mmap_mode='r')
+        y = np.load(os.path.join(entry_dir, "y.npy"), mmap_mode='r')
+        return CachedDataset(feature_names, X, y)
+
+    def _build_feature_matrix(self, parquet_path, entry_dir, target_column, feature_columns):
+        parquet_file = pq.ParquetFile(parquet_path, memory_map=True)
+        column_names = parquet_file.schema_arrow.names
+        if target_column not in column_names:
+            raise KeyError(f"Target column '{target_column}' not found in {parquet_path}")
+        feature_names = list(feature_columns) if feature_columns else [c for c in column_names if c != target_column]
+        n_rows = parquet_file.metadata.num_rows
+        logger.info("LocalDataCache: Converting %s into a %d x %d float32 matrix...",
+                    parquet_path, n_rows, len(feature_names))
+
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix=".tmp_")
+        try:
+            X = np.lib.format.open_memmap(os.path.join(tmp_dir, "X.npy"), mode='w+',
+                                          dtype=np.float32, shape=(n_rows, len(feature_names)))
+            y = np.lib.format.open_memmap(os.path.join(tmp_dir, "y.npy"), mode='w+',
+                                          dtype=np.float64, shape=(n_rows,))
+            row = 0
+            for group in range(parquet_file.num_row_groups):
+                table = parquet_file.read_row_group(group, columns=feature_names + [target_column])
+                rows = table.num_rows
+                for j, name in enumerate(feature_names):
+                    X[row:row + rows, j] = table.column(name).to_numpy()
+                y[row:row + rows] = table.column(target_column).to_numpy()
+                row += rows
+            X.flush()
+            y.flush()
+            del X, y
+            with open(os.path.join(tmp_dir, "features.json"), "w") as f:
+                json.dump(feature_names, f)
+            os.replace(tmp_dir, entry_dir)  # Publish the complete entry atomically
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
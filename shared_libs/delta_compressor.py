@@ -0,0 +1,81 @@
+# shared_libs/delta_compressor.py
+
+import numpy as np
+
+from shared_libs.model_codec import DELTA_QUANTIZATIONS, dequantize, quantize
+
+
+class CompressedDelta:
+    """A delta ready for ModelCodec.encode_delta: quantized values, their scale and optional sparse indices."""
+    def __init__(self, quantized, scale, indices=None, residual=None):
+        self.quantized = quantized
+        self.scale = scale
+        self.indices = indices  # None for a dense delta
+        self.residual = residual  # Error-feedback residual to keep once this delta was delivered
+
+
+class DeltaCompressor:
+    """
+    Turns a node's per-round model delta into a compact update: optional top-k sparsification
+    (largest-magnitude entries) followed by optional float16/int8 quantization.
+    With error feedback, whatever was dropped or rounded away is kept as a residual and added to
+    the next round's delta, so compression errors are delayed rather than lost. The residual only
+    advances on commit(), i.e. once the receiver accepted the compressed delta.
+    One compressor per node; it must see the deltas of one fixed feature ordering.
+    """
+    def __init__(self, quantization=None, top_k_fraction=None, error_feedback=True, dtype="float64"):
+        """
+        quantization:    None, 'float16' or 'int8'.
+        top_k_fraction:  fraction (0, 1] of entries kept per round; None sends all entries.
+        error_feedback:  carry the compression error over to the next round.
+        dtype:           wire dtype used when `quantization` is None.
+        """
+        if quantization not in DELTA_QUANTIZATIONS:
+            raise ValueError(f"Unsupported quantization '{quantization}'. Use one of {DELTA_QUANTIZATIONS}.")
+        if top_k_fraction is not None and not 0 < top_k_fraction <= 1:
+            raise ValueError("top_k_fraction must be in (0, 1].")
+        self.quantization = quantization
+        self.top_k_fraction = top_k_fraction
+        self.error_feedback = error_feedback
+        self.dtype = dtype
+        self._residual = None
+
+    def compress(self, delta) -> CompressedDelta:
+        """
+        Compresses one round's delta (float vector). The error-feedback residual is not updated
+        until the result is passed to commit().
+        """
+        delta = np.asarray(delta, dtype=np.float64)
+        if self.error_feedback and self._residual is not None and self._residual.shape == delta.shape:
+            corrected = delta + self._residual
+        else:
+            corrected = delta
+
+        indices = None
+        selected = corrected
+        if self.top_k_fraction is not None and self.top_k_fraction < 1:
+            k = max(1, int(np.ceil(self.top_k_fraction * corrected.size)))
+            if k < corrected.size:
+                indices = np.sort(np.argpartition(np.abs(corrected), -k)[-k:]).astype(np.uint32)
+                selected = corrected[indices]
+
+        quantized, scale = quantize(selected, self.quantization, self.dtype)
+
+        residual = None
+        if self.error_feedback:
+            sent = dequantize(quantized, scale)
+            if indices is None:
+                residual = corrected - sent
+            else:
+                residual = corrected.copy()
+                residual[indices] -= sent
+        return CompressedDelta(quantized, scale, indices, residual)
+
+    def commit(self, compressed):
+        """Keeps the residual of a compressed delta the receiver accepted (see compress)."""
+        if self.error_feedback:
+            self._residual = compressed.residual
+
+    def reset(self):
+        """Drops the residual, e.g. after the node's feature set changed."""
+        self._residual = None
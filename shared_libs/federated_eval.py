@@ -0,0 +1,110 @@
+# shared_libs/federated_eval.py
+
+import math
+import time
+
+import numpy as np
+
+# Sums a node reports about one global model on its held-out rows; all of them add up across nodes
+EVALUATION_FIELDS = ('samples', 'sse', 'sae', 'sum_y', 'sum_y2')
+
+
+def holdout_split(n_rows, fraction) -> int:
+    """Row index where a node's held-out tail starts (n_rows if nothing is held out)."""
+    if not 0.0 < fraction < 1.0 or n_rows < 2:
+        return n_rows
+    return n_rows - min(max(int(round(n_rows * fraction)), 1), n_rows - 1)
+
+
+class LocalEvaluator:
+    """
+    Scores global models on a node's held-out rows (`X`, `y`; a memory-mapped matrix works, it is
+    read `batch_size` rows at a time as float64). Rows with missing values are skipped like in
+    training. evaluate() only reads shared arrays, so it can run in a thread next to local training.
+    """
+    def __init__(self, X, y, batch_size=65536):
+        self.X = X
+        self.y = y
+        self.batch_size = batch_size
+
+    def evaluate(self, coef, intercept, columns=None) -> dict:
+        """
+        Sample-additive loss statistics of (coef, intercept): samples, sse, sae, sum_y, sum_y2, seconds.
+        With `columns`, coef covers those column indices of the held-out matrix only.
+        """
+        started = time.monotonic()
+        coef = np.asarray(coef, dtype=np.float64)
+        stats = dict.fromkeys(EVALUATION_FIELDS, 0.0)
+        for start in range(0, len(self.y), self.batch_size):
+            X_batch = self.X[start:start + self.batch_size]
+            X_batch = np.asarray(X_batch if columns is None else X_batch[:, columns], dtype=np.float64)
+            y_batch = np.asarray(self.y[start:start + self.batch_size], dtype=np.float64)
+            finite = np.isfinite(X_batch).all(axis=1) & np.isfinite(y_batch)
+            if not finite.all():
+                X_batch, y_batch = X_batch[finite], y_batch[finite]
+            residuals = X_batch @ coef + intercept - y_batch
+            stats['samples'] += len(y_batch)
+            stats['sse'] += float(residuals @ residuals)
+            stats['sae'] += float(np.abs(residuals).sum())
+            stats['sum_y'] += float(y_batch.sum())
+            stats['sum_y2'] += float(y_batch @ y_batch)
+        stats['samples'] = int(stats['samples'])
+        stats['seconds'] = time.monotonic() - started
+        return stats
+
+
+class EvaluationAggregate:
+    """
+    Combines the nodes' evaluation statistics of one global model into swarm-wide metrics. The
+    reported sums are added up, so every held-out sample counts once (sample-weighted), and partial
+    aggregates from relays merge exactly. Not thread-safe, like RunningAggregate.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.totals = dict.fromkeys(EVALUATION_FIELDS, 0.0)
+        self.num_nodes = 0
+
+    @staticmethod
+    def validate(stats) -> dict:
+        """Returns the statistics as floats; raises ValueError for missing, non-finite or negative values."""
+        if not isinstance(stats, dict):
+            raise ValueError("evaluation must be an object")
+        try:
+            values = {name: float(stats[name]) for name in EVALUATION_FIELDS}
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"invalid evaluation statistics: {e}")
+        if not all(math.isfinite(v) for v in values.values()):
+            raise ValueError("evaluation statistics must be finite")
+        if values['samples'] < 0 or values['sse'] < 0 or values['sae'] < 0 or values['sum_y2'] < 0:
+            raise ValueError("evaluation statistics must not be negative")
+        return values
+
+    def add(self, stats, num_nodes=1):
+        """Adds one node's statistics (or a relay's sums over `num_nodes` nodes)."""
+        values = self.validate(stats)
+        for name in EVALUATION_FIELDS:
+            self.totals[name] += values[name]
+        self.num_nodes += num_nodes
+
+    def export_state(self) -> dict:
+        return dict(self.totals, nodes=self.num_nodes)
+
+    def merge_state(self, state):
+        self.add(state, num_nodes=int(state.get('nodes', 1)))
+
+    def result(self):
+        """{'nodes', 'samples', 'mse', 'mae', 'r2'}, or None if no held-out samples were reported."""
+        samples = self.totals['samples']
+        if samples <= 0:
+            return None
+        mean_y = self.totals['sum_y'] / samples
+        total_variance = self.totals['sum_y2'] - samples * mean_y * mean_y
+        return {
+            'nodes': self.num_nodes,
+            'samples': int(samples),
+            'mse': self.totals['sse'] / samples,
+            'mae': self.totals['sae'] / samples,
+            'r2': 1.0 - self.totals['sse'] / total_variance if total_variance > 0 else None,
+        }
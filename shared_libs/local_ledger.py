@@ -0,0 +1,122 @@
+# shared_libs/local_ledger.py
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+def record_leaf_hash(record: dict) -> str:
+    """Leaf hash of one aggregation record, shared by the Python side and the chaincode."""
+    leaf = f"{record['round_num']}:{record['model_hash']}:{record['aggregated_by']}"
+    return hashlib.sha256(leaf.encode('utf-8')).hexdigest()
+
+
+def merkle_root(leaf_hashes) -> str:
+    """
+    Merkle root (hex SHA-256) of hex leaf hashes. Odd levels duplicate their last node,
+    matching computeMerkleRoot in chaincode/hash_recorder_chaincode.go.
+    """
+    level = list(leaf_hashes)
+    if not level:
+        raise ValueError("Cannot build a Merkle root of zero records.")
+    while len(level) > 1:
+        if len(level) % 2 == 1:
+            level.append(level[-1])
+        level = [hashlib.sha256(bytes.fromhex(level[i]) + bytes.fromhex(level[i + 1])).hexdigest()
+                 for i in range(0, len(level), 2)]
+    return level[0]
+
+
+class LedgerError(Exception):
+    """Raised when the ledger rejects a transaction (e.g. a round hash that already exists)."""
+
+
+class LocalLedger:
+    """
+    SQLite-backed stand-in for the Fabric channel running hash_recorder_chaincode.
+    It implements the same RecordHash / RecordHashBatch / QueryHash semantics and can add an
+    artificial endorsement+commit latency per transaction, so the ledger writer's throughput can
+    be measured without a Fabric network. Use ':memory:' as the path for throwaway runs.
+    """
+    def __init__(self, db_path, commit_latency=0.0):
+        self.db_path = db_path
+        self.commit_latency = commit_latency
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS hash_records ("
+                " round_num INTEGER PRIMARY KEY, model_hash TEXT NOT NULL, aggregated_by TEXT NOT NULL,"
+                " timestamp INTEGER NOT NULL, tx_id TEXT NOT NULL)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS transactions ("
+                " tx_id TEXT PRIMARY KEY, function TEXT NOT NULL, record_count INTEGER NOT NULL,"
+                " merkle_root TEXT, committed_at REAL NOT NULL)")
+        logger.info("LocalLedger initialized at '%s' (simulated commit latency %ss).", db_path, commit_latency)
+
+    def _commit(self, function, records, root=None) -> str:
+        """Validates and writes all records in one transaction; all-or-nothing like a Fabric tx."""
+        for record in records:
+            if record['round_num'] <= 0:
+                raise LedgerError("Round number must be a positive integer")
+            if not record['model_hash']:
+                raise LedgerError("Model hash cannot be empty")
+            if not record['aggregated_by']:
+                raise LedgerError("Aggregator ID cannot be empty")
+
+        if self.commit_latency:
+            time.sleep(self.commit_latency)  # Endorsement + ordering + commit round trip
+
+        tx_id = uuid.uuid4().hex
+        now = int(time.time())
+        with self._lock:
+            try:
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT INTO hash_records (round_num, model_hash, aggregated_by, timestamp, tx_id) VALUES (?, ?, ?, ?, ?)",
+                        [(r['round_num'], r['model_hash'], r['aggregated_by'], now, tx_id) for r in records])
+                    self._conn.execute(
+                        "INSERT INTO transactions (tx_id, function, record_count, merkle_root, committed_at) VALUES (?, ?, ?, ?, ?)",
+                        (tx_id, function, len(records), root, time.time()))
+            except sqlite3.IntegrityError as e:
+                raise LedgerError(f"Hash for one of rounds {[r['round_num'] for r in records]} already exists "
+                                  f"on the ledger. Cannot overwrite. ({e})")
+        return tx_id
+
+    def record_hash(self, round_num, model_hash, aggregated_by) -> str:
+        """Equivalent of the RecordHash chaincode function. Returns the transaction id."""
+        return self._commit("RecordHash", [
+            {'round_num': round_num, 'model_hash': model_hash, 'aggregated_by': aggregated_by}])
+
+    def record_hash_batch(self, records, expected_root=None) -> tuple:
+        """
+        Equivalent of the RecordHashBatch chaincode function: stores several records in one
+        transaction and returns (tx_id, merkle_root). If `expected_root` is given it must match.
+        """
+        root = merkle_root(record_leaf_hash(r) for r in records)
+        if expected_root is not None and expected_root != root:
+            raise LedgerError(f"Merkle root mismatch: expected {expected_root}, computed {root}")
+        return self._commit("RecordHashBatch", records, root), root
+
+    def query_hash(self, round_num) -> dict:
+        """Equivalent of the QueryHash chaincode function."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT round_num, model_hash, aggregated_by, timestamp, tx_id FROM hash_records WHERE round_num = ?",
+                (round_num,)).fetchone()
+        if row is None:
+            raise LedgerError(f"Hash record for round {round_num} does not exist")
+        return dict(zip(("round_num", "model_hash", "aggregated_by", "timestamp", "tx_id"), row))
+
+    def transaction_count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
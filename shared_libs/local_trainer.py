@@ -0,0 +1,104 @@
+# shared_libs/local_trainer.py
+
+import time
+
+import numpy as np
+from sklearn.linear_model import SGDRegressor
+
+
+class LocalTrainer:
+    """
+    Streams a node's feature matrix through one reused SGDRegressor in fixed-size mini-batches
+    for a configurable number of epochs. Only one batch is materialized (as float64) at a time, so
+    a memory-mapped matrix larger than RAM can be trained on, and the per-round cost is the batch
+    work itself rather than re-building the estimator and re-converting the whole dataset.
+    Models over a subset of the columns (training jobs) get their own estimator per feature count.
+    """
+    def __init__(self, learning_rate=0.01, batch_size=4096, epochs=1, shuffle_batches=True, random_state=42):
+        self.learning_rate = learning_rate
+        self.batch_size = batch_size
+        self.epochs = epochs
+        self.shuffle_batches = shuffle_batches
+        self._rng = np.random.default_rng(random_state)
+        self._random_state = random_state
+        self._estimators = {}  # Feature count -> SGDRegressor, created on the first round and reused afterwards
+        self.last_stats = {}
+
+    def _get_estimator(self, X_batch, y_batch):
+        estimator = self._estimators.get(X_batch.shape[1])
+        if estimator is None:
+            estimator = SGDRegressor(
+                loss='squared_error',
+                penalty=None, alpha=0.0001,
+                max_iter=1, tol=None,
+                learning_rate='constant', eta0=self.learning_rate,
+                random_state=self._random_state  # for reproducibility
+            )
+            # Warm-up fit so coef_/intercept_ exist and can be overwritten with the global model
+            estimator.partial_fit(X_batch[:1], y_batch[:1])
+            self._estimators[X_batch.shape[1]] = estimator
+        return estimator
+
+    def _batches(self, n_rows):
+        """Yields (start, stop) row ranges of the mini-batches of one epoch."""
+        starts = np.arange(0, n_rows, self.batch_size)
+        if self.shuffle_batches:
+            self._rng.shuffle(starts)  # Shuffles batch order only, so reads stay sequential within a batch
+        for start in starts:
+            yield int(start), int(min(start + self.batch_size, n_rows))
+
+    @staticmethod
+    def _finite_batch(X, y, start, stop, columns=None):
+        """Materializes one batch (of `columns` only, if given) as float64 and drops rows with missing values."""
+        X_batch = X[start:stop]
+        X_batch = np.asarray(X_batch if columns is None else X_batch[:, columns], dtype=np.float64)
+        y_batch = np.asarray(y[start:stop], dtype=np.float64)
+        finite = np.isfinite(X_batch).all(axis=1) & np.isfinite(y_batch)
+        if not finite.all():
+            return X_batch[finite], y_batch[finite]
+        return X_batch, y_batch
+
+    def train(self, X, y, coef, intercept, epochs=None, learning_rate=None, columns=None):
+        """
+        Runs `epochs` passes of mini-batch SGD starting from (coef, intercept).
+        X may be a NumPy array or memory map (n_samples x n_features) and y its target vector.
+        `columns` trains on those column indices of X only (coef then has one entry per column).
+        `epochs` and `learning_rate` override the configured values for this round only.
+        Returns (coef, intercept) as NumPy arrays; per-round statistics are kept in last_stats.
+        """
+        epochs = self.epochs if epochs is None else epochs
+        learning_rate = self.learning_rate if learning_rate is None else learning_rate
+        started = time.monotonic()
+        n_rows = len(y)
+        samples_seen = 0
+        skipped_rows = 0
+        batches = 0
+        estimator = None
+
+        for _ in range(epochs):
+            for start, stop in self._batches(n_rows):
+                X_batch, y_batch = self._finite_batch(X, y, start, stop, columns)
+                skipped_rows += (stop - start) - len(y_batch)
+                if len(y_batch) == 0:
+                    continue
+                if estimator is None:
+                    estimator = self._get_estimator(X_batch, y_batch)
+                    estimator.eta0 = learning_rate
+                    estimator.coef_ = np.array(coef, dtype=np.float64)
+                    estimator.intercept_ = np.array([intercept], dtype=np.float64)
+                estimator.partial_fit(X_batch, y_batch)
+                samples_seen += len(y_batch)
+                batches += 1
+
+        elapsed = time.monotonic() - started
+        self.last_stats = {
+            "epochs": epochs,
+            "batches": batches,
+            "samples": samples_seen,
+            "skipped_rows": skipped_rows,
+            "seconds": elapsed,
+            "samples_per_sec": samples_seen / elapsed if elapsed > 0 else 0.0,
+        }
+        if estimator is None:
+            return np.array(coef, dtype=np.float64), float(intercept)
+        return estimator.coef_.copy(), float(estimator.intercept_[0])
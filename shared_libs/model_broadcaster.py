@@ -0,0 +1,162 @@
+# shared_libs/model_broadcaster.py
+
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class ModelBroadcaster:
+    """
+    Sends the global model to every registered Swarm Node concurrently.
+    Each node endpoint gets its own keep-alive session, so consecutive rounds reuse
+    TCP connections instead of opening new ones, and a slow node only delays itself.
+    """
+    def __init__(self, max_workers=32, request_timeout=5.0, node_deadline=15.0, max_retries=2, retry_backoff=0.5,
+                 session_factory=None):
+        """
+        max_workers:     size of the bounded worker pool used for the fan-out.
+        request_timeout: timeout (seconds) of a single POST attempt.
+        node_deadline:   total time budget (seconds) per node, including retries.
+        max_retries:     number of additional attempts after the first failure.
+        retry_backoff:   base delay (seconds) between attempts, doubled on each retry.
+        session_factory: optional callable(endpoint_url) returning a session-like object with post()/close();
+                         used e.g. by the in-process swarm simulator. Defaults to pooled requests sessions.
+        """
+        self.request_timeout = request_timeout
+        self.node_deadline = node_deadline
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._session_factory = session_factory or self._pooled_session
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="model-broadcast")
+        self._sessions = {}  # endpoint_url -> requests.Session
+        self._sessions_lock = threading.Lock()
+        logger.info("ModelBroadcaster initialized (workers=%d, deadline=%ss, retries=%d).",
+                    max_workers, node_deadline, max_retries)
+
+    @staticmethod
+    def _pooled_session(endpoint_url: str) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _get_session(self, endpoint_url: str) -> requests.Session:
+        """Returns the pooled keep-alive session for a node endpoint, creating it on first use."""
+        with self._sessions_lock:
+            session = self._sessions.get(endpoint_url)
+            if session is None:
+                session = self._session_factory(endpoint_url)
+                self._sessions[endpoint_url] = session
+            return session
+
+    def _discard_session(self, endpoint_url: str, session):
+        """
+        Drops a session whose connections are likely stale, so the next attempt opens a fresh one.
+        It is not closed: other broadcasts (e.g. of concurrent training jobs) may still be using it.
+        """
+        with self._sessions_lock:
+            if self._sessions.get(endpoint_url) is session:
+                del self._sessions[endpoint_url]
+
+    def _deliver(self, node_id: str, endpoint_url: str, body: bytes, headers: dict, fallback=None) -> dict:
+        """
+        Posts the encoded model to one node, retrying until it succeeds or its deadline expires.
+        `fallback` is an optional (body, headers) pair sent instead after a 409 Conflict, e.g. a message
+        carrying the full feature schema when the node did not recognise the schema hash.
+        """
+        target_url = f"{endpoint_url}/model_update"
+        session = self._get_session(endpoint_url)
+        started = time.monotonic()
+        deadline = started + self.node_deadline
+        attempts = 0
+        failures = 0
+        last_error = None
+
+        while failures <= self.max_retries:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                last_error = last_error or "deadline exceeded"
+                break
+            attempts += 1
+            try:
+                response = session.post(target_url, data=body, headers=headers,
+                                        timeout=min(self.request_timeout, remaining))
+                if response.status_code == 409 and fallback is not None:
+                    body, headers = fallback  # Does not count as a failed attempt
+                    fallback = None
+                    continue
+                response.raise_for_status()
+                return {
+                    "node_id": node_id,
+                    "delivered": True,
+                    "attempts": attempts,
+                    "latency": time.monotonic() - started,
+                    "error": None,
+                }
+            except requests.exceptions.RequestException as e:
+                last_error = str(e)
+                failures += 1
+                # Drop pooled connections for this endpoint; they are likely stale.
+                self._discard_session(endpoint_url, session)
+                session = self._get_session(endpoint_url)
+                delay = self.retry_backoff * (2 ** (failures - 1))
+                if failures <= self.max_retries and time.monotonic() + delay < deadline:
+                    time.sleep(delay)
+
+        return {
+            "node_id": node_id,
+            "delivered": False,
+            "attempts": attempts,
+            "latency": time.monotonic() - started,
+            "error": last_error,
+        }
+
+    def broadcast(self, nodes: dict, payload: dict) -> dict:
+        """
+        Delivers `payload` to all `nodes` ({node_id: endpoint_url}) in parallel.
+        The payload is serialized once and shared by all deliveries.
+        Returns {node_id: delivery report} with per-node latency, attempts and error.
+        """
+        if not nodes:
+            return {}
+
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json"}
+        return self.broadcast_bodies({
+            node_id: (endpoint_url, body, headers, None) for node_id, endpoint_url in nodes.items()
+        })
+
+    def broadcast_bodies(self, deliveries: dict) -> dict:
+        """
+        Like broadcast(), but with pre-encoded bodies per node:
+        {node_id: (endpoint_url, body, headers, fallback)} where fallback is None or (body, headers).
+        Lets the caller encode each distinct wire format once and share it between nodes.
+        """
+        futures = {
+            node_id: self._executor.submit(self._deliver, node_id, endpoint_url, body, headers, fallback)
+            for node_id, (endpoint_url, body, headers, fallback) in deliveries.items()
+        }
+        return {node_id: future.result() for node_id, future in futures.items()}
+
+    def forget_node(self, endpoint_url: str):
+        """Closes and drops the pooled session of a node that left the swarm."""
+        with self._sessions_lock:
+            session = self._sessions.pop(endpoint_url, None)
+        if session is not None:
+            session.close()
+
+    def close(self):
+        """Shuts down the worker pool and closes every pooled session."""
+        self._executor.shutdown(wait=True)
+        with self._sessions_lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
@@ -0,0 +1,382 @@
+# shared_libs/model_codec.py
+
+import gzip
+import hashlib
+import io
+import json
+import logging
+import math
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:  # zstd compression is optional
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+MODEL_CONTENT_TYPE = "application/x-swarm-model"
+# Partial aggregate (RunningAggregate state) forwarded by a sub-aggregator to the Coordinator
+PARTIAL_AGGREGATE_CONTENT_TYPE = "application/x-swarm-partial-aggregate"
+JSON_CONTENT_TYPE = "application/json"
+# Wire formats a peer can advertise at registration, in order of preference
+SUPPORTED_WIRE_FORMATS = ["binary", "json"]
+
+_MAGIC = b"SWM1"
+_VERSION = 1
+# magic, version, dtype code, compression code, flags, n_features, schema hash
+_HEADER = struct.Struct("<4sBBBBI16s")
+_FLAG_HAS_SCHEMA = 0x01
+_FLAG_DELTA = 0x02  # Values are a difference from the round's global model (followed by a dequantization scale)
+_FLAG_SPARSE = 0x04  # Only (index, value) pairs of the non-dropped entries are sent
+
+_DTYPES = {"float32": 4, "float64": 8}
+# Dtype codes are the element sizes; int8 and float16 are only used for (quantized) delta messages
+_DTYPE_BY_CODE = {1: np.dtype("i1"), 2: np.dtype("<f2"), 4: np.dtype("<f4"), 8: np.dtype("<f8")}
+_COMPRESSIONS = {None: 0, "gzip": 1, "zstd": 2}
+# Quantizations supported for delta updates (None keeps the codec's dtype)
+DELTA_QUANTIZATIONS = [None, "float16", "int8"]
+
+
+class UnknownSchemaError(ValueError):
+    """Raised when a message references a feature schema the receiver has not seen yet."""
+
+
+def schema_hash(feature_names) -> bytes:
+    """16-byte digest identifying an ordered list of feature names."""
+    return hashlib.blake2b("\x1f".join(feature_names).encode("utf-8"), digest_size=16).digest()
+
+
+def quantize(values, quantization, dtype="float64"):
+    """
+    Quantizes a float vector for a delta message. Returns (quantized array, scale) such that
+    dequantize(quantized, scale) approximates `values`. int8 uses one symmetric scale per message.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if quantization is None:
+        return values.astype(_DTYPE_BY_CODE[_DTYPES[dtype]]), 1.0
+    if quantization == "float16":
+        limit = float(np.finfo(np.float16).max)
+        return np.clip(values, -limit, limit).astype("<f2"), 1.0
+    if quantization == "int8":
+        peak = float(np.max(np.abs(values))) if values.size else 0.0
+        scale = peak / 127.0 if peak > 0 else 1.0
+        return np.clip(np.rint(values / scale), -127, 127).astype("i1"), scale
+    raise ValueError(f"Unsupported quantization '{quantization}'. Use one of {DELTA_QUANTIZATIONS}.")
+
+
+def dequantize(quantized, scale) -> np.ndarray:
+    """Inverse of quantize(), as float64."""
+    values = np.asarray(quantized).astype(np.float64)
+    if scale != 1.0:
+        values *= scale
+    return values
+
+
+def model_hash(model: dict) -> str:
+    """
+    SHA-256 of a model in canonical binary form (features sorted by name, float64 values, intercept).
+    Order-independent like json.dumps(sort_keys=True), without the float-to-text conversion.
+    """
+    coef = model['coef']
+    names = sorted(coef)
+    values = np.fromiter((coef[name] for name in names), dtype="<f8", count=len(names))
+    digest = hashlib.sha256()
+    digest.update("\x1f".join(names).encode("utf-8"))
+    digest.update(values.tobytes())
+    digest.update(struct.pack("<d", float(model['intercept'])))
+    return digest.hexdigest()
+
+
+def _finite_number(value) -> bool:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return False
+    try:
+        return math.isfinite(value)
+    except OverflowError:  # int too large for a float
+        return False
+
+
+def validate_model(model):
+    """
+    Raises ValueError unless `model` (a received ModelPayload, or a `{'coef', 'intercept'}` dict
+    from a JSON body) holds finite numbers only.
+    """
+    if isinstance(model, ModelPayload):
+        if not (np.isfinite(model.values).all() and math.isfinite(model.intercept)):
+            raise ValueError("model parameters must be finite")
+        return
+    if not isinstance(model, dict):
+        raise ValueError("model must be an object")
+    coef = model.get('coef')
+    if not isinstance(coef, dict) or not all(_finite_number(value) for value in coef.values()):
+        raise ValueError("'coef' must map feature names to finite numbers")
+    if not _finite_number(model.get('intercept')):
+        raise ValueError("'intercept' must be a finite number")
+
+
+class ModelPayload:
+    """
+    A decoded model message: ordered feature names, parameter vector, intercept and metadata.
+    For delta messages (is_delta) values and intercept are differences from the round's global model.
+    """
+    def __init__(self, feature_names, values, intercept, metadata, schema, is_delta=False):
+        self.feature_names = feature_names
+        self.values = values  # float64 ndarray aligned with feature_names
+        self.intercept = intercept
+        self.metadata = metadata
+        self.schema = schema  # schema_hash(feature_names)
+        self.is_delta = is_delta
+
+    def to_model(self) -> dict:
+        """Converts to the `{'coef': {feature: value}, 'intercept': value}` dict used elsewhere."""
+        return {
+            'coef': dict(zip(self.feature_names, self.values.tolist())),
+            'intercept': self.intercept
+        }
+
+
+class ModelCodec:
+    """
+    Compact binary encoding of models exchanged between the Coordinator and Swarm Nodes.
+    The parameters travel as one float32/float64 buffer; feature names are identified by a schema
+    hash and only sent along when the receiver may not know them yet. Schemas seen in decoded
+    messages (or registered up front) are remembered, so later messages can omit the names.
+    The payload after the fixed header can be gzip or zstd compressed.
+    """
+    def __init__(self, dtype="float64", compression=None):
+        if dtype not in _DTYPES:
+            raise ValueError(f"Unsupported wire dtype '{dtype}'. Use one of {list(_DTYPES)}.")
+        if compression not in _COMPRESSIONS:
+            raise ValueError(f"Unsupported compression '{compression}'. Use None, 'gzip' or 'zstd'.")
+        if compression == "zstd" and zstandard is None:
+            logger.warning("ModelCodec: 'zstandard' is not installed. Falling back to gzip compression.")
+            compression = "gzip"
+        self.dtype = dtype
+        self.compression = compression
+        self._schemas = {}  # schema hash -> list of feature names
+        self._schemas_lock = threading.Lock()
+
+    def register_schema(self, feature_names) -> bytes:
+        """Remembers a feature ordering so messages using it can be decoded without names."""
+        feature_names = list(feature_names)
+        schema = schema_hash(feature_names)
+        with self._schemas_lock:
+            self._schemas[schema] = feature_names
+        return schema
+
+    def knows_schema(self, schema: bytes) -> bool:
+        with self._schemas_lock:
+            return schema in self._schemas
+
+    def encode(self, feature_names, values, intercept, metadata=None, include_schema=True) -> bytes:
+        """
+        Encodes an ordered parameter vector. `values` must be aligned with `feature_names`.
+        With include_schema=False only the schema hash is sent; the receiver must already know it.
+        """
+        feature_names = list(feature_names)
+        values = np.asarray(values, dtype=_DTYPE_BY_CODE[_DTYPES[self.dtype]])
+        if values.shape != (len(feature_names),):
+            raise ValueError("values must be a 1-D vector aligned with feature_names.")
+        return self._pack(feature_names, values, intercept, metadata, include_schema, flags=0)
+
+    def encode_delta(self, feature_names, quantized, scale, intercept_delta, indices=None,
+                     metadata=None, include_schema=True) -> bytes:
+        """
+        Encodes a (quantized, optionally sparse) delta from the round's global model, as produced
+        by quantize() / DeltaCompressor. `quantized` is aligned with `feature_names`, or with
+        `indices` (positions in feature_names) for a sparse delta.
+        """
+        feature_names = list(feature_names)
+        quantized = np.asarray(quantized)
+        if quantized.dtype.newbyteorder("<") not in _DTYPE_BY_CODE.values():
+            raise ValueError(f"Unsupported delta dtype {quantized.dtype}.")
+        flags = _FLAG_DELTA
+        extra = [struct.pack("<d", float(scale))]
+        if indices is not None:
+            indices = np.asarray(indices, dtype="<u4")
+            if indices.shape != quantized.shape:
+                raise ValueError("indices and values of a sparse delta must have the same length.")
+            flags |= _FLAG_SPARSE
+            extra += [struct.pack("<I", len(indices)), indices.tobytes()]
+        elif quantized.shape != (len(feature_names),):
+            raise ValueError("A dense delta must be a 1-D vector aligned with feature_names.")
+        return self._pack(feature_names, quantized, intercept_delta, metadata, include_schema, flags, extra)
+
+    def _pack(self, feature_names, values, intercept, metadata, include_schema, flags, extra=()):
+        schema = schema_hash(feature_names)
+        meta = dict(metadata or {})
+        if include_schema:
+            meta['feature_names'] = feature_names
+            flags |= _FLAG_HAS_SCHEMA
+        meta_bytes = json.dumps(meta).encode("utf-8")
+
+        payload = b"".join([
+            struct.pack("<I", len(meta_bytes)),
+            meta_bytes,
+            struct.pack("<d", float(intercept)),
+            *extra,
+            values.tobytes(),
+        ])
+        if self.compression == "gzip":
+            payload = gzip.compress(payload, compresslevel=1)
+        elif self.compression == "zstd":
+            payload = zstandard.ZstdCompressor(level=1).compress(payload)
+
+        header = _HEADER.pack(_MAGIC, _VERSION, values.dtype.itemsize, _COMPRESSIONS[self.compression],
+                              flags, len(feature_names), schema)
+        return header + payload
+
+    def encode_model(self, model: dict, metadata=None, include_schema=True) -> bytes:
+        """Encodes a `{'coef': {feature: value}, 'intercept': value}` dict."""
+        coef = model['coef']
+        values = np.fromiter(coef.values(), dtype=np.float64, count=len(coef))
+        return self.encode(coef.keys(), values, model['intercept'], metadata, include_schema)
+
+    def decode(self, body: bytes) -> ModelPayload:
+        """
+        Decodes a binary model message. Raises UnknownSchemaError if the names are missing and unknown,
+        and ValueError for any malformed message (truncated, corrupt compression, bad metadata).
+        """
+        try:
+            return self._decode(body)
+        except (struct.error, OSError, EOFError, zlib.error) as e:
+            raise ValueError(f"Malformed model message: {e}") from e
+
+    def _decode(self, body):
+        if len(body) < _HEADER.size:
+            raise ValueError("Model message is too short.")
+        magic, version, dtype_code, compression_code, flags, n_features, schema = _HEADER.unpack_from(body)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Not a swarm model message (bad magic or version).")
+
+        payload = memoryview(body)[_HEADER.size:]
+        if compression_code == _COMPRESSIONS["gzip"]:
+            payload = memoryview(gzip.decompress(payload))
+        elif compression_code == _COMPRESSIONS["zstd"]:
+            if zstandard is None:
+                raise ValueError("Received a zstd-compressed model but 'zstandard' is not installed.")
+            payload = memoryview(zstandard.ZstdDecompressor().decompress(payload))
+        elif compression_code != 0:
+            raise ValueError(f"Unknown compression code {compression_code}.")
+
+        (meta_len,) = struct.unpack_from("<I", payload)
+        offset = 4 + meta_len
+        metadata = json.loads(bytes(payload[4:offset]))
+        if not isinstance(metadata, dict):
+            raise ValueError("Model message metadata must be a JSON object.")
+        # Resolved before any values are read: n_features comes from the header and must match the
+        # schema before it sizes an allocation
+        if flags & _FLAG_HAS_SCHEMA:
+            feature_names = metadata.pop('feature_names', None)
+            if not isinstance(feature_names, list) or not all(isinstance(f, str) for f in feature_names):
+                raise ValueError("Model message has no valid feature names.")
+            if schema_hash(feature_names) != schema:
+                raise ValueError("Schema hash does not match the feature names in the message.")
+            with self._schemas_lock:
+                self._schemas.setdefault(schema, feature_names)
+        else:
+            with self._schemas_lock:
+                feature_names = self._schemas.get(schema)
+            if feature_names is None:
+                raise UnknownSchemaError(f"Unknown feature schema {schema.hex()}.")
+        if len(feature_names) != n_features:
+            raise ValueError(f"Model message has {n_features} values but {len(feature_names)} feature names.")
+
+        (intercept,) = struct.unpack_from("<d", payload, offset)
+        offset += 8
+        if dtype_code not in _DTYPE_BY_CODE:
+            raise ValueError(f"Unknown dtype code {dtype_code}.")
+        dtype = _DTYPE_BY_CODE[dtype_code]
+        is_delta = bool(flags & _FLAG_DELTA)
+        if is_delta:
+            (scale,) = struct.unpack_from("<d", payload, offset)
+            offset += 8
+        elif dtype_code not in (4, 8):
+            raise ValueError("Quantized values are only allowed in delta messages.")
+
+        if flags & _FLAG_SPARSE:
+            (nnz,) = struct.unpack_from("<I", payload, offset)
+            offset += 4
+            indices = np.frombuffer(payload, dtype="<u4", count=nnz, offset=offset)
+            offset += 4 * nnz
+            if nnz and int(indices.max()) >= n_features:
+                raise ValueError("Sparse delta index out of range.")
+            values = np.zeros(n_features, dtype=np.float64)
+            values[indices] = dequantize(np.frombuffer(payload, dtype=dtype, count=nnz, offset=offset), scale)
+        elif is_delta:
+            values = dequantize(np.frombuffer(payload, dtype=dtype, count=n_features, offset=offset), scale)
+        else:
+            values = np.frombuffer(payload, dtype=dtype, count=n_features, offset=offset)
+            values = values.astype(np.float64)  # Always copies, so the result does not alias the request body
+
+        return ModelPayload(feature_names, values, intercept, metadata, schema, is_delta=is_delta)
+
+
+def base_vector(base_model: dict, feature_names, schema, base_cache: dict) -> np.ndarray:
+    """
+    `base_model`'s coefficients in the given feature order, with features it lacks at 0 as on the node.
+    `base_cache` maps schema hash -> vector and should be reset whenever the base model changes.
+    """
+    base = base_cache.get(schema)
+    if base is None:
+        coef = base_model['coef']
+        base = np.fromiter((coef.get(f, 0.0) for f in feature_names), dtype=np.float64, count=len(feature_names))
+        base_cache[schema] = base
+    return base
+
+
+def apply_delta(payload: ModelPayload, base_model: dict, base_cache: dict) -> ModelPayload:
+    """
+    Reconstructs a full model from a delta payload: `base_model` (the round's global model) in the
+    payload's feature order plus the delta. `base_cache` is passed on to base_vector().
+    """
+    base = base_vector(base_model, payload.feature_names, payload.schema, base_cache)
+    return ModelPayload(payload.feature_names, base + payload.values,
+                        float(base_model['intercept']) + payload.intercept, payload.metadata, payload.schema)
+
+
+_PARTIAL_ARRAYS = ('sums', 'counts', 'weighted_sums', 'weighted_counts')
+_PARTIAL_SCALARS = ('intercept_sum', 'weighted_intercept_sum', 'weight_total', 'all_weighted', 'num_models')
+
+
+def encode_partial_aggregate(state: dict, metadata=None) -> bytes:
+    """
+    Encodes a RunningAggregate.export_state() dict plus JSON metadata (round, contributing nodes)
+    as an uncompressed .npz archive; arrays travel as raw float64, so merging upstream is exact.
+    """
+    meta = dict(metadata or {})
+    meta.update({name: state[name] for name in _PARTIAL_SCALARS})
+    buffer = io.BytesIO()
+    np.savez(buffer,
+             feature_names=np.array(state['feature_names'], dtype=str),
+             metadata=np.array(json.dumps(meta)),
+             **{name: np.asarray(state[name], dtype="<f8") for name in _PARTIAL_ARRAYS})
+    return buffer.getvalue()
+
+
+def decode_partial_aggregate(body: bytes):
+    """Inverse of encode_partial_aggregate(). Returns (state, metadata)."""
+    try:
+        with np.load(io.BytesIO(body), allow_pickle=False) as archive:
+            meta = json.loads(str(archive['metadata']))
+            state = {name: archive[name].astype(np.float64) for name in _PARTIAL_ARRAYS}
+            state['feature_names'] = archive['feature_names'].tolist()
+    except (OSError, KeyError, ValueError) as e:
+        raise ValueError(f"Invalid partial aggregate: {e}")
+    n_features = len(state['feature_names'])
+    if any(state[name].shape != (n_features,) for name in _PARTIAL_ARRAYS):
+        raise ValueError("Partial aggregate arrays do not match its feature names.")
+    if not isinstance(meta, dict):
+        raise ValueError("Partial aggregate metadata must be a JSON object.")
+    missing = [name for name in _PARTIAL_SCALARS if name not in meta]
+    if missing:
+        raise ValueError(f"Partial aggregate metadata lacks {missing}.")
+    for name in _PARTIAL_SCALARS:
+        state[name] = meta.pop(name)
+        if not isinstance(state[name], (int, float)):
+            raise ValueError(f"Partial aggregate '{name}' must be a number.")
+    return state, meta
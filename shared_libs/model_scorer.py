@@ -0,0 +1,143 @@
+# shared_libs/model_scorer.py
+
+import logging
+import threading
+
+import numpy as np
+
+from shared_libs.checkpoint_store import CheckpointStore
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledModel:
+    """
+    Immutable, scoring-ready form of a global model: coefficient vector, intercept and a
+    feature -> column index map. The column mapping of each request column order is computed once
+    and cached, so scoring a batch is one matrix-vector product.
+    """
+    def __init__(self, model: dict, version=None):
+        self.version = version
+        self.feature_names = list(model['coef'].keys())
+        self.feature_index = {name: i for i, name in enumerate(self.feature_names)}
+        self.coef = np.fromiter(model['coef'].values(), dtype=np.float64, count=len(self.feature_names))
+        self.intercept = float(model['intercept'])
+        self._alignments = {}  # tuple(request columns) -> (request column indices, coefficients for them)
+        self._lock = threading.Lock()
+
+    def aligned_coef(self, columns):
+        """
+        Returns (request column indices, coefficients) for a request with the given column order.
+        Request columns the model does not know are skipped; model features missing from the
+        request contribute 0, as features absent from a node's data do during training.
+        """
+        key = tuple(columns)
+        alignment = self._alignments.get(key)
+        if alignment is None:
+            index = self.feature_index
+            used = [i for i, name in enumerate(key) if name in index]
+            alignment = (np.array(used, dtype=np.intp),
+                         np.ascontiguousarray(self.coef[[index[key[i]] for i in used]]))
+            with self._lock:
+                if len(self._alignments) >= 64:  # Bound the cache against arbitrary client column orders
+                    self._alignments.clear()
+                self._alignments[key] = alignment
+        return alignment
+
+    def score_matrix(self, X, columns) -> np.ndarray:
+        """Scores the rows of X (n_rows x len(columns)) whose columns are named by `columns`."""
+        used, coef = self.aligned_coef(columns)
+        X = np.asarray(X)
+        if len(used) != X.shape[1]:
+            X = X[:, used]
+        return X @ coef.astype(X.dtype, copy=False) + self.intercept
+
+    def score_columns(self, arrays, columns) -> np.ndarray:
+        """
+        Scores column-oriented data (e.g. the columns of an Arrow table) without stacking it into a
+        matrix first: one fused multiply-add per model feature present in the request.
+        """
+        used, coef = self.aligned_coef(columns)
+        n_rows = len(arrays[0]) if len(arrays) else 0
+        scores = np.full(n_rows, self.intercept)
+        for column, weight in zip(used.tolist(), coef.tolist()):
+            scores += weight * np.asarray(arrays[column], dtype=np.float64)
+        return scores
+
+    def score_rows(self, rows) -> np.ndarray:
+        """Scores a list of `{feature: value}` dicts (row-oriented JSON)."""
+        if not rows:
+            return np.zeros(0)
+        columns = list(rows[0])
+        # Fast path: every row has the same keys in the same order, so the batch is one matrix
+        if all(len(row) == len(columns) and list(row) == columns for row in rows):
+            X = np.array([list(row.values()) for row in rows], dtype=np.float64)
+            return self.score_matrix(X, columns)
+
+        index = self.feature_index
+        scores = np.full(len(rows), self.intercept)
+        coef = self.coef
+        for i, row in enumerate(rows):
+            total = 0.0
+            for name, value in row.items():
+                column = index.get(name)
+                if column is not None:
+                    total += coef[column] * value
+            scores[i] += total
+        return scores
+
+
+class ModelStore:
+    """
+    Holds the CompiledModel being served and hot-swaps it when a new checkpoint is written to the
+    CheckpointStore at `model_dir` (checked via its manifest). Readers take `store.current` once per
+    request, so a swap (one reference assignment) never mixes two models within a batch and never
+    blocks a request.
+    """
+    def __init__(self, model_dir, reload_interval=5.0):
+        self.model_dir = model_dir
+        self.reload_interval = reload_interval
+        self.checkpoint_store = CheckpointStore(model_dir)
+        self.current = None  # CompiledModel; None until the first checkpoint exists
+        self._served_entry = None  # (round, hash, created_at) of the manifest entry being served
+        self._stop = threading.Event()
+        self._watcher = None
+
+    def reload(self) -> bool:
+        """
+        Loads the checkpoint written last if it is not the served one. Returns True if swapped.
+        Checkpoints are told apart by manifest entry (round, hash, creation time), not by round
+        number alone, so a Coordinator restarted from round 1 without resuming is followed too.
+        """
+        entry = self.checkpoint_store.latest_written()
+        if entry is None:
+            return False
+        identity = (entry['round'], entry['hash'], entry.get('created_at'))
+        if identity == self._served_entry:
+            return False
+        round_num = entry['round']
+        try:
+            # Consecutive rounds are usually XOR deltas of each other, so this reads one small file
+            compiled = CompiledModel(self.checkpoint_store.load(round_num), version=round_num)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"ModelStore: ERROR loading the checkpoint of round {round_num}: {e}")
+            return False
+        self.current = compiled
+        self._served_entry = identity
+        logger.info(f"ModelStore: Now serving the global model of round {round_num} ({len(compiled.feature_names)} features).")
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.reload_interval):
+            self.reload()
+
+    def start(self):
+        """Loads the newest checkpoint and starts polling for newer ones in the background."""
+        self.reload()
+        self._watcher = threading.Thread(target=self._watch, name="model-store-watcher", daemon=True)
+        self._watcher.start()
+
+    def close(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
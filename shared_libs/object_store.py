@@ -0,0 +1,220 @@
+# shared_libs/object_store.py
+
+import hashlib
+import logging
+import mmap
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from shared_libs.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_BYTES_TOTAL = METRICS.counter(
+    'swarm_object_store_download_bytes_total', 'Bytes downloaded from the object store', ['store'])
+CHUNK_RETRIES_TOTAL = METRICS.counter(
+    'swarm_object_store_chunk_retries_total', 'Ranged GETs retried after a failed or short read', ['store'])
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
+def shared_s3_client():
+    """
+    Process-wide boto3 S3 client (thread-safe), created on first use. Its connection pool is sized
+    by OBJECT_STORE_MAX_CONNECTIONS so parallel ranged GETs do not queue for connections.
+    """
+    global _s3_client
+    with _s3_client_lock:
+        if _s3_client is None:
+            max_connections = int(os.environ.get('OBJECT_STORE_MAX_CONNECTIONS', 32))
+            _s3_client = boto3.client('s3', config=Config(max_pool_connections=max_connections))
+        return _s3_client
+
+
+class ObjectInfo:
+    """Size in bytes and version tag (S3 ETag, or mtime/size digest for local files) of an object."""
+    def __init__(self, size, etag):
+        self.size = size
+        self.etag = etag
+
+
+class ObjectChangedError(Exception):
+    """The object was replaced while it was being downloaded."""
+
+
+class ObjectStore:
+    """
+    Downloads objects as `chunk_size` byte ranges fetched by `max_workers` threads in parallel.
+    Each range is written straight into its slot of the destination (a preallocated file or
+    buffer), so there is no second full copy in memory, and a failed range is retried on its own
+    up to `max_attempts` times instead of restarting the download. All ranges are pinned to the
+    version seen by head(), so an object replaced mid-download fails instead of mixing versions.
+    Subclasses implement head() and _read_range().
+    """
+    name = "object_store"
+
+    def __init__(self, chunk_size=8 * 1024 * 1024, max_workers=8, max_attempts=4, retry_backoff=0.2):
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="object-store")
+
+    def head(self, key) -> ObjectInfo:
+        raise NotImplementedError
+
+    def _read_range(self, key, start, out, etag):
+        """Fills the memoryview `out` with the bytes of `key` starting at `start`; returns bytes read."""
+        raise NotImplementedError
+
+    def _ranges(self, size):
+        return [(start, min(start + self.chunk_size, size)) for start in range(0, size, self.chunk_size)]
+
+    def _fetch_range(self, key, start, stop, out, etag):
+        """Reads [start, stop) into `out` (a memoryview of exactly that length), retrying on failure."""
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                read = self._read_range(key, start, out, etag)
+                if read != stop - start:
+                    raise IOError(f"short read of {key} bytes {start}-{stop}: got {read} bytes")
+                DOWNLOAD_BYTES_TOTAL.inc(read, store=self.name)
+                return
+            except ObjectChangedError:
+                raise
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    raise
+                CHUNK_RETRIES_TOTAL.inc(store=self.name)
+                logger.warning(f"ObjectStore: Retrying bytes {start}-{stop} of {key} (attempt {attempt}): {e}")
+                time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+
+    def _fetch_all(self, key, info, view):
+        futures = [self._pool.submit(self._fetch_range, key, start, stop, view[start:stop], info.etag)
+                   for start, stop in self._ranges(info.size)]
+        for future in futures:
+            future.result()
+
+    def read_bytes(self, key, info=None):
+        """Downloads `key` into one preallocated buffer. Returns (bytearray, ObjectInfo)."""
+        info = info or self.head(key)
+        buffer = bytearray(info.size)
+        self._fetch_all(key, info, memoryview(buffer))
+        return buffer, info
+
+    def download_to_file(self, key, path, info=None) -> ObjectInfo:
+        """Downloads `key` into `path` (created or truncated), each range written at its offset."""
+        info = info or self.head(key)
+        with open(path, 'wb') as f:
+            f.truncate(info.size)
+        if info.size == 0:
+            return info
+        # The file's pages serve as the destination buffer, written in place by each range
+        with open(path, 'r+b') as f, mmap.mmap(f.fileno(), info.size) as mapped:
+            view = memoryview(mapped)
+            try:
+                self._fetch_all(key, info, view)
+            finally:
+                view.release()
+            mapped.flush()
+        return info
+
+    def close(self):
+        self._pool.shutdown()
+
+
+class S3ObjectStore(ObjectStore):
+    """ObjectStore over one S3 bucket, using the process-wide pooled client."""
+    name = "s3"
+
+    def __init__(self, bucket, client=None, **kwargs):
+        super().__init__(**kwargs)
+        self.bucket = bucket
+        self._client = client
+
+    @property
+    def client(self):
+        return self._client or shared_s3_client()
+
+    def head(self, key) -> ObjectInfo:
+        response = self.client.head_object(Bucket=self.bucket, Key=key)
+        return ObjectInfo(response['ContentLength'], response['ETag'].strip('"'))
+
+    def _read_range(self, key, start, out, etag):
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=key, IfMatch=f'"{etag}"',
+                                              Range=f"bytes={start}-{start + len(out) - 1}")
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('PreconditionFailed', '412'):
+                raise ObjectChangedError(f"S3://{self.bucket}/{key} changed during the download.") from e
+            raise
+        body, read = response['Body'], 0
+        try:
+            while read < len(out):
+                data = body.read(min(1024 * 1024, len(out) - read))
+                if not data:
+                    break
+                out[read:read + len(data)] = data
+                read += len(data)
+        finally:
+            body.close()
+        return read
+
+
+class LocalObjectStore(ObjectStore):
+    """
+    Filesystem-backed stand-in for S3: keys are paths below `root` (e.g. the repository's data/
+    directory). `request_latency` (seconds per ranged GET) and `stream_bandwidth` (bytes/s per
+    connection) emulate S3's first-byte latency and per-connection throughput, so the benefit of
+    parallel ranges can be measured offline.
+    """
+    name = "local"
+
+    def __init__(self, root, request_latency=0.0, stream_bandwidth=None, **kwargs):
+        super().__init__(**kwargs)
+        self.root = root
+        self.request_latency = request_latency
+        self.stream_bandwidth = stream_bandwidth
+
+    def _path(self, key):
+        return os.path.join(self.root, key)
+
+    def head(self, key) -> ObjectInfo:
+        stat = os.stat(self._path(key))
+        etag = hashlib.md5(f"{key}@{stat.st_mtime_ns}-{stat.st_size}".encode()).hexdigest()
+        return ObjectInfo(stat.st_size, etag)
+
+    def _read_range(self, key, start, out, etag):
+        if self.head(key).etag != etag:
+            raise ObjectChangedError(f"{self._path(key)} changed during the download.")
+        started = time.monotonic()
+        with open(self._path(key), 'rb') as f:
+            f.seek(start)
+            read = f.readinto(out)
+        delay = self.request_latency + (read / self.stream_bandwidth if self.stream_bandwidth else 0.0)
+        remaining = delay - (time.monotonic() - started)
+        if remaining > 0:
+            time.sleep(remaining)
+        return read
+
+
+def object_store_from_env(bucket):
+    """
+    LocalObjectStore over OBJECT_STORE_ROOT if that is set (offline runs, benchmarks), otherwise an
+    S3ObjectStore for `bucket`. Chunk size and parallelism come from OBJECT_STORE_CHUNK_MB and
+    OBJECT_STORE_WORKERS.
+    """
+    settings = dict(
+        chunk_size=int(float(os.environ.get('OBJECT_STORE_CHUNK_MB', 8)) * 1024 * 1024),
+        max_workers=int(os.environ.get('OBJECT_STORE_WORKERS', 8)),
+    )
+    root = os.environ.get('OBJECT_STORE_ROOT')
+    if root:
+        return LocalObjectStore(root, **settings)
+    return S3ObjectStore(bucket, **settings)
@@ -0,0 +1,152 @@
+# shared_libs/parallel_trainer.py
+
+import mmap
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from shared_libs.local_trainer import LocalTrainer
+
+# Per worker process: the most recently used shared arrays (X and y of the current and previous
+# dataset version) and one LocalTrainer per shard
+_MAX_WORKER_ARRAYS = 4
+_worker_arrays = OrderedDict()
+_worker_trainers = {}
+
+
+def _attach(spec):
+    """Maps a shared array described by `spec` (version, file, dtype, offset, shape) into this worker, once."""
+    array = _worker_arrays.get(spec)
+    if array is None:
+        _, path, dtype, offset, shape = spec
+        array = np.memmap(path, dtype=np.dtype(dtype), mode='r', offset=offset, shape=shape)
+        _worker_arrays[spec] = array
+        while len(_worker_arrays) > _MAX_WORKER_ARRAYS:
+            # np.memmap has no close(): dropping the last reference unmaps the file
+            _worker_arrays.popitem(last=False)
+    else:
+        _worker_arrays.move_to_end(spec)
+    return array
+
+
+def _train_shard(x_spec, y_spec, shard, start, stop, coef, intercept, epochs, learning_rate, trainer_args,
+                 columns=None):
+    """Worker task: trains rows [start, stop) of the shared matrix starting from (coef, intercept)."""
+    X, y = _attach(x_spec), _attach(y_spec)
+    trainer = _worker_trainers.get(shard)
+    if trainer is None:
+        learning_rate_default, batch_size, default_epochs, random_state = trainer_args
+        trainer = LocalTrainer(learning_rate=learning_rate_default, batch_size=batch_size,
+                               epochs=default_epochs, random_state=random_state + shard)
+        _worker_trainers[shard] = trainer
+    coef, intercept = trainer.train(X[start:stop], y[start:stop], coef, intercept,
+                                    epochs=epochs, learning_rate=learning_rate, columns=columns)
+    return coef, intercept, trainer.last_stats
+
+
+class ParallelTrainer:
+    """
+    Drop-in replacement for LocalTrainer that trains on `num_workers` contiguous row shards of the
+    node's data in a process pool and averages the shard models, weighted by the samples each shard
+    trained on (local model averaging). Workers map the feature matrix instead of receiving a copy:
+    a memory-mapped matrix (the node's .npy data cache) is opened from its file, and an in-memory
+    matrix is written once to a file in /dev/shm, so all workers share the same physical pages.
+    """
+    def __init__(self, num_workers=None, learning_rate=0.01, batch_size=4096, epochs=1, random_state=42,
+                 start_method='spawn'):
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.learning_rate = learning_rate
+        self.batch_size = batch_size
+        self.epochs = epochs
+        self.random_state = random_state
+        # 'spawn' by default: forking a process that runs Flask and heartbeat threads is unsafe
+        self._context = multiprocessing.get_context(start_method)
+        self._pool = None
+        # (X, y, x_spec, y_spec) of the arrays shared with the workers; holding X and y keeps them
+        # from being freed and their identity from being reused by a different dataset
+        self._shared = None
+        self._version = 0  # Incremented per shared dataset; part of the specs, which key the worker caches
+        self._spill_dir = None  # Temp directory of in-memory arrays written for sharing
+        self.last_stats = {}
+
+    def _share(self, array, name):
+        """Returns the (version, file, dtype, offset, shape) spec under which workers map `array`."""
+        root = array
+        while isinstance(root.base, np.ndarray):
+            root = root.base  # Slices of a memory map (e.g. the rows left after a hold-out) share its file
+        if isinstance(root, np.memmap) and isinstance(root.base, mmap.mmap) and array.flags.c_contiguous:
+            offset = root.offset + (array.ctypes.data - root.ctypes.data)
+            return self._version, root.filename, array.dtype.str, offset, array.shape
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix="swarm-train-", dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+        path = os.path.join(self._spill_dir, f"{name}.bin")
+        shared = np.memmap(path, dtype=array.dtype, mode='w+', shape=array.shape)
+        shared[:] = array
+        shared.flush()
+        return self._version, path, array.dtype.str, 0, array.shape
+
+    def _specs(self, X, y):
+        if self._shared is None or self._shared[0] is not X or self._shared[1] is not y:
+            self._cleanup_spill()
+            self._version += 1
+            self._shared = (X, y, self._share(X, "X"), self._share(y, "y"))
+        return self._shared[2], self._shared[3]
+
+    def _executor(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.num_workers, mp_context=self._context)
+        return self._pool
+
+    def train(self, X, y, coef, intercept, epochs=None, learning_rate=None, columns=None):
+        """Same contract as LocalTrainer.train; last_stats adds the number of shards."""
+        epochs = self.epochs if epochs is None else epochs
+        learning_rate = self.learning_rate if learning_rate is None else learning_rate
+        started = time.monotonic()
+        x_spec, y_spec = self._specs(X, y)
+        bounds = np.linspace(0, len(y), self.num_workers + 1).astype(int)
+        trainer_args = (self.learning_rate, self.batch_size, self.epochs, self.random_state)
+        coef = np.asarray(coef, dtype=np.float64)
+
+        futures = [self._executor().submit(_train_shard, x_spec, y_spec, shard, int(start), int(stop),
+                                           coef, float(intercept), epochs, learning_rate, trainer_args, columns)
+                   for shard, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])) if stop > start]
+        results = [future.result() for future in futures]
+
+        samples = np.array([stats['samples'] for _, _, stats in results], dtype=np.float64)
+        if samples.sum() > 0:
+            weights = samples / samples.sum()
+            coef = np.einsum('s,sf->f', weights, np.stack([shard_coef for shard_coef, _, _ in results]))
+            intercept = float(weights @ np.array([shard_intercept for _, shard_intercept, _ in results]))
+
+        elapsed = time.monotonic() - started
+        samples_seen = int(samples.sum())
+        self.last_stats = {
+            "epochs": epochs,
+            "batches": sum(stats['batches'] for _, _, stats in results),
+            "samples": samples_seen,
+            "skipped_rows": sum(stats['skipped_rows'] for _, _, stats in results),
+            "seconds": elapsed,
+            "samples_per_sec": samples_seen / elapsed if elapsed > 0 else 0.0,
+            "shards": len(results),
+        }
+        return coef, float(intercept)
+
+    def _cleanup_spill(self):
+        if self._spill_dir is not None:
+            for name in os.listdir(self._spill_dir):
+                os.remove(os.path.join(self._spill_dir, name))
+            os.rmdir(self._spill_dir)
+            self._spill_dir = None
+        self._shared = None
+
+    def close(self):
+        """Stops the worker processes and removes shared copies of in-memory arrays."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        self._cleanup_spill()
@@ -0,0 +1,300 @@
+# shared_libs/profiler.py
+
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import queue
+import threading
+import time
+import tracemalloc
+from contextlib import nullcontext
+
+try:
+    import pyinstrument
+    from pyinstrument.renderers import ConsoleRenderer
+    from pyinstrument.session import Session
+except ImportError:  # The pyinstrument engine is optional; cProfile is always available
+    pyinstrument = None
+
+logger = logging.getLogger(__name__)
+
+_DISABLED = nullcontext()  # Returned by phase() when no round is being captured
+# The profiler's own bookkeeping is left out of the allocation reports
+_OWN_FILES = frozenset(module.__file__ for module in (tracemalloc, cProfile, pstats)) | {__file__}
+
+# tracemalloc is process-wide: it runs while any Profiler captures a round, unless someone else started it
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_owned = False
+
+
+def _acquire_tracing(frames):
+    global _tracing_users, _tracing_owned
+    with _tracing_lock:
+        if _tracing_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            _tracing_owned = True
+        _tracing_users += 1
+
+
+def _release_tracing():
+    global _tracing_users, _tracing_owned
+    with _tracing_lock:
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_owned:
+            tracemalloc.stop()
+            _tracing_owned = False
+
+
+# Finished captures are written by one background thread per process: comparing the snapshots and
+# merging the profiles takes seconds of pure Python, which must not hold up rounds or lease renewals
+_writes = queue.Queue(maxsize=8)
+_writer_lock = threading.Lock()
+_writer = None
+
+
+def _write_captures():
+    while True:
+        profiler, capture = _writes.get()
+        try:
+            profiler._write(capture)
+        finally:
+            _writes.task_done()
+
+
+def _queue_write(profiler, capture):
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_captures, name="profile-writer", daemon=True)
+            _writer.start()
+    try:
+        _writes.put_nowait((profiler, capture))
+    except queue.Full:
+        logger.warning(f"Profiler: Writer behind, dropping the profile of round {capture.round_num} "
+                       f"of {profiler.component}.")
+
+
+def wait_for_writes():
+    """Blocks until the captures of all Profilers in this process are written, e.g. before exiting."""
+    _writes.join()
+
+
+class _RoundCapture:
+    """Profiles and allocation figures collected for one round."""
+    def __init__(self, round_num):
+        self.round_num = round_num
+        self.started = time.monotonic()
+        self.start_snapshot = tracemalloc.take_snapshot()
+        self.profiles = {}  # phase -> list of cProfile.Profile objects or pyinstrument sessions
+        self.phases = {}  # phase -> {'calls', 'seconds', 'traced_bytes'}
+        self.lock = threading.Lock()
+        # Set when the round ends (see Profiler._finish)
+        self.end_snapshot = None
+        self.traced_memory = None
+        self.seconds = None
+
+
+class _PhaseCapture:
+    """Context manager profiling one execution of a phase in the calling thread."""
+    def __init__(self, profiler, capture, name):
+        self.profiler = profiler
+        self.capture = capture
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._local.active = True  # A nested phase in this thread is covered by this one
+        self.traced_before = tracemalloc.get_traced_memory()[0]
+        self.started = time.perf_counter()
+        if self.profiler.engine == 'pyinstrument':
+            self.engine = pyinstrument.Profiler(interval=self.profiler.interval, async_mode='disabled')
+            self.engine.start()
+        else:
+            self.engine = cProfile.Profile()
+            self.engine.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.profiler.engine == 'pyinstrument':
+            result = self.engine.stop()
+        else:
+            self.engine.disable()
+            result = self.engine
+        seconds = time.perf_counter() - self.started
+        traced_bytes = tracemalloc.get_traced_memory()[0] - self.traced_before
+        self.profiler._local.active = False
+        capture = self.capture
+        with capture.lock:
+            capture.profiles.setdefault(self.name, []).append(result)
+            totals = capture.phases.setdefault(self.name, {'calls': 0, 'seconds': 0.0, 'traced_bytes': 0})
+            totals['calls'] += 1
+            totals['seconds'] += seconds
+            totals['traced_bytes'] += traced_bytes
+        return False
+
+
+class Profiler:
+    """
+    Opt-in profiling of whole rounds. arm(n) captures the next `n` rounds: while a round is captured,
+    every phase() block records call stacks (cProfile, or pyinstrument if installed and selected)
+    in the thread that runs it, and tracemalloc traces allocations. When the round ends, its
+    allocations are snapshotted and a background thread writes the files to `<output_dir>/round_<n>/`:
+      <phase>.prof / <phase>.pyisession   merged call stacks of all executions of the phase
+      <phase>.txt                         the top functions, readable without tooling
+      allocations.txt / allocations.snapshot   allocation growth over the round / raw tracemalloc snapshot
+      phases.json                         calls, seconds and traced allocation growth per phase
+    phase() returns a shared no-op context manager when no round is captured, so the hooks can stay
+    on the hot paths; tracemalloc only runs during captured rounds.
+    """
+    def __init__(self, component, output_dir, engine='cprofile', interval=0.001, tracemalloc_frames=10,
+                 top_entries=40):
+        """
+        component:          name of the profiled process, used as a subdirectory (e.g. the node ID).
+        output_dir:         base directory of the captured files.
+        engine:             'cprofile' (deterministic) or 'pyinstrument' (sampling, needs the package).
+        interval:           pyinstrument sampling interval in seconds.
+        tracemalloc_frames: stack depth recorded per allocation.
+        top_entries:        functions / allocation sites listed in the text reports.
+        """
+        if engine not in ('cprofile', 'pyinstrument'):
+            raise ValueError(f"Unsupported profiling engine '{engine}'. Use 'cprofile' or 'pyinstrument'.")
+        if engine == 'pyinstrument' and pyinstrument is None:
+            logger.warning("Profiler: 'pyinstrument' is not installed. Using cProfile.")
+            engine = 'cprofile'
+        self.component = component
+        self.output_dir = os.path.join(output_dir, component)
+        self.engine = engine
+        self.interval = interval
+        self.tracemalloc_frames = tracemalloc_frames
+        self.top_entries = top_entries
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._rounds_requested = 0  # Rounds still to capture, not counting the current one
+        self._capture = None  # _RoundCapture of the round being captured
+        self.written = []  # Directories of the captured rounds
+
+    def arm(self, rounds):
+        """Captures the next `rounds` rounds (0 cancels pending captures). Returns status()."""
+        with self._lock:
+            self._rounds_requested = max(int(rounds), 0)
+        logger.info(f"Profiler: Capturing the next {rounds} round(s) of {self.component} to {self.output_dir}.")
+        return self.status()
+
+    def status(self) -> dict:
+        capture = self._capture
+        return {
+            'engine': self.engine,
+            'pending_rounds': self._rounds_requested,
+            'capturing_round': capture.round_num if capture is not None else None,
+            'output_dir': self.output_dir,
+            'written': list(self.written[-20:]),
+        }
+
+    def start_round(self, round_num):
+        """Begins capturing `round_num` if captures are pending (ends a capture still open)."""
+        if not self._rounds_requested:
+            return
+        with self._lock:
+            if not self._rounds_requested:
+                return
+            self._rounds_requested -= 1
+            previous, self._capture = self._capture, None
+        if previous is not None:
+            self._finish(previous)
+        _acquire_tracing(self.tracemalloc_frames)
+        self._capture = _RoundCapture(round_num)
+
+    def end_round(self, round_num=None):
+        """Writes the capture of the current round (or of `round_num` only, if given)."""
+        capture = self._capture
+        if capture is None or (round_num is not None and capture.round_num != round_num):
+            return
+        with self._lock:
+            if self._capture is not capture:
+                return
+            self._capture = None
+        self._finish(capture)
+
+    def phase(self, name):
+        """Context manager profiling the block as phase `name` of the captured round (no-op otherwise)."""
+        capture = self._capture
+        if capture is None or getattr(self._local, 'active', False):
+            return _DISABLED
+        return _PhaseCapture(self, capture, name)
+
+    def _finish(self, capture):
+        """Takes the round's end snapshot (the only part done in the calling thread) and queues the write."""
+        try:
+            capture.seconds = time.monotonic() - capture.started
+            capture.end_snapshot = tracemalloc.take_snapshot()
+            capture.traced_memory = tracemalloc.get_traced_memory()
+        finally:
+            _release_tracing()
+        _queue_write(self, capture)
+
+    def _write(self, capture):
+        """Writes a finished round's files (writer thread); phase executions still running are left out."""
+        round_dir = os.path.join(self.output_dir, f"round_{capture.round_num}")
+        try:
+            os.makedirs(round_dir, exist_ok=True)
+            with capture.lock:
+                profiles = {name: list(results) for name, results in capture.profiles.items()}
+                phases = {name: dict(totals) for name, totals in capture.phases.items()}
+            for name, results in profiles.items():
+                self._write_phase(round_dir, name, results)
+
+            end_snapshot = capture.end_snapshot
+            end_snapshot.dump(os.path.join(round_dir, "allocations.snapshot"))
+            # Grouping by line first, then dropping the profiler's own lines, is much cheaper than
+            # filter_traces() over every trace and gives the same report
+            growth = [stat for stat in end_snapshot.compare_to(capture.start_snapshot, 'lineno')
+                      if stat.traceback[0].filename not in _OWN_FILES]
+            with open(os.path.join(round_dir, "allocations.txt"), 'w') as f:
+                current, peak = capture.traced_memory
+                f.write(f"Traced memory: current {current / 2 ** 20:.2f} MiB, peak {peak / 2 ** 20:.2f} MiB\n")
+                f.write(f"Top {self.top_entries} allocation sites by growth over round {capture.round_num}:\n")
+                for stat in growth[:self.top_entries]:
+                    f.write(f"{stat}\n")
+            with open(os.path.join(round_dir, "phases.json"), 'w') as f:
+                json.dump({'component': self.component, 'round': capture.round_num, 'engine': self.engine,
+                           'seconds': capture.seconds, 'phases': phases}, f, indent=2)
+        except Exception as e:
+            logger.error(f"Profiler: ERROR writing the profile of round {capture.round_num} to {round_dir}: {e}")
+            return
+        self.written.append(round_dir)
+        logger.info(f"Profiler: Wrote the profile of round {capture.round_num} ({', '.join(sorted(phases))}) "
+                    f"to {round_dir}.")
+
+    def _write_phase(self, round_dir, name, results):
+        if self.engine == 'pyinstrument':
+            session = results[0]
+            for other in results[1:]:
+                session = Session.combine(session, other)
+            session.save(os.path.join(round_dir, f"{name}.pyisession"))
+            report = ConsoleRenderer(unicode=False, color=False).render(session)
+        else:
+            stats = pstats.Stats(*results)
+            stats.dump_stats(os.path.join(round_dir, f"{name}.prof"))
+            text = io.StringIO()
+            stats.stream = text
+            stats.sort_stats('cumulative').print_stats(self.top_entries)
+            report = text.getvalue()
+        with open(os.path.join(round_dir, f"{name}.txt"), 'w') as f:
+            f.write(report)
+
+
+def profiler_from_env(component):
+    """Profiler configured from PROFILE_DIR / PROFILE_ENGINE, armed for PROFILE_ROUNDS rounds (default 0)."""
+    profiler = Profiler(
+        component,
+        output_dir=os.environ.get('PROFILE_DIR', '/app/profiles'),
+        engine=os.environ.get('PROFILE_ENGINE', 'cprofile'),
+        interval=float(os.environ.get('PROFILE_INTERVAL', 0.001)),
+    )
+    rounds = int(os.environ.get('PROFILE_ROUNDS', 0))
+    if rounds:
+        profiler.arm(rounds)
+    return profiler
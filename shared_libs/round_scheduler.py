@@ -0,0 +1,93 @@
+# shared_libs/round_scheduler.py
+
+import threading
+from collections import deque
+
+import numpy as np
+
+
+class RoundScheduler:
+    """
+    Decides when the Coordinator can stop waiting for local updates.
+    A round closes as soon as every expected node has reported; once a quorum (K of N nodes,
+    a fraction of the nodes and/or a fraction of the expected training samples) has reported, it
+    also closes at an adaptive straggler deadline derived from recently observed update latencies.
+    record_update() is called from request threads while the round loop reads the history, so the
+    latency and sample history is guarded by a lock.
+    """
+    def __init__(self, quorum_count=None, quorum_fraction=1.0, quorum_sample_fraction=None,
+                 straggler_percentile=90.0, straggler_slack=1.5, min_deadline=1.0, history_size=20):
+        """
+        quorum_count:           minimum number of updates (K); None means no fixed K.
+        quorum_fraction:        minimum fraction of the expected nodes that must report.
+        quorum_sample_fraction: minimum fraction of the expected training samples that must be covered.
+        straggler_percentile:   latency percentile used for the straggler deadline.
+        straggler_slack:        multiplier applied to that percentile.
+        min_deadline:           lower bound (seconds) of the straggler deadline.
+        history_size:           number of recent latencies kept per node.
+        """
+        self.quorum_count = quorum_count
+        self.quorum_fraction = quorum_fraction
+        self.quorum_sample_fraction = quorum_sample_fraction
+        self.straggler_percentile = straggler_percentile
+        self.straggler_slack = straggler_slack
+        self.min_deadline = min_deadline
+        self.history_size = history_size
+        self._latencies = {}  # node_id -> deque of recent update latencies (seconds since round start)
+        self._node_samples = {}  # node_id -> last reported number of training samples
+        self._expected_nodes = set()
+        self._lock = threading.Lock()  # Guards _latencies and _node_samples
+
+    def start_round(self, expected_node_ids):
+        """Sets the nodes expected to report in the new round."""
+        self._expected_nodes = set(expected_node_ids)
+
+    def record_update(self, node_id, latency, num_samples=None):
+        """Records how long after the round start a node's update arrived."""
+        with self._lock:
+            history = self._latencies.get(node_id)
+            if history is None:
+                history = self._latencies[node_id] = deque(maxlen=self.history_size)
+            history.append(latency)
+            if num_samples is not None:
+                self._node_samples[node_id] = num_samples
+
+    def required_updates(self) -> int:
+        """Number of updates needed for the node-count part of the quorum."""
+        expected = len(self._expected_nodes)
+        required = int(np.ceil(self.quorum_fraction * expected))
+        if self.quorum_count is not None:
+            required = max(required, self.quorum_count)
+        return min(max(required, 1), expected) if expected else 0
+
+    def quorum_met(self, received_node_ids) -> bool:
+        """True once the received updates satisfy both the node and the sample quorum."""
+        if len(received_node_ids) < self.required_updates():
+            return False
+        if self.quorum_sample_fraction is None:
+            return True
+        with self._lock:
+            expected_samples = sum(self._node_samples.get(n, 0) for n in self._expected_nodes)
+            received_samples = sum(self._node_samples.get(n, 0) for n in received_node_ids)
+        if expected_samples == 0:
+            return True  # Sample counts are unknown until nodes have reported once
+        return received_samples >= self.quorum_sample_fraction * expected_samples
+
+    def straggler_deadline(self, timeout) -> float:
+        """
+        Seconds after the round start at which a round with quorum stops waiting for stragglers:
+        the configured latency percentile over the expected nodes' recent history times the slack,
+        clamped to [min_deadline, timeout]. Without any history it is the full timeout.
+        """
+        with self._lock:
+            observed = [latency for node_id in self._expected_nodes for latency in self._latencies.get(node_id, ())]
+        if not observed:
+            return timeout
+        deadline = float(np.percentile(observed, self.straggler_percentile)) * self.straggler_slack
+        return min(max(deadline, self.min_deadline), timeout)
+
+    def forget_node(self, node_id):
+        """Drops the history of a node that left the swarm."""
+        with self._lock:
+            self._latencies.pop(node_id, None)
+            self._node_samples.pop(node_id, None)
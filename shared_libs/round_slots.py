@@ -0,0 +1,178 @@
+# shared_libs/round_slots.py
+
+import itertools
+import threading
+
+import numpy as np
+
+from shared_libs.aggregator import RunningAggregate
+from shared_libs.federated_eval import EvaluationAggregate
+from shared_libs.model_codec import base_vector
+
+
+class RoundSlots:
+    """
+    Update slots of one synchronous round, filled concurrently by request threads.
+    A node claims its slot with one atomic dict operation (the duplicate check), and its update is
+    stored in one of `stripes` independently locked shards, chosen round-robin, so concurrent
+    submissions neither wait on each other nor on a Coordinator-wide lock while decoding, applying
+    deltas or folding into a running aggregate. The Coordinator replaces the object at the start of
+    each round; seal() closes it before aggregation, after which fills are refused.
+    """
+    def __init__(self, round_num, base_model, weighted=False, incremental=False, stripes=16):
+        """
+        round_num:   round the slots belong to.
+        base_model:  global model distributed this round; delta updates apply to it.
+        weighted:    sample-weighted running aggregates (AGGREGATION_WEIGHTING=samples).
+        incremental: fold updates into running aggregates instead of storing the models.
+        stripes:     number of independently locked shards.
+        """
+        self.round_num = round_num
+        self.base_model = base_model
+        self.delta_bases = {}  # schema hash -> base model vector in that feature order
+        self.weighted = weighted
+        self.incremental = incremental
+        self.sealed = False
+        self._claims = {}  # node_id -> claim token; setdefault makes the duplicate check atomic
+        self._filled = []  # node_ids whose update landed, in arrival order
+        self._next_stripe = itertools.count()
+        self._stripes = [{
+            'lock': threading.Lock(),
+            'aggregate': RunningAggregate(weighted=weighted) if incremental else None,
+            'models': {},  # node_id -> model dict (batch mode)
+            'sample_counts': {},  # node_id -> number of local training samples (batch mode)
+            'partials': [],  # RunningAggregate states from relays (batch mode)
+            'evaluation': EvaluationAggregate(),  # Nodes' held-out scores of the round's global model
+            'update_stats': [0, 0.0, 0],  # Direct updates, sum of their squared distances from base_model, samples
+        } for _ in range(max(int(stripes), 1))]
+
+    def claim(self, node_ids) -> bool:
+        """Reserves the slots of `node_ids` (all or none). False if any of them was claimed already."""
+        token = object()
+        claimed = []
+        for node_id in node_ids:
+            if self._claims.setdefault(node_id, token) is not token:
+                self.release(claimed)
+                return False
+            claimed.append(node_id)
+        return True
+
+    def release(self, node_ids):
+        """Frees claimed slots whose update was not stored (e.g. it failed to decode)."""
+        for node_id in node_ids:
+            self._claims.pop(node_id, None)
+
+    def _stripe(self):
+        return self._stripes[next(self._next_stripe) % len(self._stripes)]
+
+    def fill_model(self, node_id, feature_names=None, values=None, intercept=None, model=None,
+                   num_samples=None, schema=None, evaluation=None) -> bool:
+        """
+        Stores a claimed node's update, given as aligned arrays (decoded binary message) or as a
+        `{'coef', 'intercept'}` dict, plus its optional evaluation statistics of the round's global
+        model (validated by the caller). Returns False if the slots were sealed in the meantime.
+        """
+        if model is None:
+            base = base_vector(self.base_model, feature_names, schema, self.delta_bases)
+            distance = values - base
+        else:
+            base_coef = self.base_model['coef']
+            coef = model['coef']
+            distance = np.fromiter((value - base_coef.get(f, 0.0) for f, value in coef.items()),
+                                   dtype=np.float64, count=len(coef))
+            intercept = model['intercept']
+        intercept_distance = float(intercept) - float(self.base_model['intercept'])
+        sq_distance = float(distance @ distance) + intercept_distance ** 2
+
+        stripe = self._stripe()
+        with stripe['lock']:
+            if self.sealed:
+                return False
+            stats = stripe['update_stats']
+            stats[0] += 1
+            stats[1] += sq_distance
+            stats[2] += num_samples or 0
+            if self.incremental:
+                if model is None:
+                    stripe['aggregate'].add_arrays(feature_names, values, intercept, num_samples, schema=schema)
+                else:
+                    stripe['aggregate'].add(model, num_samples=num_samples)
+            else:
+                if model is None:
+                    model = {'coef': dict(zip(feature_names, values.tolist())), 'intercept': float(intercept)}
+                stripe['models'][node_id] = model
+                if num_samples is not None:
+                    stripe['sample_counts'][node_id] = num_samples
+            if evaluation is not None:
+                stripe['evaluation'].add(evaluation)
+            self._filled.append(node_id)
+        return True
+
+    def fill_partial(self, node_ids, state, evaluation=None, samples=0) -> bool:
+        """
+        Stores a relay's partial aggregate (and evaluation state) covering the claimed `node_ids`,
+        trained on `samples` samples in total. False if sealed.
+        """
+        stripe = self._stripe()
+        with stripe['lock']:
+            if self.sealed:
+                return False
+            stripe['update_stats'][2] += samples
+            if self.incremental:
+                stripe['aggregate'].merge_state(state)
+            else:
+                stripe['partials'].append(state)
+            if evaluation is not None:
+                stripe['evaluation'].merge_state(evaluation)
+            self._filled.extend(node_ids)
+        return True
+
+    def __len__(self):
+        return len(self._filled)
+
+    def filled_node_ids(self) -> list:
+        return list(self._filled)
+
+    def seal(self):
+        """Refuses further fills; waits for fills in progress to land first."""
+        for stripe in self._stripes:
+            with stripe['lock']:
+                self.sealed = True
+
+    def running_aggregate(self) -> RunningAggregate:
+        """Incremental mode, after seal(): the stripes' running aggregates merged into one."""
+        merged = RunningAggregate(weighted=self.weighted)
+        for stripe in self._stripes:
+            if stripe['aggregate'].num_models:
+                merged.merge_state(stripe['aggregate'].export_state())
+        return merged
+
+    def models(self):
+        """Batch mode, after seal(): ({node_id: model}, {node_id: num_samples}, [partial states])."""
+        models, sample_counts, partials = {}, {}, []
+        for stripe in self._stripes:
+            models.update(stripe['models'])
+            sample_counts.update(stripe['sample_counts'])
+            partials.extend(stripe['partials'])
+        return models, sample_counts, partials
+
+    def update_stats(self):
+        """
+        After seal(): (number of direct updates, sum of their squared L2 distances from base_model,
+        training samples of all updates). Updates inside relay partials only count towards the samples.
+        """
+        count, sq_norm_sum, samples = 0, 0.0, 0
+        for stripe in self._stripes:
+            stripe_count, stripe_sq_norm_sum, stripe_samples = stripe['update_stats']
+            count += stripe_count
+            sq_norm_sum += stripe_sq_norm_sum
+            samples += stripe_samples
+        return count, sq_norm_sum, samples
+
+    def evaluation(self):
+        """After seal(): swarm-wide metrics of the round's global model from the nodes' reports (None if none)."""
+        merged = EvaluationAggregate()
+        for stripe in self._stripes:
+            if stripe['evaluation'].num_nodes:
+                merged.merge_state(stripe['evaluation'].export_state())
+        return merged.result()
@@ -0,0 +1,233 @@
+# shared_libs/training_controller.py
+
+import json
+import logging
+import math
+import os
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+HISTORY_NAME = "training_history.jsonl"
+
+
+def model_delta_norm(model: dict, base_model: dict):
+    """Returns (||model - base_model||, ||base_model||) over the coefficients and intercept (missing features count as 0)."""
+    coef, base_coef = model['coef'], base_model['coef']
+    names = list(coef.keys() | base_coef.keys())
+    values = np.fromiter((coef.get(f, 0.0) for f in names), dtype=np.float64, count=len(names))
+    base = np.fromiter((base_coef.get(f, 0.0) for f in names), dtype=np.float64, count=len(names))
+    delta = values - base
+    intercept_delta = float(model['intercept']) - float(base_model['intercept'])
+    return (math.sqrt(float(delta @ delta) + intercept_delta ** 2),
+            math.sqrt(float(base @ base) + float(base_model['intercept']) ** 2))
+
+
+class TrainingController:
+    """
+    Decides after every round whether training continues, replacing a fixed round count.
+    It tracks the norm of the global model's change, the evaluation loss and the spread of the node
+    updates around the aggregated update, and stops once the change is below `delta_tolerance`
+    (relative to the model norm), the loss reached `target_loss`, the loss has not improved by
+    `min_improvement` for `patience` rounds, or `max_rounds` is reached (never before `min_rounds`).
+    With `adaptive`, it also derives the learning rate and local epochs sent to the nodes with the
+    next global model: the rate decays on a plateau, epochs drop when node updates drift apart and
+    grow while the loss improves without drift. Every decision is appended (fsynced) to
+    `training_history.jsonl` and reloaded on restart, so compute spent to reach a loss is on record.
+    """
+    def __init__(self, history_dir=None, resume=True, max_rounds=100, min_rounds=2, delta_tolerance=1e-4, target_loss=None,
+                 patience=5, min_improvement=1e-3, adaptive=False, learning_rate=0.01, local_epochs=1,
+                 lr_decay=0.5, min_learning_rate=1e-6, min_epochs=1, max_epochs=10, drift_ratio=2.0):
+        """
+        history_dir:     directory of training_history.jsonl (None keeps the history in memory only).
+        resume:          continue the history found there; False starts it over with the first decision.
+        max_rounds:      last round number that is run.
+        min_rounds:      rounds run before any convergence criterion can stop training.
+        delta_tolerance: stop once ||w_t - w_t-1|| / ||w_t-1|| falls below this (0 disables).
+        target_loss:     stop once the evaluation loss is at or below this (None disables).
+        patience:        stop after this many rounds without a relative loss improvement of
+                         `min_improvement` (0 disables).
+        adaptive:        adapt learning rate and local epochs; the other arguments bound the adaptation.
+        drift_ratio:     node update spread / aggregated update norm above which epochs are reduced.
+        """
+        self.history_path = os.path.join(history_dir, HISTORY_NAME) if history_dir else None
+        self.max_rounds = max_rounds
+        self.min_rounds = min_rounds
+        self.delta_tolerance = delta_tolerance
+        self.target_loss = target_loss
+        self.patience = patience
+        self.min_improvement = min_improvement
+        self.adaptive = adaptive
+        self.learning_rate = self.initial_learning_rate = learning_rate
+        self.local_epochs = self.initial_local_epochs = local_epochs
+        self.lr_decay = lr_decay
+        self.min_learning_rate = min_learning_rate
+        self.min_epochs = min_epochs
+        self.max_epochs = max_epochs
+        self.drift_ratio = drift_ratio
+
+        self.history = []
+        self.best_loss = None
+        self.rounds_without_improvement = 0
+        self.cumulative_samples = 0  # Training samples processed by all nodes (samples x local epochs)
+        self.stop_reason = None
+        self._truncate = not resume  # The first write replaces the file instead of appending
+        if self.history_path and resume:
+            self._load_history()
+
+    def _load_history(self):
+        if not os.path.exists(self.history_path):
+            return
+        with open(self.history_path) as f:
+            for line in f:
+                try:
+                    self.history.append(json.loads(line))
+                except ValueError:
+                    logger.warning("TrainingController: Skipping a damaged history line (interrupted write?).")
+        self._restore_state()
+        if self.history:
+            last = self.history[-1]
+            logger.info(f"TrainingController: Loaded {len(self.history)} decisions (last round {last['round']}, "
+                        f"best loss {self.best_loss}).")
+
+    def _restore_state(self):
+        """Continues from the last decision of the history (or the initial state if it is empty)."""
+        self.best_loss = None
+        self.rounds_without_improvement = 0
+        self.cumulative_samples = 0
+        self.stop_reason = None
+        self.learning_rate, self.local_epochs = self.initial_learning_rate, self.initial_local_epochs
+        if self.history:
+            last = self.history[-1]
+            self.best_loss = last.get('best_loss')
+            self.rounds_without_improvement = last.get('rounds_without_improvement', 0)
+            self.cumulative_samples = last.get('cumulative_samples', 0)
+            self.learning_rate = last.get('next_learning_rate', self.learning_rate)
+            self.local_epochs = last.get('next_local_epochs', self.local_epochs)
+            # max_rounds is checked against the current setting, so raising it continues a finished run
+            if last.get('reason') not in (None, 'max_rounds'):
+                self.stop_reason = last['reason']
+
+    def rewind(self, round_num):
+        """
+        Drops decisions of rounds after `round_num`, e.g. when the Coordinator resumes from an older
+        checkpoint than the last decided round, and continues from the last decision kept.
+        """
+        kept = [decision for decision in self.history if decision['round'] <= round_num]
+        if len(kept) == len(self.history):
+            return
+        logger.info(f"TrainingController: Dropping {len(self.history) - len(kept)} decisions after round {round_num}.")
+        self.history = kept
+        self._restore_state()
+        if self.history_path:
+            self._write_lines(self.history, 'w')
+
+    def training_plan(self, always=False):
+        """Hyperparameters to send with the next global model, or None when not adaptive (unless `always`)."""
+        if not self.adaptive and not always:
+            return None
+        return {'learning_rate': self.learning_rate, 'local_epochs': self.local_epochs}
+
+    def should_stop(self, round_num) -> bool:
+        """True once a stop criterion fired or `round_num` (the last completed round) reached max_rounds."""
+        if self.stop_reason is None and round_num >= self.max_rounds:
+            self.stop_reason = 'max_rounds'
+        return self.stop_reason is not None
+
+    def record_round(self, round_num, delta_norm, model_norm, loss=None, update_count=0, update_sq_norm_sum=0.0,
+                     samples=0):
+        """
+        Records one aggregated round and returns its decision (also appended to the history).
+        delta_norm / model_norm: ||w_t - w_t-1|| and ||w_t-1|| of the global model.
+        loss:                    latest evaluation loss (None if unavailable this round).
+        update_count / update_sq_norm_sum: number of node updates and the sum of their squared norms
+                                 (distance from the round's global model), for the update spread.
+        samples:                 training samples behind this round's updates.
+        """
+        relative_delta = delta_norm / model_norm if model_norm > 0 else None
+        # RMS distance of the node updates from their aggregate (their mean)
+        spread = None
+        if update_count:
+            spread = math.sqrt(max(update_sq_norm_sum / update_count - delta_norm ** 2, 0.0))
+        self.cumulative_samples += int(samples) * self.local_epochs
+
+        improved = False
+        improvement = None
+        if loss is not None and math.isfinite(loss):
+            if self.best_loss is None:
+                improved = True
+            else:
+                improvement = (self.best_loss - loss) / self.best_loss if self.best_loss > 0 else 0.0
+                improved = improvement >= self.min_improvement
+            if improved:
+                self.best_loss = loss if self.best_loss is None else min(self.best_loss, loss)
+                self.rounds_without_improvement = 0
+            else:
+                self.rounds_without_improvement += 1
+
+        decision = {
+            'round': round_num,
+            'delta_norm': delta_norm,
+            'relative_delta': relative_delta,
+            'loss': loss,
+            'best_loss': self.best_loss,
+            'rounds_without_improvement': self.rounds_without_improvement,
+            'update_spread': spread,
+            'updates': update_count,
+            'samples': int(samples),
+            'cumulative_samples': self.cumulative_samples,
+            'learning_rate': self.learning_rate,  # Used by the nodes for this round
+            'local_epochs': self.local_epochs,
+        }
+
+        if round_num >= self.min_rounds:
+            if self.target_loss is not None and loss is not None and loss <= self.target_loss:
+                self.stop_reason = 'target_loss'
+            elif self.delta_tolerance and relative_delta is not None and relative_delta < self.delta_tolerance:
+                self.stop_reason = 'converged'
+            elif self.patience and self.rounds_without_improvement >= self.patience:
+                self.stop_reason = 'patience'
+        if self.stop_reason is None and round_num >= self.max_rounds:
+            self.stop_reason = 'max_rounds'
+
+        if self.adaptive and self.stop_reason is None:
+            self._adapt(improved, delta_norm, spread)
+        decision.update(next_learning_rate=self.learning_rate, next_local_epochs=self.local_epochs,
+                        stop=self.stop_reason is not None, reason=self.stop_reason, decided_at=time.time())
+        self.history.append(decision)
+        self._append(decision)
+        return decision
+
+    def _adapt(self, improved, delta_norm, spread):
+        """Adjusts learning rate and local epochs for the next round."""
+        if self.rounds_without_improvement > 0:
+            self.learning_rate = max(self.learning_rate * self.lr_decay, self.min_learning_rate)
+        if spread is not None and delta_norm > 0 and spread > self.drift_ratio * delta_norm:
+            # Local models pull in different directions: shorter local training keeps them closer
+            self.local_epochs = max(self.local_epochs - 1, self.min_epochs)
+        elif improved:
+            # Improving without drift: more local work per round saves communication rounds
+            self.local_epochs = min(self.local_epochs + 1, self.max_epochs)
+
+    def _append(self, decision):
+        if not self.history_path:
+            return
+        self._write_lines([decision], 'w' if self._truncate else 'a')
+        self._truncate = False
+
+    def _write_lines(self, decisions, mode):
+        os.makedirs(os.path.dirname(self.history_path), exist_ok=True)
+        with open(self.history_path, mode) as f:
+            for decision in decisions:
+                f.write(json.dumps(decision) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def compute_to_reach(self, loss):
+        """(round, cumulative training samples) of the first recorded round with a loss <= `loss`, or None."""
+        for decision in self.history:
+            if decision['loss'] is not None and decision['loss'] <= loss:
+                return decision['round'], decision['cumulative_samples']
+        return None
@@ -4,15 +4,39 @@ import os
 import random
 import threading
 import json
+import logging
+from collections import OrderedDict
 import pandas as pd
 import numpy as np
-from sklearn.linear_model import SGDRegressor
+from concurrent.futures import ThreadPoolExecutor
 
-from flask import Flask, request, jsonify
-import boto3
-from io import BytesIO
+from flask import Flask, Response, request, jsonify
+
+from shared_libs.data_cache import LocalDataCache
+from shared_libs.local_trainer import LocalTrainer
+from shared_libs.parallel_trainer import ParallelTrainer
+from shared_libs.delta_compressor import DeltaCompressor
+from shared_libs.federated_eval import LocalEvaluator, holdout_split, EVALUATION_FIELDS
+from shared_libs.metrics import METRICS, METRICS_CONTENT_TYPE
+from shared_libs.profiler import profiler_from_env
+from shared_libs.model_codec import (ModelCodec, UnknownSchemaError, MODEL_CONTENT_TYPE,
+                                     SUPPORTED_WIRE_FORMATS, schema_hash)
 
 app = Flask(__name__)
+logger = logging.getLogger(__name__)
+
+# Node metrics, served in Prometheus text format on /metrics
+PHASE_SECONDS = METRICS.histogram('swarm_node_phase_seconds', 'Time spent per node phase', ['phase'])
+SUBMISSIONS_TOTAL = METRICS.counter(
+    'swarm_node_submissions_total', 'Local update submissions by outcome', ['result'])
+MODELS_RECEIVED_TOTAL = METRICS.counter(
+    'swarm_node_models_received_total', 'Global models received from the Coordinator by outcome', ['result'])
+PAYLOAD_BYTES_TOTAL = METRICS.counter(
+    'swarm_node_payload_bytes_total', 'Model payload bytes sent to or received from the Coordinator', ['direction'])
+TRAINING_SAMPLES_TOTAL = METRICS.counter('swarm_node_training_samples_total', 'Samples processed by local training')
+JOB_ROUNDS_TOTAL = METRICS.counter('swarm_node_job_rounds_total', 'Local training rounds run per training job', ['job'])
+
+DEFAULT_JOB = 'default'  # Global models without a job_id belong to the Coordinator's default job
 
 class SwarmNode:
     instance = None
@@ -20,19 +44,89 @@ class SwarmNode:
     def __init__(self, node_id, coordinator_endpoint):
         self.node_id = node_id
         self.coordinator_endpoint = coordinator_endpoint  # e.g., "http://swarm-coordinator:5000"
+        # Where local updates go: the group's relay if the Coordinator assigned one, else the Coordinator
+        self.submit_endpoint = coordinator_endpoint
+        # Address the Coordinator uses to reach this node's /model_update endpoint
+        self.endpoint_url = f"http://{os.environ.get('HOSTNAME', 'localhost')}:{os.environ.get('NODE_PORT', '5000')}"
         self.current_round = 0
         self._load_local_data()
-        self.feature_set = self.X.columns.tolist()
+        self.X_train, self.y_train = self.X, self.y  # Rows used for training (all, unless some are held out)
         self.model_params = self._initialize_model()
+
+        # Mini-batch, multi-epoch trainer; its estimator is reused across rounds.
+        # TRAIN_WORKERS > 1 trains that many data shards in parallel processes and averages them.
+        trainer_settings = dict(
+            learning_rate=float(os.environ.get('LEARNING_RATE', 0.01)),
+            batch_size=int(os.environ.get('TRAIN_BATCH_SIZE', 4096)),
+            epochs=int(os.environ.get('LOCAL_EPOCHS', 1)),
+        )
+        train_workers = int(os.environ.get('TRAIN_WORKERS', 1))
+        if train_workers > 1:
+            self.trainer = ParallelTrainer(num_workers=train_workers, **trainer_settings)
+        else:
+            self.trainer = LocalTrainer(**trainer_settings)
+
+        # Binary model encoding; the node's own feature order is known up front
+        self.model_codec = ModelCodec(
+            dtype=os.environ.get('WIRE_DTYPE', 'float64'),
+            compression=os.environ.get('WIRE_COMPRESSION') or None,
+        )
+        self.model_codec.register_schema(self.feature_set)
+        self.wire_format = os.environ.get('WIRE_FORMAT', 'binary')  # Preferred format for submissions
+        self.coordinator_wire_formats = ['json']  # Updated from the registration response
+        # (endpoint, schema) pairs whose feature names the receiver has accepted from us
+        self._acknowledged_schemas = set()
+        self.federation_mode = 'sync'  # Announced by the Coordinator at registration; 'async' pulls models instead
+        self.pull_wait = float(os.environ.get('ASYNC_PULL_WAIT', 30))  # Long-poll wait for a new model version (async)
+
+        # 'delta' sends the change from the round's global model (binary wire format only), optionally
+        # quantized (DELTA_QUANTIZATION=float16|int8) and/or top-k sparsified (DELTA_TOP_K_FRACTION)
+        self.update_mode = os.environ.get('UPDATE_MODE', 'full')
+        top_k_fraction = os.environ.get('DELTA_TOP_K_FRACTION')
+        self._delta_settings = dict(
+            quantization=os.environ.get('DELTA_QUANTIZATION') or None,
+            top_k_fraction=float(top_k_fraction) if top_k_fraction else None,
+            error_feedback=os.environ.get('DELTA_ERROR_FEEDBACK', 'true').lower() == 'true',
+            dtype=self.model_codec.dtype,
+        )
+        self.delta_compressor = DeltaCompressor(**self._delta_settings)
+        self._job_compressors = {DEFAULT_JOB: self.delta_compressor}  # Error-feedback residuals are per job
+        # job_id -> (round_num, feature names, coef vector, intercept) the job's last local training started from
+        self._round_base = {}
+
+        # Federated evaluation (if the Coordinator asks for it at registration): the last
+        # EVAL_HOLDOUT_FRACTION of the rows are held out and each incoming global model is scored on
+        # them in a background thread while local training runs
+        self.eval_holdout_fraction = float(os.environ.get('EVAL_HOLDOUT_FRACTION', 0.1))
+        self.local_evaluator = None
+        self._eval_pool = None
+        self._round_evaluation = {}  # job_id -> (round_num, evaluation statistics) of its last scored global model
+        # job_id -> (round_num, {'learning_rate', 'local_epochs'}) sent with the global model by an adaptive
+        # Coordinator or for a training job
+        self._training_plan = {}
+
+        # Training jobs multiplexed over the one in-memory copy of the data: the latest untrained global
+        # model of each job waits here, and jobs take turns in the order their models arrived, so a job
+        # whose rounds are quick cannot starve the others
+        self._pending_jobs = OrderedDict()  # job_id -> (model_params, round_num)
+        self._feature_subset_jobs = set()  # Jobs that train only the features of their global model
+        self._scheduler_lock = threading.Lock()  # Held by the thread running scheduled rounds
+
+        # On-demand cProfile/tracemalloc capture of the next N rounds (PROFILE_ROUNDS or POST /admin/profile),
+        # from the start of local training to the acknowledged submission
+        self.profiler = profiler_from_env(self.node_id)
+
+        # Keep-alive session for all requests to the Coordinator (replaceable, e.g. by the swarm simulator)
+        self.http = requests.Session()
         
         # Event to signal when a new global model is received and processed
         self._new_model_event = threading.Event()
         # Lock for protecting model_params and current_round during updates
         self._model_lock = threading.Lock()
 
-        print(f"Swarm Node '{self.node_id}' initialized.")
-        print(f"Node '{self.node_id}' initial model: {self.model_params}")
-        print(f"Node '{self.node_id}' local data samples: {len(self.local_data)}")
+        logger.info(f"Swarm Node '{self.node_id}' initialized.")
+        logger.debug("Node '%s' initial model: %s", self.node_id, self.model_params)
+        logger.info(f"Node '{self.node_id}' local data samples: {self.num_samples}")
 
     def _initialize_model(self):
         # Initializing a simple linear model with random coefficients and intercept
@@ -52,100 +146,464 @@ class SwarmNode:
 
         s3_key = f"nodes/{file_name}"  # Path within the bucket
         s3_bucket_name = os.environ.get('S3_BUCKET_NAME', 'durian-bucket-titan')  # Use the provided bucket name
+        local_path = os.environ.get('LOCAL_DATA_PATH')  # Optional local Parquet file, e.g. data/flag1_node0_risk.parquet
+        target_column = os.environ.get('TARGET_COLUMN', 'Target')
+        feature_columns = [c for c in os.environ.get('FEATURE_COLUMNS', '').split(',') if c] or None  # Column projection
+        cache_format = os.environ.get('DATA_CACHE_FORMAT', 'npy')  # 'npy' (float32 memory map) or 'parquet'
 
-        print(f"Node {self.node_id}: Loading data from S3://{s3_bucket_name}/{s3_key}...")
+        source = local_path or f"S3://{s3_bucket_name}/{s3_key}"
+        logger.info(f"Node {self.node_id}: Loading data from {source}...")
 
         try:
-            s3 = boto3.client('s3')
-            obj = s3.get_object(Bucket=s3_bucket_name, Key=s3_key)
-            with BytesIO(obj['Body'].read()) as data_buffer:
-                df = pd.read_parquet(data_buffer)
-
-            if 'Target' not in df.columns:
-                raise KeyError(f"Target column not found in data from S3://{s3_bucket_name}/{s3_key}")
-
-            self.local_data = df
-            self.X = df.drop(columns=['Target'])
-            self.y = df['Target']
-            self.feature_set = self.X.columns.tolist()
-            print(f"Node {self.node_id}: Successfully loaded {len(df)} samples from S3.")
+            load_started = time.perf_counter()
+            cache = LocalDataCache(os.environ.get('DATA_CACHE_DIR', '/app/cache'), s3_bucket_name)
+            parquet_path, version = cache.fetch(s3_key, local_path=local_path)
+
+            if cache_format == 'npy':
+                dataset = cache.load_feature_matrix(parquet_path, version, target_column, feature_columns)
+                self.X = dataset.X
+                self.y = dataset.y
+                self.feature_set = dataset.feature_names
+            else:
+                columns = feature_columns + [target_column] if feature_columns else None
+                df = cache.load_frame(parquet_path, columns=columns)
+                if target_column not in df.columns:
+                    raise KeyError(f"Target column not found in data from {source}")
+                features = df.drop(columns=[target_column])
+                # Converted to NumPy once here instead of on every training round
+                self.X = features.to_numpy(dtype=np.float32)
+                self.y = df[target_column].to_numpy(dtype=np.float64)
+                self.feature_set = features.columns.tolist()
+
+            self.num_samples = len(self.y)
+            PHASE_SECONDS.observe(time.perf_counter() - load_started, phase='load')
+            logger.info(f"Node {self.node_id}: Successfully loaded {self.num_samples} samples from {source}.")
 
         except Exception as e:
-            print(f"Node {self.node_id}: ERROR loading data from S3: {e}")
+            logger.error(f"Node {self.node_id}: ERROR loading data from {source}: {e}")
             raise
 
-    def _train_local_model(self):
-        print(f"Node {self.node_id}: Starting local training...")
-        
-        model = SGDRegressor(
-            loss='squared_error',
-            penalty=None, alpha=0.0001,
-            max_iter=1, tol=None,
-            learning_rate='constant', eta0=0.01,
-            random_state=42  # for reproducibility
-        )
-        
-        model.partial_fit(self.X[:1], self.y[:1])
-
-        # Prepare initial parameters for SGDRegressor from our dict format
-        initial_coef = np.array([self.model_params['coef'][f] for f in self.feature_set])
-        initial_intercept = np.array([self.model_params['intercept']])
-
-        model.coef_ = initial_coef
-        model.intercept_ = initial_intercept
-
-        model.partial_fit(self.X, self.y)
-        
-        # Update node's internal model parameters from the trained SGDRegressor
-        for i, feature in enumerate(self.feature_set):
-            self.model_params['coef'][feature] = model.coef_[i]
-        self.model_params['intercept'] = model.intercept_[0]
-
-        print(f"Node {self.node_id}: Completed local training. New params (subset): {self.get_current_params_subset()}")
-        return self.model_params
-
-
-    def _submit_local_update(self):
+    def _job_features(self, job_id, model_params):
+        """
+        (feature names, column indices or None for all) a job trains on: all local features, or for a
+        job on a feature subset, the local features its global model has.
+        """
+        if job_id not in self._feature_subset_jobs:
+            return self.feature_set, None
+        coef = model_params['coef']
+        columns = [i for i, f in enumerate(self.feature_set) if f in coef]
+        if len(columns) == len(self.feature_set):
+            return self.feature_set, None
+        return [self.feature_set[i] for i in columns], columns
+
+    def _train_local_model(self, model_params=None, round_num=None, job_id=DEFAULT_JOB):
+        """
+        Trains on the local data starting from `model_params` (default: the current global model) and
+        updates that dict in place. Callers pass a snapshot so a newer global model arriving mid-training
+        cannot get mixed into this round's update.
+        """
+        model_params = self.model_params if model_params is None else model_params
+        round_num = self.current_round if round_num is None else round_num
+        logger.debug("Node %s: Starting local training of job %s...", self.node_id, job_id)
+        if job_id == DEFAULT_JOB:
+            self.profiler.start_round(round_num)  # Ended by _submit_local_update
+        features, columns = self._job_features(job_id, model_params)
+
+        # Prepare initial parameters from our dict format (features missing from the global model start at 0)
+        initial_coef = np.array([model_params['coef'].get(f, 0.0) for f in features], dtype=np.float64)
+        initial_intercept = model_params['intercept']
+        self._round_base[job_id] = (round_num, features, initial_coef, float(initial_intercept))
+
+        evaluation = None
+        if self.local_evaluator is not None:
+            # Scores the global model we start from; runs next to training (NumPy releases the GIL)
+            evaluation = self._eval_pool.submit(self._evaluate_global_model, initial_coef, float(initial_intercept),
+                                                columns)
+
+        plan = {}
+        job_plan = self._training_plan.get(job_id)
+        if job_plan is not None and job_plan[0] == round_num:
+            plan = job_plan[1]
+        with PHASE_SECONDS.time(phase='train'), self.profiler.phase('train'):
+            coef, intercept = self.trainer.train(self.X_train, self.y_train, initial_coef, initial_intercept,
+                                                 epochs=plan.get('local_epochs'), learning_rate=plan.get('learning_rate'),
+                                                 columns=columns)
+
+        if evaluation is not None:
+            self._collect_evaluation(evaluation, round_num, job_id)
+
+        # Update node's internal model parameters from the trained coefficients
+        model_params['coef'].update(zip(features, coef.tolist()))
+        model_params['intercept'] = intercept
+
+        stats = self.trainer.last_stats
+        TRAINING_SAMPLES_TOTAL.inc(stats['samples'])
+        JOB_ROUNDS_TOTAL.inc(job=job_id)
+        job = f" of job '{job_id}'" if job_id != DEFAULT_JOB else ""
+        logger.info(f"Node {self.node_id}: Completed local training for round {round_num}{job}: "
+                    f"{stats['samples']} samples in {stats['batches']} batches over {stats['epochs']} epoch(s), "
+                    f"{stats['seconds']:.3f}s ({stats['samples_per_sec']:.0f} samples/sec).")
+        return model_params
+
+
+    def _evaluate_global_model(self, coef, intercept, columns=None):
+        with self.profiler.phase('evaluate'):
+            return self.local_evaluator.evaluate(coef, intercept, columns=columns)
+
+    def _collect_evaluation(self, future, round_num, job_id=DEFAULT_JOB):
+        """Keeps the background evaluation of this round's global model for the update submission."""
+        try:
+            stats = future.result()
+        except Exception as e:
+            logger.warning(f"Node {self.node_id}: ERROR evaluating the global model of round {round_num}: {e}")
+            self._round_evaluation.pop(job_id, None)
+            return
+        PHASE_SECONDS.observe(stats['seconds'], phase='evaluate')
+        self._round_evaluation[job_id] = (round_num, {name: stats[name] for name in EVALUATION_FIELDS})
+        logger.debug("Node %s: Global model of round %s scored on %d held-out samples (MSE %.6g) in %.3fs.",
+                     self.node_id, round_num, stats['samples'],
+                     stats['sse'] / stats['samples'] if stats['samples'] else float('nan'), stats['seconds'])
+
+    def _configure_evaluation(self, evaluation_mode):
+        """Holds out rows for federated evaluation if the Coordinator asks for it ('federated' or 'both')."""
+        if evaluation_mode in ('federated', 'both'):
+            if self.local_evaluator is not None:
+                return
+            split = holdout_split(len(self.y), self.eval_holdout_fraction)
+            if split == len(self.y):
+                logger.warning(f"Node {self.node_id}: Too few rows to hold out for federated evaluation.")
+                return
+            # Contiguous slices: views of the (memory-mapped) matrix, nothing is copied
+            self.X_train, self.y_train = self.X[:split], self.y[:split]
+            self.local_evaluator = LocalEvaluator(self.X[split:], self.y[split:])
+            if self._eval_pool is None:
+                self._eval_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="node-eval")
+            logger.info(f"Node {self.node_id}: Federated evaluation on {len(self.y) - split} held-out samples, "
+                        f"training on {split}.")
+        elif self.local_evaluator is not None:
+            self.X_train, self.y_train = self.X, self.y
+            self.local_evaluator = None
+            logger.info(f"Node {self.node_id}: Federated evaluation disabled by the Coordinator.")
+        self.num_samples = len(self.y_train)
+
+    def _submit_local_update(self, model_params=None, round_num=None, job_id=DEFAULT_JOB):
         """Submits the locally trained model parameters to the Coordinator."""
+        try:
+            with PHASE_SECONDS.time(phase='submit'), self.profiler.phase('submit'):
+                self._submit_with_retries(model_params, round_num, job_id)
+        finally:
+            if job_id == DEFAULT_JOB:
+                self.profiler.end_round(self.current_round if round_num is None else round_num)
+
+    def _submit_with_retries(self, model_params=None, round_num=None, job_id=DEFAULT_JOB):
+        model_params = self.model_params if model_params is None else model_params
+        round_num = self.current_round if round_num is None else round_num
+        metadata = {
+            "node_id": self.node_id,
+            "round_num": round_num,
+            "num_samples": self.num_samples  # Used for sample-weighted aggregation
+        }
+        if job_id != DEFAULT_JOB:
+            metadata["job_id"] = job_id
+        evaluation = self._round_evaluation.get(job_id)
+        if evaluation is not None and evaluation[0] == round_num:
+            metadata["evaluation"] = evaluation[1]  # Held-out loss sums of this round's global model
+        binary = self.wire_format == 'binary' and 'binary' in self.coordinator_wire_formats
+        # Compressed once: every attempt resends the same delta, and its error-feedback residual
+        # is only kept once a receiver accepted it
+        delta_encoder = self._delta_encoder(metadata, model_params, job_id) if binary else None
         retries = 3
+        deferrals = 0  # 503 + Retry-After answers from a Coordinator shedding a burst (do not use up retries)
         while retries > 0:
+            # Relays only aggregate the default job; the updates of other jobs go to the Coordinator
+            endpoint = self.submit_endpoint if job_id == DEFAULT_JOB else self.coordinator_endpoint
             try:
-                print(f"Node {self.node_id}: Sending local model update for round {self.current_round} to Coordinator...")
-                response = requests.post(
-                    f"{self.coordinator_endpoint}/receive_model_update",  # NEW TARGET: Coordinator's endpoint
-                    json={
-                        "node_id": self.node_id,
-                        "local_model_params": self.model_params,  # Send your locally trained model
-                        "round_num": self.current_round
-                    }
-                )
-                response.raise_for_status()  # Raise an exception for HTTP errors (4xx or 5xx)
-                print(f"Node {self.node_id}: Update acknowledged by Coordinator: {response.json()}")
+                logger.debug("Node %s: Sending local model update for round %s of job %s to %s...",
+                             self.node_id, round_num, job_id, endpoint)
+                if binary:
+                    response = self._post_binary_update(metadata, model_params, endpoint, delta_encoder)
+                else:
+                    body = json.dumps(dict(metadata, local_model=model_params)).encode('utf-8')  # Send your locally trained model
+                    PAYLOAD_BYTES_TOTAL.inc(len(body), direction='sent')
+                    response = self.http.post(
+                        f"{endpoint}/submit_model_update",
+                        data=body, headers={'Content-Type': 'application/json'}
+                    )
+                if response.status_code == 503 and 'Retry-After' in response.headers and deferrals < 20:
+                    deferrals += 1
+                    SUBMISSIONS_TOTAL.inc(result='deferred')
+                    # Jitter spreads the retries of the nodes that were turned away together
+                    delay = float(response.headers['Retry-After']) * random.uniform(1.0, 1.5)
+                    logger.debug("Node %s: Coordinator busy, retrying the update in %.2fs.", self.node_id, delay)
+                    time.sleep(delay)
+                    continue
+                if 400 <= response.status_code < 500:
+                    # Rejected (e.g. out of round after the quorum closed it): resending cannot succeed,
+                    # and the next round's model may already be waiting
+                    SUBMISSIONS_TOTAL.inc(result='rejected')
+                    logger.warning(f"Node {self.node_id}: Update for round {round_num} rejected by {endpoint}: "
+                                   f"{response.status_code} {response.text[:200]}")
+                    return
+                if not response.ok:
+                    SUBMISSIONS_TOTAL.inc(result='error')
+                response.raise_for_status()  # 5xx: retried below
+                SUBMISSIONS_TOTAL.inc(result='accepted')
+                if delta_encoder is not None:
+                    delta_encoder[2]()  # Keep the compression error for the next round's delta
+                logger.info(f"Node {self.node_id}: Update for round {round_num}"
+                            + (f" of job '{job_id}'" if job_id != DEFAULT_JOB else "") + " acknowledged by Coordinator.")
                 return
             except requests.exceptions.RequestException as e:
-                print(f"Node {self.node_id}: ERROR submitting update to Coordinator: {e}")
+                if not isinstance(e, requests.exceptions.HTTPError):
+                    SUBMISSIONS_TOTAL.inc(result='error')  # 5xx responses were counted above
+                logger.warning(f"Node {self.node_id}: ERROR submitting update to {endpoint}: {e}")
+                if not isinstance(e, requests.exceptions.HTTPError) and endpoint != self.coordinator_endpoint:
+                    # Relay unreachable: submit straight to the Coordinator, which aggregates direct updates too
+                    logger.warning(f"Node {self.node_id}: Falling back to the Coordinator for submissions.")
+                    self._set_submit_endpoint(self.coordinator_endpoint)
+                    continue
                 retries -= 1
                 if retries == 0:
-                    print(f"Node {self.node_id}: Failed to submit model update after 3 retries.")
+                    logger.error(f"Node {self.node_id}: Failed to submit model update after 3 retries.")
                     return
                 time.sleep(5)  # Wait before retrying
 
+    def _post_binary_update(self, metadata, model_params, endpoint, delta_encoder=None):
+        """
+        Posts the local model, or the delta of `delta_encoder` (see _delta_encoder), as a binary message.
+        Feature names are only included until the receiver has accepted them once; a 409 (unknown
+        schema) triggers a resend that includes them.
+        """
+        url = f"{endpoint}/submit_model_update"
+        headers = {'Content-Type': MODEL_CONTENT_TYPE}
+        if delta_encoder is None:
+            feature_names = list(model_params['coef'].keys())
+            def encode(include_schema):
+                return self.model_codec.encode_model(model_params, metadata, include_schema=include_schema)
+        else:
+            feature_names, encode, _ = delta_encoder
+        acknowledged = (endpoint, schema_hash(feature_names))
+        known = acknowledged in self._acknowledged_schemas
+        body = encode(not known)
+        PAYLOAD_BYTES_TOTAL.inc(len(body), direction='sent')
+        response = self.http.post(url, data=body, headers=headers)
+        if response.status_code == 409 and known:
+            self._acknowledged_schemas.discard(acknowledged)
+            body = encode(True)
+            PAYLOAD_BYTES_TOTAL.inc(len(body), direction='sent')
+            response = self.http.post(url, data=body, headers=headers)
+        if response.ok:
+            self._acknowledged_schemas.add(acknowledged)
+        return response
+
+    def _delta_encoder(self, metadata, model_params, job_id=DEFAULT_JOB):
+        """
+        In delta mode, compresses this round's update and returns (feature names, encode(include_schema),
+        commit()); call commit() once the update was accepted to keep its error-feedback residual.
+        Returns None (send the full model) when not in delta mode or the training base is not this round's.
+        """
+        round_base = self._round_base.get(job_id)
+        if self.update_mode != 'delta' or round_base is None or round_base[0] != metadata['round_num']:
+            return None
+        _, features, base_coef, base_intercept = round_base
+        coef = model_params['coef']
+        trained = np.fromiter((coef[f] for f in features), dtype=np.float64, count=len(features))
+        compressor = self._job_compressors.get(job_id)
+        if compressor is None:
+            compressor = self._job_compressors[job_id] = DeltaCompressor(**self._delta_settings)
+        compressed = compressor.compress(trained - base_coef)
+        intercept_delta = model_params['intercept'] - base_intercept
+
+        def encode(include_schema):
+            return self.model_codec.encode_delta(features, compressed.quantized, compressed.scale,
+                                                 intercept_delta, indices=compressed.indices,
+                                                 metadata=metadata, include_schema=include_schema)
+
+        def commit():
+            compressor.commit(compressed)
+        return features, encode, commit
+
+    def accept_model_update(self, mimetype, body):
+        """
+        Installs a global model received from the Coordinator (binary model message or JSON body)
+        and wakes up the training lifecycle. Returns (response dict, HTTP status code).
+        """
+        PAYLOAD_BYTES_TOTAL.inc(len(body), direction='received')
+        if mimetype == MODEL_CONTENT_TYPE:
+            try:
+                payload = self.model_codec.decode(body)
+            except UnknownSchemaError as e:
+                # Asks the Coordinator to resend the model including its feature names
+                MODELS_RECEIVED_TOTAL.inc(result='unknown_schema')
+                return {"status": "error", "message": str(e)}, 409
+            except ValueError as e:
+                MODELS_RECEIVED_TOTAL.inc(result='rejected')
+                return {"status": "error", "message": f"Invalid model message: {e}"}, 400
+            global_model = payload.to_model()
+            data = payload.metadata
+        else:
+            try:
+                data = json.loads(body)
+            except ValueError:
+                data = None
+            if not isinstance(data, dict):
+                MODELS_RECEIVED_TOTAL.inc(result='rejected')
+                return {"status": "error", "message": "Expected a JSON object"}, 400
+            global_model = data.get('global_model')
+        round_num = data.get('round_num')
+
+        if round_num is None:
+            MODELS_RECEIVED_TOTAL.inc(result='rejected')
+            return {"status": "error", "message": "Missing 'round_num'"}, 400
+
+        if global_model is None:
+            logger.info(f"Node {self.node_id}: No global model received, initializing new model.")
+            global_model = self._initialize_model()
+        elif not isinstance(global_model, dict) or 'coef' not in global_model or 'intercept' not in global_model:
+            MODELS_RECEIVED_TOTAL.inc(result='rejected')
+            return {"status": "error", "message": "Invalid 'global_model' format"}, 400
+
+        job_id = data.get('job_id') or DEFAULT_JOB
+        if not isinstance(job_id, str):
+            MODELS_RECEIVED_TOTAL.inc(result='rejected')
+            return {"status": "error", "message": "Invalid 'job_id'"}, 400
+        training_plan = self._valid_training_plan(data.get('training_plan'))
+        with self._model_lock:
+            if job_id == DEFAULT_JOB:
+                self.model_params = global_model
+                self.current_round = round_num
+            if training_plan:
+                self._training_plan[job_id] = (round_num, training_plan)
+            else:
+                self._training_plan.pop(job_id, None)
+            if data.get('feature_subset') is True:
+                self._feature_subset_jobs.add(job_id)
+            else:
+                self._feature_subset_jobs.discard(job_id)
+            if self.federation_mode != 'async':  # Async nodes train on pulled models in their own loop
+                self._pending_jobs[job_id] = (global_model, round_num)  # A job keeps its turn if already waiting
+        MODELS_RECEIVED_TOTAL.inc(result='accepted')
+
+        self._new_model_event.set()
+        return {"status": "success"}, 200
+
+    def _next_scheduled_job(self):
+        """Takes the job whose untrained global model has waited longest: (job_id, model_params, round_num)."""
+        with self._model_lock:
+            if not self._pending_jobs:
+                return None
+            job_id, (model_params, round_num) = self._pending_jobs.popitem(last=False)
+        return job_id, model_params, round_num
+
+    def run_scheduled_rounds(self):
+        """
+        Trains and submits one round for each job with a pending global model, in turn, until none is
+        left. Rounds of one node run one at a time; a call made while another thread is running them
+        returns at once, as that thread picks up the new model.
+        """
+        while self._pending_jobs:
+            if not self._scheduler_lock.acquire(blocking=False):
+                return  # Re-checked by the running thread after it releases the lock
+            try:
+                while True:
+                    job = self._next_scheduled_job()
+                    if job is None:
+                        break
+                    job_id, model_params, round_num = job
+                    if not self._job_features(job_id, model_params)[0]:
+                        logger.warning(f"Node {self.node_id}: Job '{job_id}' uses none of the local features. "
+                                       f"Skipping its round {round_num}.")
+                        continue
+                    logger.info(f"Node {self.node_id}: Proceeding with training for round {round_num}"
+                                + (f" of job '{job_id}'." if job_id != DEFAULT_JOB else "."))
+                    self._train_local_model(model_params, round_num, job_id)
+                    self._submit_local_update(model_params, round_num, job_id)
+            finally:
+                self._scheduler_lock.release()
+
+    def _valid_training_plan(self, training_plan):
+        """The learning rate / local epochs sent with a global model, without invalid entries (None if none)."""
+        if not isinstance(training_plan, dict):
+            return None
+        plan = {}
+        learning_rate = training_plan.get('learning_rate')
+        if isinstance(learning_rate, (int, float)) and 0 < learning_rate < float('inf'):
+            plan['learning_rate'] = float(learning_rate)
+        local_epochs = training_plan.get('local_epochs')
+        if isinstance(local_epochs, int) and local_epochs >= 1:
+            plan['local_epochs'] = local_epochs
+        if len(plan) != len(training_plan):
+            logger.warning(f"Node {self.node_id}: Ignoring invalid training plan entries: {training_plan}")
+        return plan or None
+
+    def pull_global_model(self, min_version=0):
+        """
+        Async mode: fetches the latest global model, waiting up to `pull_wait` seconds for version
+        `min_version`, and installs it via accept_model_update(). Returns True if a model was installed.
+        """
+        params = {"node_id": self.node_id, "min_version": min_version, "wait": self.pull_wait}
+        try:
+            for full in ('0', '1'):
+                response = self.http.get(f"{self.coordinator_endpoint}/global_model", params=dict(params, full=full),
+                                         timeout=self.pull_wait + 10)
+                response.raise_for_status()
+                content_type = response.headers.get('Content-Type', '').split(';')[0]
+                _, status_code = self.accept_model_update(content_type, response.content)
+                if status_code != 409:  # 409: sent without feature names we know; ask again with them
+                    return status_code == 200
+                params["wait"] = 0
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Node {self.node_id}: ERROR pulling global model from Coordinator: {e}")
+        return False
+
+    def _heartbeat_loop(self, interval):
+        """Renews this node's liveness lease with the Coordinator every `interval` seconds."""
+        while True:
+            time.sleep(interval)
+            try:
+                response = self.http.post(f"{self.coordinator_endpoint}/heartbeat",
+                                          json={"node_id": self.node_id}, timeout=5)
+                if response.status_code == 404:
+                    logger.warning(f"Node {self.node_id}: Coordinator does not know this node anymore. Re-registering...")
+                    self._register_with_coordinator()
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"Node {self.node_id}: ERROR sending heartbeat to Coordinator: {e}")
+
+    def start_heartbeats(self):
+        """Starts the background heartbeat thread (interval from HEARTBEAT_INTERVAL, default 10s)."""
+        interval = float(os.environ.get('HEARTBEAT_INTERVAL', 10))
+        heartbeat_thread = threading.Thread(target=self._heartbeat_loop, args=(interval,), daemon=True)
+        heartbeat_thread.start()
+
+    def _set_submit_endpoint(self, endpoint):
+        """Switches the submission target; a different receiver has not seen our feature names yet."""
+        if endpoint != self.submit_endpoint:
+            self.submit_endpoint = endpoint
+
     def _register_with_coordinator(self):
         """Registers this node with the central Coordinator."""
         try:
-            print(f"Node {self.node_id}: Registering with Coordinator at {self.coordinator_endpoint}...")
-            response = requests.post(
-                f"{self.coordinator_endpoint}/register_node",
-                json={"node_id": self.node_id, "endpoint_url": f"http://{os.environ.get('HOSTNAME', 'localhost')}:{os.environ.get('NODE_PORT', '5000')}"}
+            logger.info(f"Node {self.node_id}: Registering with Coordinator at {self.coordinator_endpoint}...")
+            response = self.http.post(
+                f"{self.coordinator_endpoint}/register",
+                json={"node_id": self.node_id,
+                      "endpoint_url": self.endpoint_url,
+                      "wire_formats": SUPPORTED_WIRE_FORMATS}
             )
             response.raise_for_status()
-            print(f"Node {self.node_id}: Registration successful: {response.json()}")
+            registration = response.json()
+            self.coordinator_wire_formats = registration.get('wire_formats', ['json'])
+            self._acknowledged_schemas.clear()  # The Coordinator may have restarted and forgotten our schemas
+            self._set_submit_endpoint(registration.get('submit_endpoint') or self.coordinator_endpoint)
+            self.federation_mode = registration.get('federation_mode', 'sync')
+            self._configure_evaluation(registration.get('evaluation_mode', 'central'))
+            logger.info(f"Node {self.node_id}: Registration successful: {registration}")
             return True
         except requests.exceptions.RequestException as e:
-            print(f"Node {self.node_id}: ERROR registering with Coordinator: {e}")
+            logger.error(f"Node {self.node_id}: ERROR registering with Coordinator: {e}")
             # Exit or retry if registration fails (critical for node operation)
             time.sleep(5)
-            self._register_with_coordinator()  # Simple retry
+            return self._register_with_coordinator()  # Simple retry
 
 
     # --- Flask API Endpoints ---
@@ -155,64 +613,89 @@ def model_update_endpoint():
     if not node:
         return jsonify({"status": "error", "message": "Node not initialized"}), 500
 
-    data = request.get_json()
-    global_model = data.get('global_model')
-    round_num = data.get('round_num')
-
-    if round_num is None:
-        return jsonify({"status": "error", "message": "Missing 'round_num'"}), 400
-
-    if global_model is None:
-        print(f"Node {node.node_id}: No global model received, initializing new model.")
-        global_model = node._initialize_model()
-    elif not isinstance(global_model, dict) or 'coef' not in global_model or 'intercept' not in global_model:
-        return jsonify({"status": "error", "message": "Invalid 'global_model' format"}), 400
+    response, status_code = node.accept_model_update(request.mimetype, request.get_data())
+    return jsonify(response), status_code
 
-    with node._model_lock:
-        node.model_params = global_model
-        node.current_round = round_num
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint: load/train/submit phase histograms, counters and payload bytes."""
+    return Response(METRICS.render(), content_type=METRICS_CONTENT_TYPE)
 
-    node._new_model_event.set()
-    return jsonify({"status": "success"}), 200
+@app.route('/admin/profile', methods=['GET', 'POST'])
+def admin_profile():
+    """
+    GET: profiler status. POST {"rounds": N}: captures call stacks and allocations of this node's next
+    N rounds into PROFILE_DIR (0 cancels pending captures).
+    """
+    node = SwarmNode.instance
+    if not node:
+        return jsonify({"status": "error", "message": "Node not initialized"}), 500
+    if request.method == 'GET':
+        return jsonify(node.profiler.status()), 200
+    rounds = (request.get_json(silent=True) or {}).get('rounds', 1)
+    if not isinstance(rounds, int) or rounds < 0:
+        return jsonify({"status": "error", "message": "'rounds' must be a non-negative integer"}), 400
+    return jsonify(node.profiler.arm(rounds)), 200
 
 def run_node_lifecycle(node_instance):
     """
     Manages the lifecycle of the Swarm Node:
     1. Registers with the Coordinator.
     2. Enters a loop:
-       a. Waits for a new global model from the Coordinator.
-       b. Performs local training.
+       a. Waits for a new global model from the Coordinator (of any training job).
+       b. Performs local training, one job's round at a time.
        c. Submits local updates.
     """
     if not node_instance._register_with_coordinator():
-        print(f"Node {node_instance.node_id}: Registration failed. Cannot start training lifecycle.")
+        logger.error(f"Node {node_instance.node_id}: Registration failed. Cannot start training lifecycle.")
+        return
+    node_instance.start_heartbeats()
+
+    if node_instance.federation_mode == 'async':
+        run_async_node_loop(node_instance)
         return
 
     while True:
-        print(f"Node {node_instance.node_id}: Waiting for Coordinator to send global model for next round...")
-        node_instance._new_model_event.clear()  # Clear the event before waiting for the next round
-        
+        logger.debug(f"Node {node_instance.node_id}: Waiting for Coordinator to send global model for next round...")
+        # The event is only cleared after it fired, so a model that arrived while we were still
+        # submitting the previous update is picked up immediately instead of being missed.
         if not node_instance._new_model_event.wait(timeout=120):  # Wait up to 120 seconds
-            print(f"Node {node_instance.node_id}: Timeout waiting for global model. Re-registering...")
+            logger.warning(f"Node {node_instance.node_id}: Timeout waiting for global model. Re-registering...")
             if not node_instance._register_with_coordinator():
-                print(f"Node {node_instance.node_id}: Failed to re-register. Exiting.")
+                logger.error(f"Node {node_instance.node_id}: Failed to re-register. Exiting.")
                 break
             continue  # Continue to wait for model in the next iteration
+        node_instance._new_model_event.clear()
 
-        with node_instance._model_lock:
-            if node_instance.model_params is None:
-                print(f"Node {node_instance.node_id}: No global model received — initializing local model.")
-                node_instance.model_params = node_instance._initialize_model()
-            else:
-                print(f"Node {node_instance.node_id}: Received global model — proceeding with training.")
+        # Trains the received model of every job in turn; /model_update may queue newer ones meanwhile
+        logger.debug(f"Node {node_instance.node_id}: Received global model — proceeding with training.")
+        node_instance.run_scheduled_rounds()
 
-        print(f"Node {node_instance.node_id}: Proceeding with training for round {node_instance.current_round}.")
-        
-        node_instance._train_local_model()
-        node_instance._submit_local_update()
-        time.sleep(5)
+def run_async_node_loop(node_instance, stop_event=None):
+    """
+    Async (FedBuff-style) lifecycle: pull the latest global model version, train on it, submit the
+    update tagged with that version, repeat. There is no round barrier; a node only waits (long poll)
+    when no version newer than the one it last trained on has been published yet.
+    """
+    last_version = None
+    while stop_event is None or not stop_event.is_set():
+        min_version = 0 if last_version is None else last_version + 1
+        if not node_instance.pull_global_model(min_version):
+            time.sleep(5)
+            continue
+        with node_instance._model_lock:
+            model_params = node_instance.model_params
+            version = node_instance.current_round
+        if version == last_version:
+            continue  # Nothing new within the long-poll wait
+        node_instance._train_local_model(model_params, version)
+        node_instance._submit_local_update(model_params, version)
+        last_version = version
 
 if __name__ == '__main__':
+    # LOG_LEVEL=DEBUG shows per-request events; INFO keeps to per-round lines
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+                        format='%(asctime)s %(levelname)s %(message)s')
     NODE_ID = os.environ.get('NODE_ID', f'swarm-node-{random.randint(1000, 9999)}')
     COORDINATOR_ENDPOINT = os.environ.get('COORDINATOR_ENDPOINT', 'http://localhost:5000')
     NODE_PORT = int(os.environ.get('NODE_PORT', 5001))  # Default to 5001 to avoid conflict with Coordinator